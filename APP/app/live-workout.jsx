@@ -16,6 +16,44 @@ import Svg, { Circle, Line } from "react-native-svg";
 import { ColorTheme } from "../constants/GlobalStyles";
 
 const API_BASE = "http://192.168.X.X:8000";
+const WS_BASE = API_BASE.replace(/^http/, "ws");
+
+// MediaPipe's 33 pose landmarks, in the order /ws/live sends their rows
+const LANDMARK_NAMES = [
+  "nose",
+  "left_eye_inner",
+  "left_eye",
+  "left_eye_outer",
+  "right_eye_inner",
+  "right_eye",
+  "right_eye_outer",
+  "left_ear",
+  "right_ear",
+  "mouth_left",
+  "mouth_right",
+  "left_shoulder",
+  "right_shoulder",
+  "left_elbow",
+  "right_elbow",
+  "left_wrist",
+  "right_wrist",
+  "left_pinky",
+  "right_pinky",
+  "left_index",
+  "right_index",
+  "left_thumb",
+  "right_thumb",
+  "left_hip",
+  "right_hip",
+  "left_knee",
+  "right_knee",
+  "left_ankle",
+  "right_ankle",
+  "left_heel",
+  "right_heel",
+  "left_foot_index",
+  "right_foot_index",
+];
 
 const EXERCISE_JOINTS = {
   squat: [
@@ -138,6 +176,41 @@ function findKp(keypoints, name) {
   });
 }
 
+// /ws/live messages are a uint16 header length (big endian), a JSON header,
+// then the payload: JPEG bytes going up, float32 rows of x, y, z, visibility
+// coming back. Headers are plain ASCII JSON.
+function packFrame(header, jpegBase64) {
+  const json = JSON.stringify(header);
+  const jpeg = atob(jpegBase64);
+  const bytes = new Uint8Array(2 + json.length + jpeg.length);
+  bytes[0] = json.length >> 8;
+  bytes[1] = json.length & 0xff;
+  for (let i = 0; i < json.length; i++) bytes[2 + i] = json.charCodeAt(i);
+  const start = 2 + json.length;
+  for (let i = 0; i < jpeg.length; i++) bytes[start + i] = jpeg.charCodeAt(i);
+  return bytes.buffer;
+}
+
+function unpackReply(buffer) {
+  const view = new DataView(buffer);
+  const size = view.getUint16(0);
+  let json = "";
+  for (let i = 0; i < size; i++) json += String.fromCharCode(view.getUint8(2 + i));
+  const header = JSON.parse(json);
+  const keypoints = [];
+  const rows = Math.min(header.n || 0, LANDMARK_NAMES.length);
+  for (let row = 0; row < rows; row++) {
+    const offset = 2 + size + row * 16;
+    keypoints.push({
+      name: LANDMARK_NAMES[row],
+      x: view.getFloat32(offset, true),
+      y: view.getFloat32(offset + 4, true),
+      score: view.getFloat32(offset + 12, true),
+    });
+  }
+  return { header, pose: { keypoints } };
+}
+
 // Helper to mirror X for front camera (selfie view)
 const mapX = (x, isFront = true) => (isFront ? 1 - x : x);
 
@@ -174,6 +247,13 @@ export default function LiveWorkoutScreen() {
   const [poseKeypoints, setPoseKeypoints] = useState([]);
   const frameTimerRef = useRef(null);
   const isCapturingRef = useRef(false);
+  const socketRef = useRef(null);
+  const seqRef = useRef(0);
+  const updateFromPoseRef = useRef(null);
+  // one server-side tracker per workout, so our frames never mix with other patients'
+  const sessionIdRef = useRef(
+    `${patientId || "patient"}-${Date.now()}-${Math.random().toString(36).slice(2, 8)}`
+  );
 
   useEffect(() => {
     if (Platform.OS === "web") {
@@ -186,6 +266,39 @@ export default function LiveWorkoutScreen() {
     })();
   }, []);
 
+  // frames go up one socket per workout; closing it ends the server-side
+  // session, which saves it to the patient's history
+  useEffect(() => {
+    if (Platform.OS === "web") return;
+    if (!hasPermission || sessionEnded) return;
+
+    const socket = new WebSocket(`${WS_BASE}/ws/live`);
+    socket.binaryType = "arraybuffer";
+    socket.onopen = () => {
+      socket.send(
+        JSON.stringify({
+          session_id: sessionIdRef.current,
+          exercise_key: exerciseKey,
+          patient_id: patientId || undefined,
+        })
+      );
+    };
+    socket.onmessage = (event) => {
+      if (typeof event.data === "string") return;
+      const { header, pose } = unpackReply(event.data);
+      if (header.error) return;
+      setPoseKeypoints(pose.keypoints);
+      updateFromPoseRef.current(pose);
+    };
+    socket.onerror = (e) => console.log("live socket error:", e.message);
+    socketRef.current = socket;
+
+    return () => {
+      socketRef.current = null;
+      socket.close();
+    };
+  }, [hasPermission, sessionEnded]);
+
   useEffect(() => {
     if (!running || sessionEnded) return;
     const id = setInterval(() => setElapsed((t) => t + 1), 1000);
@@ -218,6 +331,8 @@ export default function LiveWorkoutScreen() {
   const captureAndAnalyzeFrame = async () => {
     if (!cameraRef.current) return;
     if (isCapturingRef.current) return;
+    const socket = socketRef.current;
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
     isCapturingRef.current = true;
 
     try {
@@ -226,30 +341,12 @@ export default function LiveWorkoutScreen() {
         quality: 0.3,
         skipProcessing: true,
       });
+      if (!photo || !photo.base64) return;
 
-      if (!photo || !photo.base64) {
-        isCapturingRef.current = false;
-        return;
-      }
-
-      const res = await fetch(`${API_BASE}/analyze_frame`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          image_base64: photo.base64,
-          exercise_key: exerciseKey,
-        }),
-      });
-
-      if (!res.ok) {
-        isCapturingRef.current = false;
-        return;
-      }
-
-      const data = await res.json();
-      const pose = data.pose || { keypoints: [] };
-      setPoseKeypoints(pose.keypoints || []);
-      updateFromPose(pose);
+      // the server only analyses the newest frame it holds, so frames are
+      // sent without waiting for the previous reply
+      seqRef.current += 1;
+      socket.send(packFrame({ seq: seqRef.current, ts: Date.now() }, photo.base64));
     } catch (e) {
       console.log("capture/analyze error:", e);
     } finally {
@@ -407,6 +504,8 @@ export default function LiveWorkoutScreen() {
     });
   };
 
+  updateFromPoseRef.current = updateFromPose;
+
   const handleEndSession = () => {
     setRunning(false);
     setSessionEnded(true);
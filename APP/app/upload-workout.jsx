@@ -93,8 +93,10 @@ export default function UploadWorkoutScreen() {
 
       const data = await res.json();
       setAnalysisData(data);
-      if (data.processed_video_url) {
-        setProcessedVideoUri(`${API_BASE}${data.processed_video_url}`);
+      // the reduced rendition starts much sooner on a phone connection
+      const replayUrl = data.processed_video_low_url || data.processed_video_url;
+      if (replayUrl) {
+        setProcessedVideoUri(`${API_BASE}${replayUrl}`);
       }
       Alert.alert(
         "Analysis Complete",
@@ -133,6 +135,7 @@ export default function UploadWorkoutScreen() {
         duration,
         avg_time: avgTime,
         form_score: formScore,
+        history_id: analysisData.history_id,
       };
 
       const res = await fetch(`${API_BASE}/generate_report`, {
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+# the backend modules are imported flat, as uvicorn does from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def record(args):
+    # analyse a clip once and keep its landmark track as a fixture for the
+    # stage benchmarks; defaults to a synthetic clip of the base image
+    import pose_analysis
+    from bench.synthetic import FIXTURE_DIR, parse_size, write_video
+
+    out = args.out or os.path.join(FIXTURE_DIR, f"{args.exercise}.track")
+    with tempfile.TemporaryDirectory() as tmp:
+        video = args.video
+        if video is None:
+            width, height = parse_size(args.size)
+            video = write_video(os.path.join(tmp, "clip.mp4"), width, height, 30, args.seconds)
+        result = pose_analysis.analyze_video_file(video, out, args.exercise)
+    print(f"wrote {out}: {result['frames_analysed']} frames, {result['reps']} reps")
+    return {"track": out, "frames": result["frames_analysed"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--json", help="also write the results to this file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stages = commands.add_parser("stages", help="per-stage timings, no server")
+    stages.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720", "1920x1080"])
+    stages.add_argument("--frames", type=int, default=60, help="distinct frames per resolution")
+    stages.add_argument("--repeat", type=int, default=2)
+    stages.add_argument("--exercise", default="squat")
+
+    load = commands.add_parser("load", help="live clients and uploads against the app in-process")
+    load.add_argument("--clients", type=int, default=4, help="live frame clients")
+    load.add_argument("--fps", type=float, default=10.0, help="frames per second per client")
+    load.add_argument("--frame-size", default="640x480")
+    load.add_argument("--quality", type=int, default=80, help="client JPEG quality")
+    load.add_argument("--duration", type=float, default=20.0, help="seconds of live traffic")
+    load.add_argument("--videos", type=int, default=1, help="video uploads")
+    load.add_argument("--video-size", default="1280x720")
+    load.add_argument("--video-fps", type=float, default=30.0)
+    load.add_argument("--video-seconds", type=float, default=5.0)
+    load.add_argument("--video-interval", type=float, default=0.0, help="seconds between uploads")
+    load.add_argument("--report-clients", type=int, default=0)
+    load.add_argument("--reports", type=int, default=5, help="reports per report client")
+    load.add_argument("--exercise", default="squat")
+    load.add_argument("--timeout", type=float, default=120.0)
+
+    rec = commands.add_parser("record", help="record a landmark fixture from a clip")
+    rec.add_argument("video", nargs="?", help="clip to analyse (default: synthetic)")
+    rec.add_argument("--exercise", default="squat")
+    rec.add_argument("--size", default="960x540")
+    rec.add_argument("--seconds", type=float, default=2.0)
+    rec.add_argument("--out")
+
+    args = parser.parse_args()
+    if args.command == "stages":
+        from bench import stages as command
+    elif args.command == "load":
+        from bench import load as command
+    else:
+        command = None
+    results = record(args) if command is None else command.run(args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"command": args.command, "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
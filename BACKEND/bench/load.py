@@ -0,0 +1,213 @@
+import asyncio
+import base64
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from bench.stats import Usage, print_table, summarize
+from bench.synthetic import jpeg_frames, parse_size, write_video
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.frames = 0
+        self.ready_s = 0.0
+
+    def add(self, name: str, seconds: float, status: int):
+        self.statuses[name][status] += 1
+        if status < 400:
+            self.samples[name].append(seconds)
+
+
+async def live_client(client, index, frames, fps, deadline, exercise_key, recorder):
+    # one phone streaming frames at `fps`; when a response is late the next
+    # frame goes out straight away instead of bursting to catch up
+    loop = asyncio.get_running_loop()
+    session_id = f"bench-{index}"
+    period = 1.0 / fps
+    next_send = loop.time()
+    i = 0
+    while loop.time() < deadline:
+        body = {
+            "image_base64": frames[i % len(frames)],
+            "exercise_key": exercise_key,
+            "session_id": session_id,
+            "patient_id": f"BENCH-{index:03d}",
+        }
+        start = time.perf_counter()
+        r = await client.post("/analyze_frame", json=body)
+        recorder.add("analyze_frame", time.perf_counter() - start, r.status_code)
+        if r.status_code == 200:
+            recorder.frames += 1
+        i += 1
+        next_send = max(next_send + period, loop.time())
+        await asyncio.sleep(next_send - loop.time())
+
+    start = time.perf_counter()
+    r = await client.delete(f"/sessions/{session_id}")
+    recorder.add("end_session", time.perf_counter() - start, r.status_code)
+
+
+async def wait_ready(client, timeout: float) -> float:
+    # seconds until /readyz reports every worker warm
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    while (await client.get("/readyz")).status_code != 200:
+        if loop.time() - started > timeout:
+            raise RuntimeError("app did not become ready")
+        await asyncio.sleep(0.05)
+    return loop.time() - started
+
+
+async def warm_up(client, index, frames, exercise_key):
+    # one untimed frame per session first, so opening each session's
+    # tracker is not counted as request latency
+    body = {
+        "image_base64": frames[0],
+        "exercise_key": exercise_key,
+        "session_id": f"bench-{index}",
+        "patient_id": f"BENCH-{index:03d}",
+    }
+    await client.post("/analyze_frame", json=body)
+
+
+async def video_client(client, path, delay, exercise_key, recorder):
+    # upload, then poll the job until it finishes; the latency recorded is
+    # upload to result
+    await asyncio.sleep(delay)
+    with open(path, "rb") as f:
+        data = f.read()
+    start = time.perf_counter()
+    r = await client.post(
+        "/jobs/analyze_video",
+        data={"exercise_key": exercise_key, "patient_id": "BENCH-VIDEO"},
+        files={"file": (os.path.basename(path), data, "video/mp4")},
+    )
+    recorder.add("video_upload", time.perf_counter() - start, r.status_code)
+    if r.status_code != 202:
+        return
+
+    job_id = r.json()["job_id"]
+    while True:
+        await asyncio.sleep(0.25)
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("done", "failed"):
+            break
+    status = 200 if job["status"] == "done" else 500
+    recorder.add("video_job", time.perf_counter() - start, status)
+
+
+async def report_client(client, index, count, recorder):
+    for i in range(count):
+        body = {
+            "patient_name": "Bench Patient",
+            "patient_id": f"BENCH-{index:03d}",
+            "exercise": "Squat",
+            "reps": i,
+            "assigned_reps": 15,
+            "duration": 30.0 + i,
+            "avg_time": 3.0,
+            "form_score": 0.8,
+        }
+        start = time.perf_counter()
+        r = await client.post("/generate_report", json=body)
+        recorder.add("generate_report", time.perf_counter() - start, r.status_code)
+
+
+async def drive(args, videos, frames):
+    # imported here so the scratch directories set up in run() are picked up
+    # by config before the app module reads it
+    import httpx
+
+    import exercise_tracker
+
+    app = exercise_tracker.app
+    recorder = Recorder()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=args.timeout
+        ) as client:
+            recorder.ready_s = await wait_ready(client, args.timeout)
+            start = time.perf_counter()
+            r = await client.post(
+                "/analyze_frame", json={"image_base64": frames[0], "exercise_key": args.exercise}
+            )
+            recorder.add("first_frame", time.perf_counter() - start, r.status_code)
+            await asyncio.gather(
+                *(warm_up(client, i, frames, args.exercise) for i in range(args.clients))
+            )
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            deadline = loop.time() + args.duration
+            tasks = [
+                live_client(client, i, frames, args.fps, deadline, args.exercise, recorder)
+                for i in range(args.clients)
+            ]
+            tasks += [
+                video_client(client, path, i * args.video_interval, args.exercise, recorder)
+                for i, path in enumerate(videos)
+            ]
+            tasks += [report_client(client, i, args.reports, recorder) for i in range(args.report_clients)]
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="therapease-bench-") as tmp:
+        # keep the run's uploads, reports and databases out of the real ones
+        os.environ.setdefault("VIDEO_DIR", os.path.join(tmp, "videos"))
+        os.environ.setdefault("REPORT_DIR", os.path.join(tmp, "reports"))
+        os.environ.setdefault("JOBS_DB", os.path.join(tmp, "jobs.db"))
+        os.environ.setdefault("HISTORY_DB", os.path.join(tmp, "history.db"))
+
+        width, height = parse_size(args.frame_size)
+        frames = [
+            base64.b64encode(data).decode("ascii")
+            for data in jpeg_frames(width, height, max(1, int(args.fps * 4)), args.quality)
+        ]
+        video_width, video_height = parse_size(args.video_size)
+        videos = [
+            # a different phase per clip, so uploads do not hit the result cache
+            write_video(
+                os.path.join(tmp, f"clip_{i}.mp4"),
+                video_width,
+                video_height,
+                args.video_fps,
+                args.video_seconds,
+                phase=i / max(args.videos, 1),
+            )
+            for i in range(args.videos)
+        ]
+
+        usage = Usage().start()
+        recorder, elapsed = asyncio.run(drive(args, videos, frames))
+        resources = usage.stop()
+
+    rows = {name: summarize(samples, elapsed) for name, samples in recorder.samples.items()}
+    print_table(
+        f"load: {args.clients} live clients @ {args.fps} fps ({args.frame_size}), "
+        f"{args.videos} videos ({args.video_size} @ {args.video_fps} fps, {args.video_seconds}s), "
+        f"{args.report_clients * args.reports} reports over {elapsed:.1f}s (latency ms)",
+        rows,
+    )
+    for name, statuses in recorder.statuses.items():
+        print(f"{name:28} status {dict(sorted(statuses.items()))}")
+    print(f"\nready after {recorder.ready_s:.2f}s")
+    print(f"frames/sec {recorder.frames / elapsed:.1f}  (target {args.clients * args.fps:.1f})")
+    print(
+        f"cpu {resources['cpu_main_s']:.1f}s main + {resources['cpu_workers_s']:.1f}s workers "
+        f"({resources['cpu_util']:.2f} cores), peak rss {resources['peak_rss_main_mb']:.0f} MB main, "
+        f"{resources['peak_rss_worker_mb']:.0f} MB largest worker"
+    )
+    return {
+        "latency": rows,
+        "statuses": {name: dict(counts) for name, counts in recorder.statuses.items()},
+        "frames_per_sec": recorder.frames / elapsed,
+        "ready_s": recorder.ready_s,
+        "resources": resources,
+    }
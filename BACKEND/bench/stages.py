@@ -0,0 +1,150 @@
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+import pose_analysis
+import reports
+from frame_codec import landmarks_bytes
+from landmarks import LANDMARK_NAMES
+from preprocess import FramePreprocessor
+from smoothing import LandmarkFilter
+
+from bench.stats import print_table, summarize, timed
+from bench.synthetic import (
+    jpeg_frames,
+    load_fixture,
+    parse_size,
+    synthetic_frames,
+    synthetic_track,
+)
+
+REPORT_DATA = {
+    "patient_name": "Bench Patient",
+    "patient_id": "BENCH-001",
+    "exercise": "Squat",
+    "reps": 12,
+    "assigned_reps": 15,
+    "sets": 2,
+    "duration": 48.5,
+    "avg_time": 3.4,
+    "form_score": 0.82,
+}
+
+
+def _decode_full(data):
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def _keypoints_json(landmarks):
+    keypoints = [
+        {"name": name, "x": x, "y": y, "score": visibility}
+        for name, (x, y, _, visibility) in zip(LANDMARK_NAMES, landmarks.tolist())
+    ]
+    return json.dumps({"pose": {"keypoints": keypoints}})
+
+
+def frame_stages(size, frames: int, repeat: int):
+    # per-frame cost of each step of the live path at one input resolution
+    width, height = size
+    jpegs = jpeg_frames(width, height, frames)
+    results = {}
+    results["decode_full"] = summarize(timed(_decode_full, jpegs, repeat))
+    results["preprocess"] = summarize(timed(FramePreprocessor(track=False).prepare, jpegs, repeat))
+
+    # steady-state ROI crop: prime the window from a detection first
+    pose = pose_analysis.create_pose()
+    tracked = FramePreprocessor()
+    for data in jpegs[:5]:
+        pose_analysis.detect_landmarks(pose, data, tracked)
+    results["preprocess_roi"] = summarize(timed(tracked.prepare, jpegs, repeat))
+
+    prepared = [FramePreprocessor(track=False).prepare(data).copy() for data in jpegs]
+    results["inference"] = summarize(timed(pose.process, prepared, repeat))
+
+    detected = []
+
+    def detect(data):
+        landmarks = pose_analysis.detect_landmarks(pose, data, tracked)
+        if landmarks is not None:
+            detected.append(landmarks)
+
+    results["detect_end_to_end"] = summarize(timed(detect, jpegs, repeat))
+    pose.close()
+    if detected:
+        print(f"{width}x{height}: pose found in {len(detected)}/{frames * repeat} frames")
+    else:
+        print(f"{width}x{height}: no pose found, inference timings are detector-only")
+
+    raw = [frame for frame in synthetic_frames(width, height, min(frames, 60))]
+    with tempfile.TemporaryDirectory() as tmp:
+        out = cv2.VideoWriter(
+            os.path.join(tmp, "bench.mp4"), cv2.VideoWriter_fourcc(*"mp4v"), 30, (width, height)
+        )
+        results["video_encode"] = summarize(timed(out.write, raw, repeat))
+        out.release()
+    return results
+
+
+def math_stages(exercise_key: str, frames: int, repeat: int):
+    # angle math, smoothing, form assessment and the rep state machine on a
+    # synthetic track (recorded pose, exercise joints swinging through reps)
+    spec = pose_analysis.EXERCISE_SPECS[exercise_key]
+    track = synthetic_track(spec.triplets, frames, 30.0)
+    single = list(track)
+    angles = pose_analysis.exercise_angle(exercise_key, track)
+
+    results = {}
+    results["angle_per_frame"] = summarize(
+        timed(lambda lm: pose_analysis.exercise_angle(exercise_key, lm), single, repeat)
+    )
+    whole = timed(lambda t: pose_analysis.exercise_angle(exercise_key, t), [track], repeat)
+    results["angle_track_per_frame"] = summarize(np.asarray(whole) / frames)
+    results["assess_per_frame"] = summarize(
+        timed(lambda a: pose_analysis.assess_form(exercise_key, a), angles.tolist(), repeat)
+    )
+
+    landmark_filter = LandmarkFilter()
+    stamped = [(lm, i / 30.0) for i, lm in enumerate(single)]
+    results["filter_per_frame"] = summarize(
+        timed(lambda item: landmark_filter.update(*item), stamped, repeat)
+    )
+
+    counter = pose_analysis.RepCounter(exercise_key)
+    results["rep_fsm_update"] = summarize(
+        timed(lambda a: counter.update(a, 0.0), angles.tolist(), repeat)
+    )
+    print(f"{exercise_key}: {counter.reps} reps over {frames * repeat} synthetic frames")
+
+    _, landmarks = load_fixture()
+    results["encode_json"] = summarize(timed(_keypoints_json, list(landmarks), repeat))
+    results["encode_f32"] = summarize(timed(landmarks_bytes, list(landmarks), repeat))
+    return results
+
+
+def report_stages(repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "report.pdf")
+        samples = timed(
+            lambda data: reports.render_report(data, "01 January 2026", path),
+            [REPORT_DATA] * 10,
+            repeat,
+        )
+    return {"pdf_render": summarize(samples)}
+
+
+def run(args) -> dict:
+    results = {}
+    for text in args.resolutions:
+        rows = frame_stages(parse_size(text), args.frames, args.repeat)
+        results[f"frame {text}"] = rows
+        print_table(f"frame stages @ {text} (ms per frame)", rows)
+
+    rows = math_stages(args.exercise, args.frames * 10, args.repeat)
+    rows.update(report_stages(args.repeat))
+    results["math/encode/pdf"] = rows
+    print_table("math, encode and report stages (ms per op)", rows)
+    return results
@@ -0,0 +1,81 @@
+import resource
+import time
+
+import numpy as np
+
+
+def summarize(samples, seconds: float | None = None) -> dict:
+    # samples are durations in seconds; seconds is the wall time they were
+    # collected over, for a throughput figure
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    if not len(values):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    result = {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+    if seconds:
+        result["per_sec"] = len(values) / seconds
+    else:
+        result["per_sec"] = 1000.0 / result["mean_ms"] if result["mean_ms"] else 0.0
+    return result
+
+
+class Usage:
+    # CPU time and peak RSS from getrusage. Children (pool workers) are only
+    # accounted once they have exited and been waited for, so stop() has to
+    # run after the pools are shut down.
+    def start(self):
+        self.wall = time.perf_counter()
+        self.self_start = resource.getrusage(resource.RUSAGE_SELF)
+        self.children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return self
+
+    def stop(self) -> dict:
+        wall = time.perf_counter() - self.wall
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_self = own.ru_utime + own.ru_stime - self.self_start.ru_utime - self.self_start.ru_stime
+        cpu_children = (
+            children.ru_utime + children.ru_stime
+            - self.children_start.ru_utime - self.children_start.ru_stime
+        )
+        return {
+            "wall_s": wall,
+            "cpu_main_s": cpu_self,
+            "cpu_workers_s": cpu_children,
+            "cpu_util": (cpu_self + cpu_children) / wall if wall else 0.0,
+            # ru_maxrss is in KiB on Linux; for children it is the largest
+            # single child, not the sum
+            "peak_rss_main_mb": own.ru_maxrss / 1024.0,
+            "peak_rss_worker_mb": children.ru_maxrss / 1024.0,
+        }
+
+
+def timed(fn, inputs, repeat: int = 1):
+    # runs fn over every input `repeat` times; returns per-call durations
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def print_table(title: str, rows: dict):
+    print(f"\n{title}")
+    print(f"{'':28} {'count':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'/sec':>10}")
+    for name, row in rows.items():
+        if not row.get("count"):
+            print(f"{name:28} {0:>7}")
+            continue
+        print(
+            f"{name:28} {row['count']:>7} {row['mean_ms']:>9.3f} {row['p50_ms']:>9.3f} "
+            f"{row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['per_sec']:>10.1f}"
+        )
@@ -0,0 +1,79 @@
+import math
+import os
+
+import cv2
+import numpy as np
+
+from tracks import load_track
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+# a real photo of a person, so pose inference does its normal amount of work
+BASE_IMAGE = os.path.join(HERE, "..", "..", "APP", "assets", "images", "banner1.png")
+
+
+def parse_size(text: str):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def base_image(path: str | None = None):
+    image = cv2.imread(path or BASE_IMAGE)
+    if image is None:
+        print(f"bench: {path or BASE_IMAGE} not found, using a blank figure")
+        image = np.full((540, 960, 3), 200, np.uint8)
+        cv2.circle(image, (480, 120), 40, (60, 60, 60), -1)
+        cv2.line(image, (480, 160), (480, 380), (60, 60, 60), 16)
+    return image
+
+
+def synthetic_frames(width: int, height: int, count: int, phase: float = 0.0, image=None):
+    # the base image with a slow pan and zoom, so trackers and ROI logic
+    # see motion rather than one repeated frame
+    base = cv2.resize(base_image() if image is None else image, (width, height))
+    for i in range(count):
+        t = 2 * math.pi * (i / max(count, 1) + phase)
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), 0, 1.0 + 0.05 * math.sin(t))
+        matrix[0, 2] += 0.03 * width * math.sin(2 * t)
+        yield cv2.warpAffine(base, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+
+
+def jpeg_frames(width: int, height: int, count: int, quality: int = 80, phase: float = 0.0):
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    return [
+        cv2.imencode(".jpg", frame, params)[1].tobytes()
+        for frame in synthetic_frames(width, height, count, phase)
+    ]
+
+
+def write_video(path: str, width: int, height: int, fps: float, seconds: float, phase: float = 0.0):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for frame in synthetic_frames(width, height, int(fps * seconds), phase):
+        out.write(frame)
+    out.release()
+    return path
+
+
+def load_fixture(name: str = "squat"):
+    # landmark tracks recorded with `python -m bench record`
+    _, frame_indices, landmarks = load_track(os.path.join(FIXTURE_DIR, f"{name}.track"))
+    found = ~np.isnan(landmarks[:, 0, 0])
+    return frame_indices[found], landmarks[found]
+
+
+def synthetic_track(triplets, frames: int, fps: float, rep_seconds: float = 2.0, base=None):
+    # (frames, 33, 4) landmarks whose exercise joints swing between 40 and
+    # 170 degrees once per rep_seconds, built by rotating each triplet's end
+    # point around its vertex on a recorded pose
+    if base is None:
+        base = load_fixture()[1][0]
+    t = np.arange(frames) / fps
+    target = np.radians(105 + 65 * np.cos(2 * np.pi * t / rep_seconds))
+    track = np.repeat(base[None], frames, axis=0)
+    for a, b, c in triplets:
+        ba = base[a, :2] - base[b, :2]
+        length = np.linalg.norm(base[c, :2] - base[b, :2])
+        start = math.atan2(ba[1], ba[0])
+        track[:, c, 0] = base[b, 0] + length * np.cos(start + target)
+        track[:, c, 1] = base[b, 1] + length * np.sin(start + target)
+    return track
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    name TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    sha256 TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    refs INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_sha ON blobs (sha256, kind);
+CREATE INDEX IF NOT EXISTS blobs_lru ON blobs (kind, accessed_at);
+"""
+
+# outputs that can be rebuilt, so they may be evicted: rendered videos from
+# a source and its track, tracks by analysing the source again once no job
+# refers to them any more; sources stay while a job refers to them
+EVICTABLE = ("processed", "track")
+
+
+def variant(*parts) -> str:
+    # short stable key for the analysis settings a derived file depends on
+    return hashlib.sha256("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:12]
+
+
+class BlobStore:
+    # Content-addressed files in one directory. An upload is stored once as
+    # <sha256><ext>, however many jobs refer to it; `refs` counts those jobs
+    # and a source nobody refers to any more is deleted. Derived files
+    # (tracks, rendered videos) are named from the source hash plus a
+    # variant of the settings they were made with, so they never collide.
+    def __init__(self, path: str, root: str):
+        self.root = root
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_source(self, upload_path: str, sha256: str, ext: str) -> str:
+        # moves a finished upload into the store, or drops it if the same
+        # bytes are already there; either way the source gains a reference
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT name FROM blobs WHERE sha256 = ? AND kind = 'source'", (sha256,)
+            ).fetchone()
+            if row is not None and os.path.isfile(os.path.join(self.root, row["name"])):
+                os.remove(upload_path)
+                self._conn.execute(
+                    "UPDATE blobs SET refs = refs + 1, accessed_at = ? WHERE name = ?",
+                    (now, row["name"]),
+                )
+                return row["name"]
+
+            name = f"{sha256}{ext.lower()}"
+            path = os.path.join(self.root, name)
+            size = os.path.getsize(upload_path)
+            os.replace(upload_path, path)
+            self._conn.execute(
+                "INSERT INTO blobs (name, kind, sha256, size, refs, created_at, accessed_at) "
+                "VALUES (?, 'source', ?, ?, 1, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET refs = refs + 1, size = excluded.size, "
+                "accessed_at = excluded.accessed_at",
+                (name, sha256, size, now, now),
+            )
+        return name
+
+    def release(self, name: str):
+        # a job no longer needs the file; the last reference deletes it
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE blobs SET refs = refs - 1 WHERE name = ?", (name,))
+            row = self._conn.execute(
+                "SELECT refs FROM blobs WHERE name = ?", (name,)
+            ).fetchone()
+            if row is not None and row["refs"] <= 0:
+                self._conn.execute("DELETE FROM blobs WHERE name = ?", (name,))
+                self._remove(name)
+
+    def add(self, name: str, kind: str, sha256: str | None = None, refs: int = 0):
+        # register a derived file once it has been written; `refs` are the
+        # references the caller takes on it, given back with release()
+        path = os.path.join(self.root, name)
+        if not os.path.isfile(path):
+            return
+        now = time.time()
+        self._execute(
+            "INSERT INTO blobs (name, kind, sha256, size, refs, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET size = excluded.size, "
+            "refs = refs + excluded.refs, accessed_at = excluded.accessed_at",
+            (name, kind, sha256, os.path.getsize(path), refs, now, now),
+        )
+
+    def touch(self, name: str):
+        self._execute("UPDATE blobs SET accessed_at = ? WHERE name = ?", (time.time(), name))
+
+    def usage(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, SUM(size) AS size FROM blobs GROUP BY kind"
+            ).fetchall()
+        return {row["kind"]: row["size"] for row in rows}
+
+    def evict(self, max_bytes: int, max_age: float, keep=()) -> list:
+        # least recently served first: anything idle for max_age, then more
+        # until the evictable files fit in max_bytes (0 = no limit); names in
+        # `keep` are about to be served and stay whatever the budget
+        removed = []
+        marks = ",".join("?" * len(EVICTABLE))
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                f"SELECT name, size, accessed_at FROM blobs WHERE kind IN ({marks}) "
+                "AND (kind = 'processed' OR refs <= 0) ORDER BY accessed_at",
+                EVICTABLE,
+            ).fetchall()
+            total = sum(row["size"] for row in rows)
+            cutoff = time.time() - max_age if max_age else None
+            for row in rows:
+                if row["name"] in keep:
+                    continue
+                stale = cutoff is not None and row["accessed_at"] < cutoff
+                if not stale and not (max_bytes and total > max_bytes):
+                    break
+                self._conn.execute("DELETE FROM blobs WHERE name = ?", (row["name"],))
+                self._remove(row["name"])
+                total -= row["size"]
+                removed.append(row["name"])
+        return removed
+
+    def _remove(self, name: str):
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+    def _execute(self, sql: str, args=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, args)
@@ -0,0 +1,350 @@
+import hashlib
+import io
+import os
+import time
+
+import numpy as np
+
+import config
+from exercises import ARMED, IDLE, load_exercises
+from history import decode_series
+from landmarks import LANDMARK_INDEX, POSE_CONNECTIONS
+from tracks import pipeline_version
+
+# Report analytics and charts. Everything is computed with array operations
+# over a session's stored angle series and the patient's session rows; the
+# figures are drawn with matplotlib's Agg canvas (no pyplot, no display) and
+# cached as small palette PNGs, once per session and once per history state
+# for the trends, so a report only reads files it has drawn before.
+
+EXERCISE_SPECS, DEFAULT_EXERCISE = load_exercises(
+    config.EXERCISES_FILE, LANDMARK_INDEX, POSE_CONNECTIONS
+)
+
+# bump when what the charts show changes, so cached images are redrawn;
+# session charts also depend on the exercise definitions
+CHART_VERSION = 1
+CHART_KEY = hashlib.sha256(
+    f"{CHART_VERSION}|{pipeline_version(config.EXERCISES_FILE)}".encode("utf-8")
+).hexdigest()[:10]
+
+WEEK = 604800.0
+# 1970-01-05 was a Monday; weeks start there, in UTC, like /progress
+WEEK_ORIGIN = 4 * 86400.0
+
+# form score bands, matching the report's FORM_LEVELS
+FORM_BOUNDS = np.array([70.0, 85.0])
+FORM_BANDS = ["Needs work", "Good", "Excellent"]
+BAND_TICKS = ["<70", "70-85", "85+"]
+BAND_COLORS = ["#d9534f", "#f0ad4e", "#5cb85c"]
+LINE_COLOR = "#2a6fb0"
+ROM_COLOR = "#7a4fb0"
+
+FIG_WIDTH = 7.2
+DPI = 110
+PALETTE_COLORS = 48
+# longer series are drawn as a min/max envelope of this many columns
+MAX_POINTS = 800
+
+
+def rep_indices(spec, angles):
+    # sample indices where reps are counted: the same two-state machine as
+    # RepCounter, run over the whole series at once. Only the first sample
+    # of a run above the arm threshold or below the count threshold moves
+    # it, and a count only follows an arm.
+    if spec.transitions is None or not len(angles):
+        return np.empty(0, dtype=np.intp)
+    events = np.zeros(len(angles), dtype=np.int8)
+    events[angles > spec.transitions[IDLE][1]] = 1
+    events[angles < spec.transitions[ARMED][1]] = -1
+    at = np.flatnonzero(events)
+    kinds = events[at]
+    first = np.ones(len(kinds), dtype=bool)
+    first[1:] = kinds[1:] != kinds[:-1]
+    at, kinds = at[first], kinds[first]
+    counted = kinds == -1
+    if len(counted):
+        counted[0] = False
+    return at[counted]
+
+
+def session_analytics(spec, timestamps, angles) -> dict:
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    angles = np.asarray(angles, dtype=np.float64)
+    feedback, scores = spec.assess_many(angles)
+    scores = scores * 100.0
+    reps = rep_indices(spec, angles)
+
+    # one cycle per pair of consecutive reps: its duration, range of motion
+    # and mean form, reduced per segment without a Python loop
+    tempo = np.diff(timestamps[reps])
+    cycle_rom = cycle_form = np.empty(0)
+    if len(reps) > 1:
+        starts = reps[:-1]
+        cycle = slice(0, reps[-1])
+        cycle_rom = np.maximum.reduceat(angles[cycle], starts) - np.minimum.reduceat(
+            angles[cycle], starts
+        )
+        cycle_form = np.add.reduceat(scores[cycle], starts) / np.diff(reps)
+
+    bands = np.bincount(np.searchsorted(FORM_BOUNDS, scores, side="right"), minlength=3)
+    texts = np.bincount(feedback, minlength=len(spec.feedback_texts))
+    low, high = np.percentile(angles, [5, 95])
+    return {
+        "timestamps": timestamps,
+        "angles": angles,
+        "reps": reps,
+        "tempo": tempo,
+        "cycle_rom": cycle_rom,
+        "cycle_form": cycle_form,
+        "band_share": bands / len(angles),
+        "feedback_share": {
+            spec.feedback_texts[i]: texts[i] / len(angles) for i in np.flatnonzero(texts)
+        },
+        "rom": (float(angles.min()), float(angles.max())),
+        "rom_typical": (float(low), float(high)),
+    }
+
+
+def weekly_trends(created_at, reps, form_score, rom):
+    # per calendar week: sessions, reps, mean form (0-100) and mean range of
+    # motion, binned with bincount over the week index of every session
+    if not len(created_at):
+        return None
+    week = np.floor((created_at - WEEK_ORIGIN) / WEEK).astype(np.int64)
+    weeks, inverse = np.unique(week, return_inverse=True)
+    sessions = np.bincount(inverse)
+    has_rom = ~np.isnan(rom)
+    rom_count = np.bincount(inverse[has_rom], minlength=len(weeks))
+    rom_sum = np.bincount(inverse[has_rom], weights=rom[has_rom], minlength=len(weeks))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rom_mean = np.where(rom_count > 0, rom_sum / rom_count, np.nan)
+    return {
+        "week_start": weeks * WEEK + WEEK_ORIGIN,
+        "sessions": sessions,
+        "reps": np.bincount(inverse, weights=reps),
+        "form": np.bincount(inverse, weights=form_score) / sessions * 100.0,
+        "rom": rom_mean,
+        "session_times": created_at,
+        "session_form": form_score * 100.0,
+    }
+
+
+def _envelope(x, y, columns: int):
+    # min/max per column keeps the peaks of a long series at a fraction of
+    # the points
+    if len(y) <= 2 * columns:
+        return x, y
+    starts = np.linspace(0, len(y), columns, endpoint=False).astype(np.intp)
+    low = np.minimum.reduceat(y, starts)
+    high = np.maximum.reduceat(y, starts)
+    return np.repeat(x[starts], 2), np.column_stack([low, high]).ravel()
+
+
+def _figure(height: float, ratios):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(FIG_WIDTH, height), dpi=DPI)
+    FigureCanvasAgg(fig)
+    # fixed margins: tight_layout would cost as much as the drawing
+    fig.subplots_adjust(left=0.07, right=0.985, bottom=0.17, top=0.86, wspace=0.32)
+    axes = fig.subplots(1, len(ratios), gridspec_kw={"width_ratios": ratios})
+    for ax in axes:
+        ax.tick_params(labelsize=7)
+        ax.spines[["top", "right"]].set_visible(False)
+    return fig, axes
+
+
+def _png(fig) -> bytes:
+    # a chart has a handful of flat colours: a small palette PNG is a
+    # fraction of the RGBA one, and FPDF embeds it as is
+    from PIL import Image
+
+    fig.canvas.draw()
+    rgb = np.asarray(fig.canvas.buffer_rgba())[..., :3]
+    image = Image.fromarray(rgb).quantize(PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)
+    out = io.BytesIO()
+    image.save(out, "PNG", compress_level=9)
+    return out.getvalue()
+
+
+def render_session_chart(spec, analysis: dict) -> bytes:
+    from matplotlib.ticker import MaxNLocator
+
+    fig, (curve, tempo, form) = _figure(2.3, [3.0, 1.6, 1.3])
+
+    t, angles = analysis["timestamps"], analysis["angles"]
+    curve.axhspan(spec.ideal_min, spec.ideal_max, color="#5cb85c", alpha=0.12, lw=0)
+    x, y = _envelope(t, angles, MAX_POINTS)
+    curve.plot(x, y, color=LINE_COLOR, lw=0.8)
+    reps = analysis["reps"]
+    if len(reps):
+        curve.plot(t[reps], angles[reps], "v", color="#333333", ms=3)
+    curve.set_title("Joint angle (ideal range shaded)", fontsize=8)
+    curve.set_xlabel("seconds", fontsize=7)
+    curve.set_ylabel("degrees", fontsize=7)
+
+    cycles = analysis["tempo"]
+    if len(cycles):
+        colors = np.array(BAND_COLORS)[
+            np.searchsorted(FORM_BOUNDS, analysis["cycle_form"], side="right")
+        ]
+        tempo.bar(np.arange(2, len(cycles) + 2), cycles, color=colors, width=0.8)
+        tempo.axhline(cycles.mean(), color="#333333", lw=0.7, ls="--")
+    tempo.set_title("Seconds per rep", fontsize=8)
+    tempo.set_xlabel("rep", fontsize=7)
+    tempo.xaxis.set_major_locator(MaxNLocator(integer=True))
+
+    share = analysis["band_share"] * 100.0
+    form.barh(np.arange(3), share, color=BAND_COLORS, height=0.6)
+    form.set_yticks(np.arange(3), BAND_TICKS, fontsize=7)
+    form.set_xlim(0, 100)
+    form.set_title("% of time by form score", fontsize=8)
+
+    return _png(fig)
+
+
+def render_trend_chart(trends: dict) -> bytes:
+    from matplotlib.ticker import MaxNLocator
+
+    fig, (scores, volume) = _figure(2.1, [2.2, 1.0])
+    weeks = (trends["week_start"] - trends["week_start"][0]) / WEEK
+    session_weeks = (trends["session_times"] - trends["week_start"][0]) / WEEK
+
+    scores.plot(session_weeks, trends["session_form"], ".", color=LINE_COLOR, alpha=0.3, ms=3)
+    scores.plot(weeks + 0.5, trends["form"], "-o", color=LINE_COLOR, lw=1.2, ms=3)
+    scores.set_ylim(0, 105)
+    scores.set_ylabel("form score", fontsize=7, color=LINE_COLOR)
+    scores.set_xlabel("week", fontsize=7)
+    scores.xaxis.set_major_locator(MaxNLocator(integer=True))
+    has_rom = ~np.isnan(trends["rom"])
+    if has_rom.any():
+        rom = scores.twinx()
+        rom.tick_params(labelsize=7)
+        rom.spines[["top"]].set_visible(False)
+        rom.plot(weeks[has_rom] + 0.5, trends["rom"][has_rom], "-s", color=ROM_COLOR, lw=1.0, ms=3)
+        rom.set_ylabel("range of motion (deg)", fontsize=7, color=ROM_COLOR)
+    scores.set_title("Weekly form and range of motion", fontsize=8)
+
+    volume.bar(weeks + 0.5, trends["reps"], color="#8fb4d8", width=0.7)
+    volume.set_title("Reps per week", fontsize=8)
+    volume.set_xlabel("week", fontsize=7)
+    volume.xaxis.set_major_locator(MaxNLocator(integer=True))
+
+    return _png(fig)
+
+
+def cached_chart(cache_dir: str, name: str, render) -> str:
+    path = os.path.join(cache_dir, name)
+    if os.path.isfile(path):
+        return path
+    data = render()
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def session_chart(session: dict, exercise_key: str, cache_dir: str = config.CHART_DIR):
+    # (chart path, analytics) of a session with an angle series
+    if session["angles"] is None:
+        return None, None
+    spec = EXERCISE_SPECS.get(exercise_key, DEFAULT_EXERCISE)
+    timestamps, angles = decode_series(session["angles"], session["angle_count"])
+    analysis = session_analytics(spec, timestamps, angles)
+    path = cached_chart(
+        cache_dir,
+        f"session_{session['id']}_{CHART_KEY}.png",
+        lambda: render_session_chart(spec, analysis),
+    )
+    return path, analysis
+
+
+def _change(value: float, previous: float, unit: str = "") -> str:
+    if np.isnan(value):
+        return "n/a"
+    if np.isnan(previous):
+        return f"{value:.0f}{unit}"
+    return f"{value:.0f}{unit} ({value - previous:+.0f})"
+
+
+def report_analysis(store, data: dict, cache_dir: str = config.CHART_DIR) -> dict:
+    # report fields and chart paths for the session a report is about (the
+    # stored session named by history_id, else the patient's latest for the
+    # exercise) and for the patient's whole history, whose chart every
+    # report on the patient shares until a session is added
+    patient_id = str(data.get("patient_id") or "")
+    exercise_key = data.get("exercise_key")
+    if not patient_id or not exercise_key:
+        return {}
+    session = store.find_session(patient_id, exercise_key, data.get("history_id"))
+    if session is None:
+        return {}
+
+    fields = {}
+    path, analysis = session_chart(session, exercise_key, cache_dir)
+    if path is not None:
+        low, high = analysis["rom"]
+        typical_low, typical_high = analysis["rom_typical"]
+        tempo = analysis["tempo"]
+        if len(tempo):
+            spread = tempo.std() / tempo.mean() * 100.0 if tempo.mean() else 0.0
+            tempo_text = (
+                f"{tempo.mean():.2f} s per rep ({tempo.min():.2f} - {tempo.max():.2f} s, "
+                f"{spread:.0f}% variation)"
+            )
+        else:
+            tempo_text = "not enough reps to measure"
+        shares = sorted(analysis["feedback_share"].items(), key=lambda item: -item[1])
+        fields.update(
+            {
+                "session_chart": path,
+                "rom_text": (
+                    f"{low:.0f} - {high:.0f} deg, {high - low:.0f} deg total "
+                    f"(typical {typical_low:.0f} - {typical_high:.0f} deg)"
+                ),
+                "tempo_text": tempo_text,
+                "band_text": ", ".join(
+                    f"{label} {share * 100:.0f}%"
+                    for label, share in zip(FORM_BANDS, analysis["band_share"])
+                ),
+                "feedback_text": "; ".join(f"{text} ({share * 100:.0f}%)" for text, share in shares),
+            }
+        )
+
+    created_at, reps, form_score, rom = store.patient_sessions(patient_id, exercise_key)
+    trends = weekly_trends(created_at, reps, form_score, rom)
+    if trends is None or len(trends["week_start"]) < 2:
+        return fields
+    key = hashlib.sha256(
+        f"{patient_id}|{exercise_key}|{len(created_at)}|{created_at[-1]!r}|{CHART_KEY}".encode("utf-8")
+    ).hexdigest()[:24]
+    form, rom_mean, week_reps = trends["form"], trends["rom"], trends["reps"]
+    fields.update(
+        {
+            "trend_chart": cached_chart(
+                cache_dir, f"trend_{key}.png", lambda: render_trend_chart(trends)
+            ),
+            "trend_span": (
+                f"{len(created_at)} sessions over {len(form)} weeks since "
+                f"{time.strftime('%d %B %Y', time.gmtime(created_at[0]))}"
+            ),
+            "week_text": (
+                f"form {_change(form[-1], form[-2])}, "
+                f"range of motion {_change(rom_mean[-1], rom_mean[-2], ' deg')}, "
+                f"reps {_change(week_reps[-1], week_reps[-2])}"
+            ),
+        }
+    )
+    return fields
+
+
+def warm_up():
+    # load matplotlib and its fonts with one throwaway chart
+    spec = DEFAULT_EXERCISE
+    t = np.arange(64, dtype=np.float64) / 8.0
+    analysis = session_analytics(spec, t, 110.0 + 40.0 * np.sin(t))
+    return len(render_session_chart(spec, analysis))
@@ -0,0 +1,109 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+REPORT_DIR = os.environ.get("REPORT_DIR", "reports")
+VIDEO_DIR = os.environ.get("VIDEO_DIR", "videos")
+
+# pose inference pools: live frames and whole-video analysis run in separate
+# worker processes so a long upload never starves live clients
+POSE_WORKERS = _env_int("POSE_WORKERS", max(1, (os.cpu_count() or 2) // 2))
+POSE_QUEUE_SIZE = _env_int("POSE_QUEUE_SIZE", 4)
+VIDEO_WORKERS = _env_int("VIDEO_WORKERS", 1)
+VIDEO_QUEUE_SIZE = _env_int("VIDEO_QUEUE_SIZE", 2)
+
+# every worker loads its models and runs a blank inference before /readyz
+# reports it ready (0 = skip, the first request pays instead)
+POOL_WARMUP = _env_int("POOL_WARMUP", 1)
+
+# PDF reports render in their own small pool, off the event loop
+REPORT_WORKERS = _env_int("REPORT_WORKERS", min(4, os.cpu_count() or 1))
+REPORT_QUEUE_SIZE = _env_int("REPORT_QUEUE_SIZE", 8)
+# /generate_reports: zips stream any number up to the batch cap; a merged
+# PDF has its pages and charts prepared across the pool but is laid out in
+# memory by one worker, so it gets a tighter cap
+REPORT_BATCH_MAX = _env_int("REPORT_BATCH_MAX", 500)
+REPORT_MERGE_MAX = _env_int("REPORT_MERGE_MAX", 50)
+
+# live sessions keep their own stateful tracker inside the worker they are
+# pinned to; the cap is per worker since each tracker holds its own graph
+SESSION_MAX_PER_WORKER = _env_int("SESSION_MAX_PER_WORKER", 16)
+SESSION_IDLE_TTL = _env_int("SESSION_IDLE_TTL", 120)
+
+# frames for a busy frame worker are held up to FRAME_BATCH_WINDOW_MS and
+# handed over together, at most FRAME_BATCH_MAX per batch (1 = no batching)
+FRAME_BATCH_MAX = _env_int("FRAME_BATCH_MAX", 8)
+FRAME_BATCH_WINDOW_MS = _env_int("FRAME_BATCH_WINDOW_MS", 5)
+
+# uploads are streamed to disk; memory per upload is bounded by the chunk size
+MAX_UPLOAD_BYTES = _env_int("MAX_UPLOAD_BYTES", 512 * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = _env_int("UPLOAD_CHUNK_BYTES", 1024 * 1024)
+
+# uploads are stored once per content hash; rendered videos can be rebuilt
+# from the upload and its track, so they are evicted least recently served
+# first beyond VIDEO_CACHE_MAX_BYTES or after VIDEO_CACHE_MAX_AGE_DAYS unused
+# (0 = no limit)
+VIDEO_CACHE_MAX_BYTES = _env_int("VIDEO_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+VIDEO_CACHE_MAX_AGE_DAYS = float(os.environ.get("VIDEO_CACHE_MAX_AGE_DAYS", "30"))
+
+# video analysis runs as persistent jobs; results are cached by content hash
+JOBS_DB = os.environ.get("JOBS_DB", "jobs.db")
+JOB_CONCURRENCY = _env_int("JOB_CONCURRENCY", VIDEO_WORKERS)
+JOB_QUEUE_LIMIT = _env_int("JOB_QUEUE_LIMIT", 100)
+# jobs finished (and not reused by an identical upload) this long ago are
+# deleted along with the upload and track they held (0 = keep forever)
+JOB_RETENTION_DAYS = float(os.environ.get("JOB_RETENTION_DAYS", "90"))
+
+# every finished analysis is summarised into the patient session history
+HISTORY_DB = os.environ.get("HISTORY_DB", "history.db")
+# report charts are drawn once per session (and per history state for the
+# trends) and kept here for every later report that shows them
+CHART_DIR = os.environ.get("CHART_DIR", os.path.join(REPORT_DIR, "charts"))
+
+# videos are analysed at this rate (0 = every frame) unless the upload asks
+# for another; sampling turns dense within this many degrees of a rep threshold
+ANALYSIS_FPS = float(os.environ.get("ANALYSIS_FPS", "0"))
+ANALYSIS_DENSE_MARGIN = float(os.environ.get("ANALYSIS_DENSE_MARGIN", "20"))
+
+# landmarks are smoothed per session/video before angles and rep counting
+# ("one_euro" or "off"); gaps up to LANDMARK_MAX_GAP seconds are bridged
+LANDMARK_FILTER = os.environ.get("LANDMARK_FILTER", "one_euro")
+LANDMARK_MAX_GAP = float(os.environ.get("LANDMARK_MAX_GAP", "0.5"))
+
+# annotated videos are rendered from the landmark track on first request
+# ("lazy") or straight after analysis in the background ("eager")
+RENDER_MODE = os.environ.get("RENDER_MODE", "lazy")
+# each render also writes a rendition at most VIDEO_LOW_HEIGHT pixels tall
+# for slow connections and a strip of THUMBNAIL_COUNT frames for scrubbing
+VIDEO_LOW_HEIGHT = _env_int("VIDEO_LOW_HEIGHT", 360)
+THUMBNAIL_COUNT = _env_int("THUMBNAIL_COUNT", 10)
+THUMBNAIL_HEIGHT = _env_int("THUMBNAIL_HEIGHT", 90)
+
+# pose model: "solutions" (mediapipe.solutions) or "tasks" (PoseLandmarker,
+# reading pose_landmarker_<tier>.task bundles from POSE_TASK_MODEL_DIR).
+# Tiers are lite/full/heavy (model complexity 0/1/2); live sessions pick
+# theirs from their latency when LIVE_POSE_TIER is "auto", never above
+# LIVE_MAX_TIER. Budgets can also be set per session by the client.
+POSE_BACKEND = os.environ.get("POSE_BACKEND", "solutions")
+POSE_TASK_MODEL_DIR = os.environ.get("POSE_TASK_MODEL_DIR", "")
+LIVE_POSE_TIER = os.environ.get("LIVE_POSE_TIER", "auto")
+LIVE_MAX_TIER = os.environ.get("LIVE_MAX_TIER", "full")
+LIVE_LATENCY_BUDGET_MS = _env_int("LIVE_LATENCY_BUDGET_MS", 250)
+VIDEO_POSE_TIER = os.environ.get("VIDEO_POSE_TIER", "full")
+# group sessions: one camera, up to MAX_POSES people tracked at once (needs
+# the tasks backend; the solutions one only ever finds a single person)
+MAX_POSES = _env_int("MAX_POSES", 6)
+
+# exercise definitions (joints, rep thresholds, ideal ranges, feedback rules)
+EXERCISES_FILE = os.environ.get(
+    "EXERCISES_FILE", os.path.join(os.path.dirname(__file__), "exercises.json")
+)
+
+# debug log of one live frame in every N (stage timings, pose found); 0 = off
+FRAME_LOG_EVERY = _env_int("FRAME_LOG_EVERY", 0)
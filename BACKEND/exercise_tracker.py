@@ -1,613 +1,1135 @@
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
+import asyncio
+import itertools
+import json
+import time
+import uuid
+import zipfile
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, HTTPException, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fpdf import FPDF
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 import os
-import time
 
 import base64
-import cv2
-import numpy as np 
-import mediapipe as mp
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, Field, ValidationError
+
+import config
+from blobs import BlobStore, variant
+from frame_codec import (
+    OCTET_STREAM,
+    landmarks_bytes,
+    negotiate_format,
+    pack_message,
+    unpack_message,
+)
+from history import SessionStore
+from jobs import JobRunner, JobStore
+from metrics import METRICS
+from exercises import load_exercises
+from landmarks import LANDMARK_INDEX, LANDMARK_NAMES, POSE_CONNECTIONS
+from pose_pool import InvalidInput, PoolBusy, PoolUnavailable, PosePool, TaskFailed
+from reports import ZipSink, merged_report_filename, report_context, report_filename
+from tracks import pipeline_version, read_track_header
+from uploads import UploadError, receive_upload
+
+frame_pool = PosePool(
+    "frame",
+    config.POSE_WORKERS,
+    config.POSE_QUEUE_SIZE,
+    batch_max=config.FRAME_BATCH_MAX,
+    batch_window_ms=config.FRAME_BATCH_WINDOW_MS,
+    warmup=bool(config.POOL_WARMUP),
+    on_session_end=lambda summaries: record_ended_sessions(summaries),
+)
+video_pool = PosePool(
+    "video", config.VIDEO_WORKERS, config.VIDEO_QUEUE_SIZE, warmup=bool(config.POOL_WARMUP)
+)
+report_pool = PosePool(
+    "report", config.REPORT_WORKERS, config.REPORT_QUEUE_SIZE, warmup=bool(config.POOL_WARMUP)
+)
+job_store = JobStore(config.JOBS_DB)
+history_store = SessionStore(config.HISTORY_DB)
+blob_store = BlobStore(config.JOBS_DB, config.VIDEO_DIR)
+
+# only the landmark subsets are needed here; pose models, OpenCV and the PDF
+# library are loaded by the workers that use them
+EXERCISE_INDICES = {
+    key: spec.indices
+    for key, spec in load_exercises(
+        config.EXERCISES_FILE, LANDMARK_INDEX, POSE_CONNECTIONS
+    )[0].items()
+}
+
+PIPELINE = pipeline_version(config.EXERCISES_FILE)
+
+
+def record_video_session(job: dict, result: dict) -> dict:
+    # the per-frame angle series goes to the history store, not the job row
+    series = result.pop("series", None)
+    params = job["params"]
+    try:
+        result["history_id"] = history_store.record(
+            {
+                "patient_id": params["patient_id"],
+                "patient_name": params["patient_name"],
+                "exercise_key": params["exercise_key"],
+                "source": "video",
+                "job_id": job["id"],
+                "created_at": job["created_at"],
+                "duration": result.get("video_seconds", 0.0),
+                "reps": result["reps"],
+                "assigned_reps": params["assigned_reps"],
+                "sets": params["sets"],
+                "avg_time": result["avg_time"],
+                "form_score": result["form_score"],
+            },
+            series,
+        )
+        prerender_chart(result["history_id"], params["patient_id"], params["exercise_key"])
+    except Exception as e:
+        print("history record failed:", e)
+    return result
+
+
+def video_job_done(job: dict, result: dict) -> dict:
+    # the job holds its track as it holds its source, until it expires
+    expire_jobs()
+    blob_store.add(
+        os.path.basename(job["payload"]["track_path"]), "track", job["content_hash"], refs=1
+    )
+    return record_video_session(job, result)
+
+
+def video_job_released(job: dict):
+    # a failed job serves nothing and a repeated one serves the first one's
+    # files, so either lets go of its upload
+    blob_store.release(os.path.basename(job["payload"]["video_path"]))
+
+
+def expire_jobs():
+    # jobs finished or last reused JOB_RETENTION_DAYS ago are deleted; an
+    # analysed one gives back its source and track, cached and failed ones
+    # hold neither
+    if not config.JOB_RETENTION_DAYS:
+        return
+    expired = job_store.expire(time.time() - config.JOB_RETENTION_DAYS * 86400)
+    for job in expired:
+        if job["status"] == "done" and not job["cached"] and job["kind"] == "video":
+            blob_store.release(os.path.basename(job["payload"]["video_path"]))
+            blob_store.release(os.path.basename(job["payload"]["track_path"]))
+    if expired:
+        print(f"jobs: expired {len(expired)} finished jobs")
+
+
+def record_live_session(summary: dict | None):
+    if summary is None:
+        return None
+    series = summary.pop("series", None)
+    if summary.get("patient_id") and summary.get("exercise_key"):
+        try:
+            summary["history_id"] = history_store.record(
+                dict(
+                    summary,
+                    source="live",
+                    created_at=time.time() - summary["duration"],
+                ),
+                series,
+            )
+            prerender_chart(
+                summary["history_id"], summary["patient_id"], summary["exercise_key"]
+            )
+        except Exception as e:
+            print("history record failed:", e)
+    return summary
+
 
-app = FastAPI()
+def record_ended_sessions(summaries: list):
+    # live sessions a worker evicted are recorded like ones ended explicitly
+    for summary in summaries:
+        record_live_session(summary)
+
+
+# the event loop only holds weak references to tasks; these are kept here
+# until they finish, so none is collected half way through
+background_tasks = set()
+
+
+def run_in_background(coro, what: str):
+    def log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"{what} failed:", task.exception())
+
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    task.add_done_callback(log_failure)
+    return task
+
+
+def prerender_chart(session_id: str, patient_id: str, exercise_key: str):
+    # the report pool draws a new session's charts in the background, so
+    # its first report only embeds them
+    run_in_background(
+        report_pool.submit(
+            "session_chart",
+            {"session_id": session_id, "patient_id": patient_id, "exercise_key": exercise_key},
+        ),
+        "session chart",
+    )
+
+
+job_runner = JobRunner(
+    job_store,
+    video_pool,
+    config.JOB_CONCURRENCY,
+    on_result=video_job_done,
+    on_release=video_job_released,
+)
+inflight = {}
+frame_counter = itertools.count(1)
+
+POOLS = (frame_pool, video_pool, report_pool)
+METRICS.gauge("pool_queue_depth", lambda: [({"pool": p.name}, p.depth()) for p in POOLS])
+METRICS.gauge("pool_workers", lambda: [({"pool": p.name}, p.size) for p in POOLS])
+METRICS.gauge("live_sessions", frame_pool.sessions)
+METRICS.gauge("jobs_queued", job_store.queued_count)
+METRICS.gauge(
+    "video_store_bytes",
+    lambda: [({"kind": kind}, size) for kind, size in sorted(blob_store.usage().items())],
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    frame_pool.start()
+    video_pool.start()
+    report_pool.start()
+    job_runner.start()
+    expire_jobs()
+    evict_videos()
+    try:
+        yield
+    finally:
+        # renders still waiting, and the pool tasks they share, are dropped;
+        # a request for the video renders it again
+        pending = [*background_tasks, *inflight.values()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await job_runner.stop()
+        frame_pool.stop()
+        video_pool.stop()
+        report_pool.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Landmark-Count", "X-Landmark-Indices", "X-Session"],
 )
 
-REPORT_DIR = "reports"
-VIDEO_DIR = "videos"
+REPORT_DIR = config.REPORT_DIR
+VIDEO_DIR = config.VIDEO_DIR
 
 os.makedirs(REPORT_DIR, exist_ok=True)
 os.makedirs(VIDEO_DIR, exist_ok=True)
 
-app.mount("/reports", StaticFiles(directory=REPORT_DIR), name="reports")
-app.mount("/videos", StaticFiles(directory=VIDEO_DIR), name="videos")
 
-mp_pose = mp.solutions.pose
-pose_detector = mp_pose.Pose(
-    static_image_mode=False,           # better for continuous frames
-    model_complexity=1,
-    enable_segmentation=False,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-)
+def pool_error_response(exc: Exception, busy_status: int = 429):
+    if isinstance(exc, PoolBusy):
+        return JSONResponse(
+            {"detail": "Server busy, retry later"},
+            status_code=busy_status,
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    return JSONResponse(
+        {"detail": "Pose service unavailable"},
+        status_code=503,
+        headers={"Retry-After": "5"},
+    )
 
-EXERCISES = {
-    "bicep_curl": [
-        "LEFT_ELBOW",
-        "RIGHT_ELBOW",
-        "LEFT_SHOULDER",
-        "RIGHT_SHOULDER",
-        "LEFT_WRIST",
-        "RIGHT_WRIST",
-    ],
-    "squat": [
-        "LEFT_HIP",
-        "RIGHT_HIP",
-        "LEFT_KNEE",
-        "RIGHT_KNEE",
-        "LEFT_ANKLE",
-        "RIGHT_ANKLE",
-    ],
-    "shoulder_abduction": [
-        "LEFT_SHOULDER",
-        "RIGHT_SHOULDER",
-        "LEFT_ELBOW",
-        "RIGHT_ELBOW",
-    ],
-    "knee_extension": ["LEFT_HIP", "RIGHT_HIP", "LEFT_KNEE", "RIGHT_KNEE"],
-    "leg_raise": [
-        "LEFT_HIP",
-        "RIGHT_HIP",
-        "LEFT_KNEE",
-        "RIGHT_KNEE",
-        "LEFT_ANKLE",
-        "RIGHT_ANKLE",
-    ],
-    "side_bend": ["LEFT_SHOULDER", "RIGHT_SHOULDER", "LEFT_HIP", "RIGHT_HIP"],
-}
+
+def log_frame(source: str, session_id, landmarks, timings: dict):
+    # a sample of live frames, so the log stays readable under load
+    every = config.FRAME_LOG_EVERY
+    if every <= 0 or next(frame_counter) % every:
+        return
+    stages = " ".join(f"{name}={seconds * 1000.0:.1f}ms" for name, seconds in timings.items())
+    print(f"{source} session={session_id} pose={landmarks is not None} {stages}")
+
+
+async def run_once(key: str, start):
+    # concurrent requests for the same artefact share one pool task
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(start())
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+def file_response(request: Request, path: str, media_type=None, cache_control=None):
+    response = FileResponse(path, media_type=media_type, stat_result=os.stat(path))
+    if cache_control:
+        response.headers["Cache-Control"] = cache_control
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # a comma-separated list of tags, compared weakly, or "*"
+        etag = response.headers["etag"]
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or etag.removeprefix("W/") in tags:
+            headers = {"ETag": etag}
+            if cache_control:
+                headers["Cache-Control"] = cache_control
+            return Response(status_code=304, headers=headers)
+    return response
+
+
+@app.post("/generate_report")
+async def generate_report(request: Request):
+    data = await request.json()
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object")
+
+    try:
+        filename = await ensure_report(data, report_date())
+    except (PoolBusy, PoolUnavailable) as e:
+        return pool_error_response(e, busy_status=503)
+    except InvalidInput as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TaskFailed as e:
+        print("generate_report error:", e)
+        raise HTTPException(status_code=500, detail="Failed to render report")
+
+    return {"url": f"/reports/{filename}"}
+
+
+def report_date() -> str:
+    return datetime.now().strftime("%d %B %Y")
 
 
-def calculate_angle(a, b, c):
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(
-        a[1] - b[1], a[0] - b[0]
+def history_mark(data: dict) -> str:
+    # reports chart the patient's stored sessions, so a new session must
+    # give the same request a new report
+    return history_store.history_mark(
+        str(data.get("patient_id") or ""), str(data.get("exercise_key") or "")
     )
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180:
-        angle = 360 - angle
-    return float(angle)
-
-
-def assess_form(exercise: str, angle: float):
-    ideal_ranges = {
-        "bicep_curl": (30, 160),
-        "squat": (70, 160),
-        "shoulder_abduction": (70, 160),
-        "knee_extension": (0, 160),
-        "leg_raise": (40, 150),
-        "side_bend": (10, 35),
-    }
-    ideal_min, ideal_max = ideal_ranges.get(exercise, (60, 150))
 
-    if angle < ideal_min:
-        diff = ideal_min - angle
-    elif angle > ideal_max:
-        diff = angle - ideal_max
-    else:
-        diff = 0
-    score = max(0.0, 1.0 - (diff / 60))
-
-    feedback = "Keep form consistent."
-    if exercise == "bicep_curl":
-        if angle < 60:
-            feedback = "Great contraction!"
-        elif angle > 160:
-            feedback = "Full extension!"
-        else:
-            feedback = "Complete your motion fully."
-    elif exercise == "squat":
-        if angle < 95:
-            feedback = "Nice deep squat!"
-        elif angle > 160:
-            feedback = "Standing tall."
-        else:
-            feedback = "Try going a bit lower."
-    elif exercise == "shoulder_abduction":
-        feedback = (
-            "Good arm raise!" if angle > 120 else "Lift higher for full range."
-        )
-    elif exercise == "knee_extension":
-        feedback = (
-            "Full knee extension achieved!"
-            if angle > 160
-            else "Straighten knee more."
+
+async def ensure_report(data: dict, date_str: str) -> str:
+    filename = report_filename(data, date_str, history_mark(data))
+    filepath = os.path.join(REPORT_DIR, filename)
+    if not os.path.isfile(filepath):
+        await run_once(
+            filename,
+            lambda: report_pool.submit(
+                "report", {"data": data, "date_str": date_str, "path": filepath}
+            ),
         )
-    elif exercise == "leg_raise":
-        feedback = (
-            "Leg raised high enough!" if angle > 140 else "Lift leg higher."
+    return filename
+
+
+async def ensure_merged_report(items: list, date_str: str) -> str:
+    filename = merged_report_filename(items, date_str, [history_mark(item) for item in items])
+    filepath = os.path.join(REPORT_DIR, filename)
+    if not os.path.isfile(filepath):
+        await run_once(filename, lambda: render_merged_report(items, date_str, filepath))
+    return filename
+
+
+async def render_merged_report(items: list, date_str: str, filepath: str):
+    # every report's context and charts are built on whichever worker is
+    # free, at most `window` at a time; one worker then lays out the pages
+    window = asyncio.Semaphore(report_pool.size * 2)
+
+    async def context(data):
+        async with window:
+            while True:
+                try:
+                    return await report_pool.submit(
+                        "report_context", {"data": data, "date_str": date_str}
+                    )
+                except PoolBusy as e:
+                    await asyncio.sleep(e.retry_after)
+
+    contexts = await asyncio.gather(*(context(data) for data in items))
+    return await report_pool.submit("report_batch", {"contexts": contexts, "path": filepath})
+
+
+async def ensure_report_retrying(data: dict, date_str: str) -> str:
+    # batch renders wait out a busy pool instead of failing the whole batch
+    while True:
+        try:
+            return await ensure_report(data, date_str)
+        except PoolBusy as e:
+            await asyncio.sleep(e.retry_after)
+
+
+class ReportBatch(BaseModel):
+    reports: list[dict] = Field(..., min_length=1, max_length=config.REPORT_BATCH_MAX)
+    format: Literal["zip", "pdf"] = "zip"
+
+
+async def stream_report_zip(items: list, date_str: str):
+    # renders run at most `window` reports ahead of the zip writer, so memory
+    # stays flat however long the batch is; entries keep the request order
+    window = report_pool.size * 2
+    sink = ZipSink()
+    archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED)
+    pending = deque()
+    todo = iter(enumerate(items, start=1))
+    errors = []
+
+    def fill():
+        while len(pending) < window:
+            entry = next(todo, None)
+            if entry is None:
+                return
+            index, data = entry
+            pending.append((index, asyncio.ensure_future(ensure_report_retrying(data, date_str))))
+
+    try:
+        fill()
+        while pending:
+            index, task = pending.popleft()
+            try:
+                filename = await task
+            except Exception as e:
+                errors.append(f"{index}: {e}")
+                fill()
+                continue
+            fill()
+            data = await run_in_threadpool(read_file, os.path.join(REPORT_DIR, filename))
+            archive.writestr(f"{index:03d}_{filename}", data)
+            yield sink.drain()
+
+        if errors:
+            archive.writestr("errors.txt", "\n".join(errors) + "\n")
+        archive.close()
+        yield sink.drain()
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@app.post("/generate_reports")
+async def generate_reports(batch: ReportBatch, request: Request):
+    date_str = report_date()
+    for index, data in enumerate(batch.reports, start=1):
+        try:
+            report_context(data, date_str)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Report {index}: {e}")
+
+    if batch.format == "zip":
+        return StreamingResponse(
+            stream_report_zip(batch.reports, date_str),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="reports.zip"'},
         )
-    elif exercise == "side_bend":
-        feedback = (
-            "Nice side bend!" if 15 < angle < 35 else "Bend slightly more to side."
+
+    if len(batch.reports) > config.REPORT_MERGE_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Merged PDFs are limited to {config.REPORT_MERGE_MAX} reports; use format=zip",
         )
+    try:
+        filename = await ensure_merged_report(batch.reports, date_str)
+    except (PoolBusy, PoolUnavailable) as e:
+        return pool_error_response(e, busy_status=503)
+    except TaskFailed as e:
+        print("generate_reports error:", e)
+        raise HTTPException(status_code=500, detail="Failed to render reports")
+
+    response = file_response(
+        request,
+        os.path.join(REPORT_DIR, filename),
+        media_type="application/pdf",
+        cache_control="private, max-age=31536000, immutable",
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
-    return feedback, score
 
+@app.api_route("/reports/{filename}", methods=["GET", "HEAD"])
+def get_report(filename: str, request: Request):
+    filepath = os.path.join(REPORT_DIR, filename)
+    if filename != os.path.basename(filename) or not os.path.isfile(filepath):
+        raise HTTPException(status_code=404, detail="Not found")
+    # a report name is derived from its contents, so it never changes
+    return file_response(
+        request,
+        filepath,
+        media_type="application/pdf",
+        cache_control="private, max-age=31536000, immutable",
+    )
 
-def draw_skeleton(image, landmarks, involved_names, color=(0, 255, 0)):
-    h, w = image.shape[:2]
-    involved_indices = []
-    for name in involved_names:
-        if name in mp_pose.PoseLandmark.__members__:
-            involved_indices.append(mp_pose.PoseLandmark[name].value)
 
-    for conn in mp_pose.POSE_CONNECTIONS:
-        a_idx = conn[0].value if hasattr(conn[0], "value") else conn[0]
-        b_idx = conn[1].value if hasattr(conn[1], "value") else conn[1]
-        if a_idx in involved_indices and b_idx in involved_indices:
-            a_point = landmarks[a_idx]
-            b_point = landmarks[b_idx]
-            if a_point.visibility > 0.5 and b_point.visibility > 0.5:
-                ax, ay = int(a_point.x * w), int(a_point.y * h)
-                bx, by = int(b_point.x * w), int(b_point.y * h)
-                cv2.line(image, (ax, ay), (bx, by), color, 3)
+class VideoUploadForm(BaseModel):
+    exercise_key: str
+    patient_name: str = "Somay Singh"
+    patient_id: str = "P-2025-001"
+    assigned_reps: int = 10
+    sets: int = 1
+    analysis_fps: float | None = Field(None, ge=0, le=240)
+    render: Literal["lazy", "eager"] | None = None
+    pose_tier: Literal["lite", "full", "heavy"] | None = None
+
+
+VIDEO_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file", "exercise_key"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        **VideoUploadForm.model_json_schema()["properties"],
+                    },
+                }
+            }
+        },
+    }
+}
 
-    for idx in involved_indices:
-        p = landmarks[idx]
-        if p.visibility > 0.5:
-            cx, cy = int(p.x * w), int(p.y * h)
-            cv2.circle(image, (cx, cy), 6, (255, 255, 0), -1)
 
-    return image
+async def receive_video(request: Request):
+    try:
+        fields, upload = await receive_upload(
+            request, VIDEO_DIR, config.MAX_UPLOAD_BYTES, config.UPLOAD_CHUNK_BYTES
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
+    try:
+        form = VideoUploadForm.model_validate(fields)
+    except ValidationError as e:
+        os.remove(upload["path"])
+        raise HTTPException(
+            status_code=422,
+            detail=e.errors(include_url=False, include_context=False),
+        )
+    return form, upload
 
-@app.post("/generate_report")
-async def generate_report(request: Request):
-    data = await request.json()
 
-    patient_name = data.get("patient_name", "Unknown Patient")
-    patient_id = data.get("patient_id", "N/A")
-    exercise = data.get("exercise", "Exercise")
-    exercise_key = data.get("exercise_key", "squat")
-
-    reps = int(data.get("reps", 0) or 0)
-    sets = int(data.get("sets", 1) or 1)
-    duration = float(data.get("duration", 0.0) or 0.0)
-    avg_time = float(data.get("avg_time", 0.0) or 0.0)
-    assigned_reps = int(data.get("assigned_reps", 0))
-
-    form_score = float(data.get("form_score", 0.0) or 0.0)
-    if form_score <= 1.0:
-        form_score = form_score * 100.0
-
-    medical_history = data.get(
-        "medical_history",
-        "History of hip replacement surgery. Currently undergoing physiotherapy "
-        "for post-surgical strength, mobility, and functional recovery of the "
-        "lower limb and hip region.",
+def enqueue_video(form: VideoUploadForm, upload: dict):
+    params = form.model_dump()
+    analysis_fps = form.analysis_fps
+    if analysis_fps is None:
+        analysis_fps = config.ANALYSIS_FPS
+    analysis_fps = analysis_fps or None
+    pose_tier = form.pose_tier or config.VIDEO_POSE_TIER
+
+    sha256 = upload["sha256"]
+    cached = job_store.find_cached(
+        sha256, form.exercise_key, analysis_fps, pose_tier, PIPELINE
     )
-    primary_goal = data.get(
-        "goal",
-        "Improve hip and knee strength, balance, and range of motion after hip "
-        "replacement surgery.",
+    if cached is not None:
+        # same clip, same settings: reuse the stored analysis; the upload
+        # is only a duplicate of the stored source, which the first job
+        # already holds
+        os.remove(upload["path"])
+        params["video_url"] = cached["params"]["video_url"]
+        params["processed_video_url"] = cached["params"]["processed_video_url"]
+        params["track_url"] = cached["params"].get("track_url")
+        return job_store.create_cached(cached, params)
+
+    if job_store.queued_count() >= config.JOB_QUEUE_LIMIT:
+        os.remove(upload["path"])
+        raise PoolBusy(video_pool.retry_after())
+
+    # the source is stored under its hash; what is derived from it is named
+    # by the hash and the settings, so neither can collide nor be repeated
+    ext = os.path.splitext(upload["filename"] or "video.mp4")[1]
+    input_name = blob_store.add_source(upload["path"], sha256, ext)
+    base = f"{sha256[:32]}_{variant(form.exercise_key, analysis_fps, pose_tier, PIPELINE)}"
+    processed_name = f"proc_{base}.mp4"
+    track_name = f"track_{base}.track"
+
+    params["video_url"] = f"/videos/{input_name}"
+    params["processed_video_url"] = f"/videos/{processed_name}"
+    params["track_url"] = f"/videos/{track_name}"
+    job = job_runner.submit(
+        "video",
+        {
+            "video_path": os.path.join(VIDEO_DIR, input_name),
+            "track_path": os.path.join(VIDEO_DIR, track_name),
+            "exercise_key": form.exercise_key,
+            "analysis_fps": analysis_fps,
+            "pose_tier": pose_tier,
+            "pipeline": PIPELINE,
+        },
+        params,
+        content_hash=sha256,
+        exercise_key=form.exercise_key,
     )
+    if (form.render or config.RENDER_MODE) == "eager":
+        run_in_background(render_when_done(job["id"], processed_name), "background render")
+    return job
 
-    date_str = datetime.now().strftime("%d %B %Y")
-
-    def make_bar(value: float, target: float, length: int = 18) -> str:
-        if target <= 0:
-            ratio = 0.0
-        else:
-            ratio = max(0.0, min(1.0, value / target))
-        filled = int(ratio * length)
-        return "[" + "#" * filled + "-" * (length - filled) + "]"
-
-    reps_target = assigned_reps
-    duration_target = 300.0
-    speed_target = 10.0
-    form_target = 100.0
-
-    reps_bar = make_bar(reps, assigned_reps or reps_target)
-    dur_bar = make_bar(duration, duration_target)
-    speed_bar = make_bar(avg_time, duration)
-    form_bar = make_bar(form_score, form_target)
-
-    if reps < 5:
-        reps_interp = "Low volume session"
-    elif reps < 15:
-        reps_interp = "Moderate volume session"
-    else:
-        reps_interp = "High volume session"
 
-    if duration < 20:
-        duration_interp = "Short session"
-    elif duration < 60:
-        duration_interp = "Typical session duration"
-    else:
-        duration_interp = "Extended session"
+def track_for(processed_name: str):
+    # proc_<name>.mp4 is rendered from track_<name>.track, whose header
+    # names the source video
+    raw_name = processed_name[len("proc_"):-len(".mp4")]
+    track_path = os.path.join(VIDEO_DIR, f"track_{raw_name}.track")
+    if not os.path.isfile(track_path):
+        return None
+    return track_path
 
-    if avg_time < 3:
-        speed_interp = "Slow and controlled"
-    elif avg_time < 7:
-        speed_interp = "Moderate tempo"
-    else:
-        speed_interp = "Fast-paced reps"
 
-    if form_score >= 85:
-        form_interp = "Excellent technique"
-    elif form_score >= 70:
-        form_interp = "Good technique"
-    else:
-        form_interp = "Technique needs improvement"
-
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    pdf.add_page()
-    pdf.set_font("Helvetica", "B", 16)
-    pdf.cell(
-        0,
-        10,
-        "Physiotherapy Exercise Session Report - TherapEase",
-        ln=1,
-        align="C",
+RENDITION_SUFFIXES = {"low": ".low.mp4", "thumbs": ".thumbs.jpg", "processed": ".mp4"}
+
+
+def renditions(processed_name: str) -> dict:
+    # everything one render writes next to proc_<name>.mp4
+    base = processed_name[:-len(".mp4")]
+    return {
+        "processed": processed_name,
+        "low": f"{base}{RENDITION_SUFFIXES['low']}",
+        "thumbs": f"{base}{RENDITION_SUFFIXES['thumbs']}",
+    }
+
+
+def rendered_from(filename: str):
+    # the proc_<name>.mp4 a rendered file belongs to, or None
+    if not filename.startswith("proc_"):
+        return None
+    for suffix in RENDITION_SUFFIXES.values():
+        if filename.endswith(suffix):
+            return f"{filename[:-len(suffix)]}.mp4"
+    return None
+
+
+def has_low_rendition(height) -> bool:
+    # a source no taller than VIDEO_LOW_HEIGHT is its own low rendition
+    return height is None or height > config.VIDEO_LOW_HEIGHT
+
+
+async def render_video(processed_name: str):
+    names = renditions(processed_name)
+    track_path = track_for(processed_name)
+    header = read_track_header(track_path) if track_path is not None else None
+    if not has_low_rendition(header and header["height"]):
+        del names["low"]
+    paths = {kind: os.path.join(VIDEO_DIR, name) for kind, name in names.items()}
+    if all(os.path.isfile(path) for path in paths.values()):
+        return paths["processed"]
+    if track_path is None:
+        return None
+
+    # the track is what a render needs; it counts as used, and stays put
+    # while this render's outputs make room
+    track_name = os.path.basename(track_path)
+    blob_store.touch(track_name)
+    await run_once(
+        processed_name,
+        lambda: video_pool.submit(
+            "render",
+            {
+                "video_path": os.path.join(VIDEO_DIR, header["video"]),
+                "track_path": track_path,
+                "processed_path": paths["processed"],
+                "low_path": paths.get("low"),
+                "thumbs_path": paths["thumbs"],
+            },
+            key=processed_name,
+        ),
     )
+    for name in names.values():
+        blob_store.add(name, "processed")
+    evict_videos(keep=[*names.values(), track_name])
+    return paths["processed"]
+
 
-    pdf.ln(4)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Patient Details", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.cell(0, 6, f"Name: {patient_name}", ln=1)
-    pdf.cell(0, 6, f"Patient ID: {patient_id}", ln=1)
-    pdf.cell(0, 6, f"Date of Report: {date_str}", ln=1)
-
-    pdf.ln(4)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Medical History", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.multi_cell(0, 5, medical_history)
-
-    pdf.ln(4)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Current Prescription", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.multi_cell(0, 5, "Primary Goal:")
-    pdf.multi_cell(0, 5, primary_goal)
-
-    pdf.ln(2)
-    pdf.multi_cell(0, 5, "Prescribed Exercises:")
-    pdf.multi_cell(
-        0,
-        5,
-        f"1. {exercise}\n"
-        f"   a. Sets: {sets}\n"
-        f"   b. Reps: target {reps} per session (or as prescribed)\n"
-        f"   c. Frequency: As advised by the physiotherapist\n"
-        f"   d. Notes: Maintain controlled motion and alignment throughout.",
+def evict_videos(keep=()):
+    removed = blob_store.evict(
+        config.VIDEO_CACHE_MAX_BYTES, config.VIDEO_CACHE_MAX_AGE_DAYS * 86400, keep
     )
+    if removed:
+        print(f"video store: evicted {len(removed)} rendered videos and tracks")
+
+
+async def render_when_done(job_id: str, processed_name: str):
+    job = await job_runner.wait(job_id)
+    if job is None or job["status"] != "done":
+        return
+    await render_video(processed_name)
+
+
+def video_response(job: dict):
+    params = job["params"]
+    summary = job["result"]
+    response = {
+        "video_url": params["video_url"],
+        "processed_video_url": params["processed_video_url"],
+        "exercise_key": params["exercise_key"],
+        "patient_name": params["patient_name"],
+        "patient_id": params["patient_id"],
+        "reps": summary["reps"],
+        "assigned_reps": params["assigned_reps"],
+        "sets": params["sets"],
+        "duration": summary["duration"],
+        "avg_time": summary["avg_time"],
+        "form_score": summary["form_score"],
+        "feedback_summary": summary["feedback_summary"],
+        "track_url": params.get("track_url"),
+        "pose_tier": summary.get("pose_tier"),
+        "history_id": summary.get("history_id"),
+    }
+    processed = renditions(os.path.basename(params["processed_video_url"]))
+    if has_low_rendition(summary.get("height")):
+        response["processed_video_low_url"] = f"/videos/{processed['low']}"
+    else:
+        response["processed_video_low_url"] = params["processed_video_url"]
+    response["thumbnails_url"] = f"/videos/{processed['thumbs']}"
+    response["thumbnail_count"] = config.THUMBNAIL_COUNT
+    return response
+
+
+def job_view(job: dict):
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "cached": job["cached"],
+        "progress": {
+            "frames_processed": job["frames_processed"],
+            "frames_total": job["frames_total"],
+            "fps": job["fps"],
+        },
+        "result": None,
+        "error": job["error"],
+    }
+    if job["status"] == "done":
+        view["result"] = video_response(job)
+    return view
 
-    pdf.add_page()
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Session Summary", ln=1)
-
-    pdf.set_font("Helvetica", "B", 11)
-    pdf.cell(60, 7, "Metric", border=1)
-    pdf.cell(60, 7, "Result", border=1)
-    pdf.cell(70, 7, "Interpretation", border=1, ln=1)
-
-    pdf.set_font("Helvetica", "", 10)
-    pdf.cell(60, 7, "Exercise", border=1)
-    pdf.cell(60, 7, exercise, border=1)
-    pdf.cell(70, 7, "Primary movement", border=1, ln=1)
-
-    pdf.cell(60, 7, "Repetitions", border=1)
-    pdf.cell(60, 7, f"{reps} / {assigned_reps}", border=1)
-    pdf.cell(70, 7, reps_interp, border=1, ln=1)
-
-    pdf.cell(60, 7, "Session Duration", border=1)
-    pdf.cell(60, 7, f"{duration:.1f} sec", border=1)
-    pdf.cell(70, 7, duration_interp, border=1, ln=1)
-
-    pdf.cell(60, 7, "Average Speed", border=1)
-    pdf.cell(60, 7, f"{avg_time:.2f}", border=1)
-    pdf.cell(70, 7, speed_interp, border=1, ln=1)
-
-    pdf.cell(60, 7, "Form Score", border=1)
-    pdf.cell(60, 7, f"{form_score:.1f} / 100", border=1)
-    pdf.cell(70, 7, form_interp, border=1, ln=1)
-
-    pdf.ln(6)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, f"Exercise Performance Overview ({exercise})", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.cell(0, 6, f"Repetitions ({reps})", ln=1)
-    pdf.set_font("Courier", "", 10)
-    pdf.cell(0, 5, f"{reps_bar}  {reps} / {assigned_reps} reps", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.cell(0, 6, f"Session Duration ({duration:.1f} sec)", ln=1)
-    pdf.set_font("Courier", "", 10)
-    pdf.cell(0, 5, f"{dur_bar}  {duration:.1f} / {duration_target:.0f} sec (Recommended)", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.cell(0, 6, f"Time per rep ({avg_time:.2f})", ln=1)
-    pdf.set_font("Courier", "", 10)
-    pdf.cell(0, 5, f"{speed_bar} {avg_time:.2f} / {duration:.1f} sec", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.cell(0, 6, f"Form Score ({form_score:.1f} / 100)", ln=1)
-    pdf.set_font("Courier", "", 10)
-    pdf.cell(0, 5, f"{form_bar}  technique quality", ln=1)
-
-    pdf.ln(6)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Therapist Remarks", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    remarks = (
-        "Patient tolerated the session well based on the metrics above. "
-        "Encourage continued focus on controlled, pain-free movement and "
-        "proper alignment. Adjust volume or intensity as needed based on "
-        "ongoing recovery and physiotherapist guidance."
+
+@app.post("/analyze_video", openapi_extra=VIDEO_UPLOAD_OPENAPI)
+async def analyze_video(request: Request):
+    form, upload = await receive_video(request)
+    try:
+        job = enqueue_video(form, upload)
+    except PoolBusy as e:
+        return pool_error_response(e, busy_status=503)
+
+    # the job keeps running (and its result stays cached) even if this
+    # client gives up waiting
+    job = await job_runner.wait(job["id"])
+    if job["status"] == "failed":
+        return JSONResponse({"detail": job["error"]}, status_code=job["error_code"])
+    return JSONResponse(video_response(job))
+
+
+@app.post(
+    "/jobs/analyze_video",
+    status_code=202,
+    openapi_extra=VIDEO_UPLOAD_OPENAPI,
+)
+async def submit_video_job(request: Request):
+    form, upload = await receive_video(request)
+    try:
+        job = enqueue_video(form, upload)
+    except PoolBusy as e:
+        return pool_error_response(e, busy_status=503)
+    return job_view(job)
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job_view(job)
+
+
+@app.api_route("/videos/{filename}", methods=["GET", "HEAD"])
+async def get_video(filename: str, request: Request):
+    if filename != os.path.basename(filename) or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    path = os.path.join(VIDEO_DIR, filename)
+    processed_name = rendered_from(filename)
+    if not os.path.isfile(path) and processed_name is not None:
+        try:
+            await render_video(processed_name)
+        except (PoolBusy, PoolUnavailable) as e:
+            return pool_error_response(e, busy_status=503)
+        except TaskFailed as e:
+            print("render error:", e)
+            raise HTTPException(status_code=500, detail="Failed to render video")
+
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    blob_store.touch(filename)
+    media_type = OCTET_STREAM if filename.endswith(".track") else None
+    # names are derived from content and settings, so a name never changes
+    # meaning; ranges and conditional requests are answered by FileResponse
+    return file_response(
+        request,
+        path,
+        media_type=media_type,
+        cache_control="private, max-age=31536000, immutable",
     )
-    pdf.multi_cell(0, 5, remarks)
 
-    filename = f"report_{patient_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    filepath = os.path.join(REPORT_DIR, filename)
-    pdf.output(filepath)
 
-    return {"url": f"/reports/{filename}"}
+def exercise_subset(landmarks, indices):
+    # group sessions stack one 33-row block per person
+    count = len(LANDMARK_NAMES)
+    return landmarks.reshape(-1, count, 4)[:, indices].reshape(-1, 4)
+
+
+def compact_landmarks_response(fmt: str, landmarks, indices, session):
+    # fixed order float32 rows of (x, y, z, visibility); "indices" maps rows
+    # back to PoseLandmark values when only the exercise subset is sent
+    count = 0 if landmarks is None else len(landmarks)
+    if fmt == "f32":
+        headers = {"X-Landmark-Count": str(count)}
+        if indices is not None:
+            headers["X-Landmark-Indices"] = ",".join(map(str, indices))
+        if session is not None:
+            headers["X-Session"] = json.dumps(session, separators=(",", ":"))
+        return Response(landmarks_bytes(landmarks), media_type=OCTET_STREAM, headers=headers)
+
+    body = {
+        "format": "f32",
+        "count": count,
+        "landmarks": base64.b64encode(landmarks_bytes(landmarks)).decode("ascii"),
+    }
+    if indices is not None:
+        body["indices"] = indices
+    if session is not None:
+        body["session"] = session
+    return body
 
 
-@app.get("/reports/{filename}")
-def get_report(filename: str):
-    filepath = os.path.join(REPORT_DIR, filename)
-    return FileResponse(filepath, media_type="application/pdf")
+class FrameRequest(BaseModel):
+    image_base64: str
+    exercise_key: str | None = None
+    session_id: str | None = None
+    patient_id: str | None = None
+    # end-to-end time the client can wait for a frame; under load the
+    # session switches to a lighter pose model to stay within it
+    latency_budget_ms: int | None = Field(None, ge=10, le=10000)
+    # group sessions: track up to this many people in the session's camera;
+    # landmarks then come back as one block of rows per person
+    num_poses: int = Field(1, ge=1, le=config.MAX_POSES)
 
 
-@app.post("/analyze_video")
-async def analyze_video(
-    file: UploadFile = File(...),
-    exercise_key: str = Form(...),
-    patient_name: str = Form("Somay Singh"),
-    patient_id: str = Form("P-2025-001"),
-    assigned_reps: int = Form(10),
-    sets: int = Form(1),
+@app.post("/analyze_frame")
+async def analyze_frame(
+    req: FrameRequest,
+    request: Request,
+    fmt: str | None = Query(None, alias="format"),
+    subset: str = Query("all"),
 ):
-    ext = os.path.splitext(file.filename or "video.mp4")[1]
-    raw_name = datetime.now().strftime("%Y%m%d_%H%M%S")
-    input_name = f"{raw_name}{ext}"
-    processed_name = f"proc_{raw_name}.mp4"
-
-    video_path = os.path.join(VIDEO_DIR, input_name)
-    processed_path = os.path.join(VIDEO_DIR, processed_name)
-
-    contents = await file.read()
-    with open(video_path, "wb") as f:
-        f.write(contents)
-
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        return JSONResponse({"detail": "Could not open video"}, status_code=400)
-
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640)
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480)
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(processed_path, fourcc, fps, (width, height))
-
-    start_time = time.time()
-    reps = 0
-    rep_times = []
-    last_rep_ts = None
-    form_scores = []
-    feedbacks = []
-    stage = None
-
-    involved_names = EXERCISES.get(exercise_key, [])
-
-    with mp_pose.Pose(
-        min_detection_confidence=0.6,
-        min_tracking_confidence=0.6,
-    ) as pose:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+    started = time.perf_counter()
+    try:
+        fmt = negotiate_format(fmt, request.headers.get("accept", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-            frame = cv2.resize(frame, (width, height))
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = pose.process(rgb)
+    try:
+        img_data = base64.b64decode(req.image_base64)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    decoded = time.perf_counter()
 
-            if not results.pose_landmarks:
-                out.write(frame)
-                continue
+    try:
+        result = await frame_pool.submit(
+            "frame",
+            {
+                "image": img_data,
+                "exercise_key": req.exercise_key,
+                "session_id": req.session_id,
+                "patient_id": req.patient_id,
+                "latency_budget_ms": req.latency_budget_ms,
+                "num_poses": req.num_poses,
+            },
+            key=req.session_id,
+        )
+    except (PoolBusy, PoolUnavailable) as e:
+        return pool_error_response(e)
+    except InvalidInput:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    except TaskFailed as e:
+        print("analyze_frame error:", e)
+        raise HTTPException(status_code=500, detail="Failed to process frame")
+
+    pooled = time.perf_counter()
+    landmarks = result["landmarks"]
+    indices = None
+    if subset == "exercise" and req.exercise_key in EXERCISE_INDICES:
+        indices = EXERCISE_INDICES[req.exercise_key]
+        if landmarks is not None:
+            landmarks = exercise_subset(landmarks, indices)
+
+    if fmt != "json":
+        response = compact_landmarks_response(fmt, landmarks, indices, result["session"])
+        if isinstance(response, dict):
+            response = JSONResponse(response)
+        return finish_frame(req.session_id, landmarks, started, decoded, pooled, response)
+
+    names = LANDMARK_NAMES if indices is None else [LANDMARK_NAMES[i] for i in indices]
+    poses = []
+    if landmarks is not None:
+        for block in range(0, len(landmarks), len(names)):
+            keypoints = []
+            for name, (x, y, _, visibility) in zip(
+                names, landmarks[block:block + len(names)].tolist()
+            ):
+                keypoints.append(
+                    {
+                        "name": name,
+                        "x": x,          # still normalized 0–1
+                        "y": y,
+                        "score": visibility,
+                    }
+                )
+            poses.append({"keypoints": keypoints})
+
+    response = {"pose": poses[0] if poses else {"keypoints": []}}
+    if req.num_poses > 1:
+        # one entry per person, in the order of session["people"]
+        response["poses"] = poses
+    if result["session"] is not None:
+        response["session"] = result["session"]
+    return finish_frame(
+        req.session_id, landmarks, started, decoded, pooled, JSONResponse(response)
+    )
 
-            lm = results.pose_landmarks.landmark
-
-            angles = []
-            if exercise_key in ["bicep_curl", "shoulder_abduction"]:
-                for side in ["LEFT", "RIGHT"]:
-                    shoulder = [
-                        lm[mp_pose.PoseLandmark[f"{side}_SHOULDER"].value].x,
-                        lm[mp_pose.PoseLandmark[f"{side}_SHOULDER"].value].y,
-                    ]
-                    elbow = [
-                        lm[mp_pose.PoseLandmark[f"{side}_ELBOW"].value].x,
-                        lm[mp_pose.PoseLandmark[f"{side}_ELBOW"].value].y,
-                    ]
-                    wrist = [
-                        lm[mp_pose.PoseLandmark[f"{side}_WRIST"].value].x,
-                        lm[mp_pose.PoseLandmark[f"{side}_WRIST"].value].y,
-                    ]
-                    angles.append(calculate_angle(shoulder, elbow, wrist))
-            elif exercise_key in ["squat", "knee_extension", "leg_raise"]:
-                for side in ["LEFT", "RIGHT"]:
-                    hip = [
-                        lm[mp_pose.PoseLandmark[f"{side}_HIP"].value].x,
-                        lm[mp_pose.PoseLandmark[f"{side}_HIP"].value].y,
-                    ]
-                    knee = [
-                        lm[mp_pose.PoseLandmark[f"{side}_KNEE"].value].x,
-                        lm[mp_pose.PoseLandmark[f"{side}_KNEE"].value].y,
-                    ]
-                    ankle = [
-                        lm[mp_pose.PoseLandmark[f"{side}_ANKLE"].value].x,
-                        lm[mp_pose.PoseLandmark[f"{side}_ANKLE"].value].y,
-                    ]
-                    angles.append(calculate_angle(hip, knee, ankle))
-            elif exercise_key == "side_bend":
-                left_shoulder = [
-                    lm[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                    lm[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y,
-                ]
-                right_shoulder = [
-                    lm[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                    lm[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y,
-                ]
-                left_hip = [
-                    lm[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                    lm[mp_pose.PoseLandmark.LEFT_HIP.value].y,
-                ]
-                right_hip = [
-                    lm[mp_pose.PoseLandmark.RIGHT_HIP.value].x,
-                    lm[mp_pose.PoseLandmark.RIGHT_HIP.value].y,
-                ]
-                angles.append(calculate_angle(left_shoulder, left_hip, right_hip))
-                angles.append(calculate_angle(right_shoulder, right_hip, left_hip))
-
-            if angles:
-                angle = float(np.mean(angles))
-                feedback, score = assess_form(exercise_key, angle)
-                form_scores.append(score)
-                feedbacks.append(feedback)
-            else:
-                angle = 0.0
-
-            down_thresh, up_thresh = 100, 160
-            if exercise_key in ["bicep_curl", "shoulder_abduction"]:
-                if angle > 150:
-                    stage = "down"
-                if angle < 50 and stage == "down":
-                    stage = "up"
-                    reps += 1
-                    now = time.time()
-                    if last_rep_ts:
-                        rep_times.append(now - last_rep_ts)
-                    last_rep_ts = now
-            elif exercise_key in ["squat", "knee_extension", "leg_raise"]:
-                if angle > up_thresh:
-                    stage = "up"
-                if angle < down_thresh and stage == "up":
-                    stage = "down"
-                    reps += 1
-                    now = time.time()
-                    if last_rep_ts:
-                        rep_times.append(now - last_rep_ts)
-                    last_rep_ts = now
-            elif exercise_key == "side_bend":
-                if angle > 40:
-                    stage = "up"
-                if angle < 25 and stage == "up":
-                    stage = "down"
-                    reps += 1
-                    now = time.time()
-                    if last_rep_ts:
-                        rep_times.append(now - last_rep_ts)
-                    last_rep_ts = now
-
-            frame = draw_skeleton(frame, lm, involved_names)
-            out.write(frame)
-
-    cap.release()
-    out.release()
-
-    duration = time.time() - start_time
-    avg_time = float(np.mean(rep_times)) if rep_times else 0.0
-    avg_score = float(np.mean(form_scores)) if form_scores else 0.0
-    feedback_summary = ", ".join(sorted(set(feedbacks))) if feedbacks else ""
 
+def finish_frame(session_id, landmarks, started, decoded, pooled, response):
+    # the response is serialised by now, so the last stage is measured too
+    done = time.perf_counter()
+    timings = {
+        "b64decode": decoded - started,
+        "pool": pooled - decoded,
+        "serialize": done - pooled,
+    }
+    for stage in ("b64decode", "serialize"):
+        METRICS.observe("stage_seconds", timings[stage], pool="frame", task="frame", stage=stage)
+    METRICS.observe("request_seconds", done - started, endpoint="analyze_frame")
+    log_frame("analyze_frame", session_id, landmarks, timings)
+    return response
+
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    try:
+        summary = await frame_pool.submit(
+            "end_session", {"session_id": session_id}, key=session_id
+        )
+    except (PoolBusy, PoolUnavailable) as e:
+        return pool_error_response(e)
+
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return record_live_session(summary)
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+def healthz():
+    # liveness: the event loop answers and the pools have not been stopped;
+    # dead workers are restarted by their pool, so they do not fail this
+    pools = {pool.name: pool.status() for pool in POOLS}
+    alive = all(status["running"] for status in pools.values())
     return JSONResponse(
-        {
-            "video_url": f"/videos/{input_name}",
-            "processed_video_url": f"/videos/{processed_name}",
-            "exercise_key": exercise_key,
-            "patient_name": patient_name,
-            "patient_id": patient_id,
-            "reps": reps,
-            "assigned_reps": int(assigned_reps),
-            "sets": int(sets),
-            "duration": duration,
-            "avg_time": avg_time,
-            "form_score": avg_score,
-            "feedback_summary": feedback_summary,
-        }
+        {"status": "ok" if alive else "stopped", "pools": pools},
+        status_code=200 if alive else 503,
     )
 
 
-class FrameRequest(BaseModel):
-    image_base64: str
-    exercise_key: str | None = None
+@app.get("/readyz")
+def readyz():
+    # readiness: every worker has finished warming up and jobs are running
+    pools = {pool.name: pool.status() for pool in POOLS}
+    ready = all(pool.ready() for pool in POOLS) and job_runner.running()
+    return JSONResponse(
+        {"status": "ready" if ready else "warming", "pools": pools},
+        status_code=200 if ready else 503,
+    )
 
-@app.post("/analyze_frame")
-async def analyze_frame(req: FrameRequest):
-    try:
-        print("analyze_frame called, exercise_key =", req.exercise_key)
 
-        img_data = base64.b64decode(req.image_base64)
-        nparr = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if frame is None:
-            print("Failed to decode frame in analyze_frame")
-            raise HTTPException(status_code=400, detail="Invalid image data")
-
-        # 🔹 downscale large frames to speed up pose
-        h, w = frame.shape[:2]
-        max_side = 480
-        scale = max_side / max(h, w)
-        if scale < 1.0:
-            frame = cv2.resize(
-                frame,
-                (int(w * scale), int(h * scale)),
-                interpolation=cv2.INTER_AREA,
-            )
+@app.get("/patients/{patient_id}/progress")
+def patient_progress(
+    patient_id: str,
+    exercise_key: str | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    period: Literal["day", "week", "month"] = "week",
+):
+    return {
+        "patient_id": patient_id,
+        "period": period,
+        "exercises": history_store.progress(
+            patient_id, exercise_key, since, until, period
+        ),
+    }
 
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose_detector.process(rgb)
-
-        if not results.pose_landmarks:
-            print("No pose detected in analyze_frame")
-            return {"pose": {"keypoints": []}}
-
-        keypoints = []
-        for idx, lm in enumerate(results.pose_landmarks.landmark):
-            name = mp_pose.PoseLandmark(idx).name.lower()
-            keypoints.append(
-                {
-                    "name": name,
-                    "x": float(lm.x),          # still normalized 0–1
-                    "y": float(lm.y),
-                    "score": float(lm.visibility),
-                }
+
+@app.websocket("/ws/live")
+async def live_socket(websocket: WebSocket):
+    await websocket.accept()
+
+    context = {
+        "session_id": f"ws-{uuid.uuid4().hex}",
+        "exercise_key": None,
+        "patient_id": None,
+        "latency_budget_ms": None,
+        "num_poses": 1,
+    }
+    latest = {"frame": None, "dropped": 0}
+    ready = asyncio.Event()
+
+    def apply_header(header: dict):
+        if header.get("session_id"):
+            context["session_id"] = str(header["session_id"])
+        if header.get("exercise_key"):
+            context["exercise_key"] = str(header["exercise_key"])
+        if header.get("patient_id"):
+            context["patient_id"] = str(header["patient_id"])
+        if header.get("latency_budget_ms"):
+            try:
+                budget = int(header["latency_budget_ms"])
+            except (TypeError, ValueError):
+                budget = None
+            context["latency_budget_ms"] = budget and min(max(budget, 10), 10000)
+        if header.get("num_poses"):
+            try:
+                num_poses = int(header["num_poses"])
+            except (TypeError, ValueError):
+                num_poses = 1
+            context["num_poses"] = min(max(num_poses, 1), config.MAX_POSES)
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") is not None:
+                try:
+                    apply_header(json.loads(message["text"]))
+                except (ValueError, AttributeError):
+                    await websocket.send_bytes(pack_message({"error": "invalid header"}))
+                continue
+
+            try:
+                header, jpeg = unpack_message(message.get("bytes") or b"")
+            except ValueError as e:
+                await websocket.send_bytes(pack_message({"error": str(e)}))
+                continue
+
+            # only the newest frame is worth analysing; anything still waiting
+            # when a fresh one arrives is stale and gets dropped
+            if latest["frame"] is not None:
+                latest["dropped"] += 1
+                METRICS.inc("frames_dropped_total")
+            latest["frame"] = (header, jpeg, time.perf_counter())
+            ready.set()
+
+    async def process_frames():
+        while True:
+            await ready.wait()
+            ready.clear()
+            header, jpeg, received = latest["frame"]
+            latest["frame"] = None
+            apply_header(header)
+
+            reply = {
+                "seq": header.get("seq"),
+                "ts": header.get("ts"),
+                "session_id": context["session_id"],
+                "dropped": latest["dropped"],
+            }
+            landmarks = None
+            try:
+                result = await frame_pool.submit(
+                    "frame",
+                    {
+                        "image": jpeg,
+                        "exercise_key": context["exercise_key"],
+                        "session_id": context["session_id"],
+                        "patient_id": context["patient_id"],
+                        "latency_budget_ms": context["latency_budget_ms"],
+                        "num_poses": context["num_poses"],
+                    },
+                    key=context["session_id"],
+                )
+            except PoolBusy as e:
+                reply.update({"error": "busy", "retry_after": e.retry_after})
+            except PoolUnavailable:
+                reply["error"] = "unavailable"
+            except InvalidInput:
+                reply["error"] = "invalid image"
+            except TaskFailed:
+                reply["error"] = "failed"
+            else:
+                landmarks = result["landmarks"]
+                if result["session"] is not None:
+                    reply.update(result["session"])
+
+            pooled = time.perf_counter()
+            reply["n"] = 0 if landmarks is None else len(landmarks)
+            reply["server_ms"] = round((pooled - received) * 1000.0, 2)
+            message = pack_message(reply, landmarks_bytes(landmarks))
+            done = time.perf_counter()
+            METRICS.observe(
+                "stage_seconds", done - pooled, pool="frame", task="frame", stage="serialize"
             )
+            METRICS.observe("request_seconds", done - received, endpoint="ws_live")
+            log_frame(
+                "ws_live",
+                context["session_id"],
+                landmarks,
+                {"pool": pooled - received, "serialize": done - pooled},
+            )
+            await websocket.send_bytes(message)
 
-        print("Returning", len(keypoints), "keypoints from analyze_frame")
-        return {"pose": {"keypoints": keypoints}}
-    except Exception as e:
-        print("analyze_frame error:", e)
-        raise HTTPException(status_code=500, detail="Failed to process frame")
\ No newline at end of file
+    tasks = {
+        asyncio.create_task(receive_frames()),
+        asyncio.create_task(process_frames()),
+    }
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print("live socket error:", e)
+        try:
+            summary = await frame_pool.submit(
+                "end_session",
+                {"session_id": context["session_id"]},
+                key=context["session_id"],
+            )
+        except Exception:
+            summary = None
+        record_live_session(summary)
@@ -0,0 +1,128 @@
+import bisect
+import json
+
+import numpy as np
+
+# Exercises are defined in exercises.json and compiled once at startup:
+#   reps      -> a two-state machine; each state has one (sign, threshold,
+#                next state, counts) transition, so an update is one lookup
+#                and one comparison. "hysteresis" widens both thresholds.
+#   feedback  -> ordered rules ({"above", "below", "text"}, first match wins)
+#                flattened into sorted angle edges with a feedback index per
+#                interval and per edge, looked up with a binary search.
+IDLE, ARMED, COUNTED = 0, 1, 2
+
+
+class Exercise:
+    def __init__(self, key, definition, default, landmark_index, connections):
+        self.key = key
+
+        try:
+            self.landmarks = list(definition.get("landmarks", []))
+            self.indices = sorted(landmark_index[name] for name in self.landmarks)
+            self.triplets = np.array(
+                [[landmark_index[name] for name in joint] for joint in definition.get("joints", [])],
+                dtype=np.intp,
+            ).reshape(-1, 3)
+        except KeyError as e:
+            raise ValueError(f"exercise {key!r}: unknown landmark {e.args[0]!r}")
+        members = set(self.indices)
+        self.connections = [
+            (int(a), int(b)) for a, b in connections if a in members and b in members
+        ]
+
+        self.stages = None
+        self.transitions = None
+        reps = definition.get("reps")
+        if reps is not None:
+            hysteresis = float(reps.get("hysteresis", 0))
+            arm = (1.0, float(reps["arm_above"]) + hysteresis, ARMED, False)
+            count = (-1.0, float(reps["count_below"]) - hysteresis, COUNTED, True)
+            self.stages = (None, reps["armed_stage"], reps["counted_stage"])
+            self.transitions = (arm, count, arm)
+
+        self.ideal_min, self.ideal_max = definition.get("ideal_range", default["ideal_range"])
+        self.score_falloff = float(definition.get("score_falloff", default["score_falloff"]))
+        self._compile_feedback(
+            definition.get("feedback", default["feedback"]), default["feedback"]
+        )
+
+    def _compile_feedback(self, rules, fallback):
+        rules = list(rules) + list(fallback)
+        self.feedback_texts = [rule["text"] for rule in rules]
+        self.edges = sorted(
+            {
+                float(rule[bound])
+                for rule in rules
+                for bound in ("above", "below")
+                if bound in rule
+            }
+        )
+
+        # one probe angle per region: (-inf, e0), e0, (e0, e1), e1, ..., (ek, inf)
+        probes = []
+        for i, edge in enumerate(self.edges):
+            low = self.edges[i - 1] if i else edge - 1.0
+            probes += [(low + edge) / 2, edge]
+        probes.append(self.edges[-1] + 1.0 if self.edges else 0.0)
+
+        self.feedback_table = np.array(
+            [
+                next(i for i, rule in enumerate(rules) if _matches(rule, angle))
+                for angle in probes
+            ],
+            dtype=np.intp,
+        )
+        self._edges = np.array(self.edges, dtype=np.float64)
+
+    def feedback_index(self, angle: float) -> int:
+        i = bisect.bisect_left(self.edges, angle)
+        on_edge = i < len(self.edges) and self.edges[i] == angle
+        return int(self.feedback_table[2 * i + on_edge])
+
+    def score(self, angle: float) -> float:
+        diff = max(self.ideal_min - angle, angle - self.ideal_max, 0)
+        return max(0.0, 1.0 - diff / self.score_falloff)
+
+    def assess(self, angle: float):
+        return self.feedback_texts[self.feedback_index(angle)], self.score(angle)
+
+    def assess_many(self, angles):
+        # vectorised assess() over a whole angle track: returns feedback
+        # indices into feedback_texts and form scores
+        angles = np.asarray(angles, dtype=np.float64)
+        i = np.searchsorted(self._edges, angles, side="left")
+        on_edge = np.zeros(angles.shape, dtype=bool)
+        if len(self._edges):
+            on_edge = (i < len(self._edges)) & (
+                self._edges[np.minimum(i, len(self._edges) - 1)] == angles
+            )
+        feedback = self.feedback_table[2 * i + on_edge]
+        diff = np.maximum.reduce(
+            [self.ideal_min - angles, angles - self.ideal_max, np.zeros_like(angles)]
+        )
+        scores = np.maximum(0.0, 1.0 - diff / self.score_falloff)
+        return feedback, scores
+
+
+def _matches(rule: dict, angle: float) -> bool:
+    if "above" in rule and not angle > rule["above"]:
+        return False
+    if "below" in rule and not angle < rule["below"]:
+        return False
+    return True
+
+
+def load_exercises(path: str, landmark_index: dict, connections):
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    default_definition = spec["default"]
+    if not any(set(rule) == {"text"} for rule in default_definition["feedback"]):
+        raise ValueError("default feedback needs a catch-all rule")
+
+    default = Exercise(None, {}, default_definition, landmark_index, connections)
+    exercises = {
+        key: Exercise(key, definition, default_definition, landmark_index, connections)
+        for key, definition in spec["exercises"].items()
+    }
+    return exercises, default
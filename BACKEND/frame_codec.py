@@ -0,0 +1,46 @@
+import json
+import struct
+
+import numpy as np
+
+# binary frames on /ws/live are: uint16 header length (big endian), a small
+# JSON header, then the payload (JPEG bytes in, float32 landmarks out)
+HEADER_LEN = struct.Struct("!H")
+
+
+def unpack_message(data: bytes):
+    if len(data) < HEADER_LEN.size:
+        raise ValueError("Truncated message")
+    (size,) = HEADER_LEN.unpack_from(data)
+    start = HEADER_LEN.size
+    if len(data) < start + size:
+        raise ValueError("Truncated header")
+    header = json.loads(data[start:start + size]) if size else {}
+    if not isinstance(header, dict):
+        raise ValueError("Header must be a JSON object")
+    return header, data[start + size:]
+
+
+def pack_message(header: dict, payload: bytes = b"") -> bytes:
+    raw = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return HEADER_LEN.pack(len(raw)) + raw + payload
+
+
+LANDMARK_FORMATS = ("json", "f32", "b64")
+OCTET_STREAM = "application/octet-stream"
+
+
+def negotiate_format(requested: str | None, accept: str) -> str:
+    if requested:
+        if requested not in LANDMARK_FORMATS:
+            raise ValueError(f"Unknown format {requested!r}")
+        return requested
+    if OCTET_STREAM in accept:
+        return "f32"
+    return "json"
+
+
+def landmarks_bytes(landmarks) -> bytes:
+    if landmarks is None:
+        return b""
+    return np.ascontiguousarray(landmarks, dtype="<f4").tobytes()
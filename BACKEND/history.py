@@ -0,0 +1,238 @@
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    patient_name TEXT,
+    exercise_key TEXT NOT NULL,
+    source TEXT NOT NULL,
+    job_id TEXT,
+    created_at REAL NOT NULL,
+    duration REAL NOT NULL DEFAULT 0,
+    reps INTEGER NOT NULL DEFAULT 0,
+    assigned_reps INTEGER,
+    sets INTEGER,
+    avg_time REAL NOT NULL DEFAULT 0,
+    form_score REAL NOT NULL DEFAULT 0,
+    rom_min REAL,
+    rom_max REAL,
+    angle_count INTEGER NOT NULL DEFAULT 0,
+    angles BLOB
+);
+CREATE INDEX IF NOT EXISTS sessions_patient
+    ON sessions (patient_id, exercise_key, created_at);
+"""
+
+PERIODS = {
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+
+# per-exercise aggregates; the trends are least-squares slopes per week,
+# computed from running sums so SQLite does it in one pass over the index,
+# and only reported once the sessions span at least a day
+SUMMARY_SQL = """
+SELECT
+    exercise_key,
+    COUNT(*) AS sessions,
+    SUM(reps) AS total_reps,
+    AVG(form_score) AS avg_form_score,
+    MAX(form_score) AS best_form_score,
+    AVG(NULLIF(avg_time, 0)) AS avg_rep_time,
+    AVG(rom) AS avg_rom,
+    MAX(rom) AS best_rom,
+    MIN(created_at) AS first_session,
+    MAX(created_at) AS last_session,
+    CASE WHEN MAX(created_at) - MIN(created_at) >= 86400 THEN
+        (COUNT(*) * SUM(w * form_score) - SUM(w) * SUM(form_score))
+        / NULLIF(COUNT(*) * SUM(w * w) - SUM(w) * SUM(w), 0)
+    END AS form_trend,
+    CASE WHEN MAX(wr) - MIN(wr) >= 1 / 7.0 THEN
+        (COUNT(rom) * SUM(wr * rom) - SUM(wr) * SUM(rom))
+        / NULLIF(COUNT(rom) * SUM(wr * wr) - SUM(wr) * SUM(wr), 0)
+    END AS rom_trend
+FROM (
+    SELECT
+        exercise_key, reps, form_score, avg_time, created_at,
+        rom_max - rom_min AS rom,
+        (created_at - ?) / 604800.0 AS w,
+        CASE WHEN rom_max IS NOT NULL THEN (created_at - ?) / 604800.0 END AS wr
+    FROM sessions
+    WHERE {where}
+)
+GROUP BY exercise_key
+ORDER BY exercise_key
+"""
+
+BUCKETS_SQL = """
+SELECT
+    exercise_key,
+    strftime(?, created_at, 'unixepoch') AS period,
+    COUNT(*) AS sessions,
+    SUM(reps) AS reps,
+    AVG(form_score) AS avg_form_score,
+    AVG(NULLIF(avg_time, 0)) AS avg_rep_time,
+    AVG(rom_max - rom_min) AS avg_rom
+FROM sessions
+WHERE {where}
+GROUP BY exercise_key, period
+ORDER BY exercise_key, period
+"""
+
+
+def encode_series(timestamps, angles) -> bytes:
+    # millisecond deltas as uint32 plus float16 degrees, zlib-compressed;
+    # sampled series are near-regular so the deltas compress very well
+    ms = np.round(np.asarray(timestamps, dtype=np.float64) * 1000.0).astype(np.int64)
+    deltas = np.diff(ms, prepend=0).clip(0, 2**32 - 1).astype("<u4")
+    values = np.asarray(angles, dtype="<f2")
+    return zlib.compress(deltas.tobytes() + values.tobytes(), 6)
+
+
+def decode_series(blob: bytes, count: int):
+    raw = zlib.decompress(blob)
+    deltas = np.frombuffer(raw[: count * 4], dtype="<u4")
+    values = np.frombuffer(raw[count * 4:], dtype="<f2")
+    return np.cumsum(deltas) / 1000.0, values.astype(np.float32)
+
+
+class SessionStore:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, summary: dict, series=None) -> str:
+        session_id = uuid.uuid4().hex
+        count = 0
+        blob = None
+        rom_min = rom_max = None
+        if series is not None and len(series[1]):
+            timestamps, angles = series
+            count = len(angles)
+            blob = encode_series(timestamps, angles)
+            rom_min = float(np.min(angles))
+            rom_max = float(np.max(angles))
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sessions (id, patient_id, patient_name, exercise_key, "
+                "source, job_id, created_at, duration, reps, assigned_reps, sets, "
+                "avg_time, form_score, rom_min, rom_max, angle_count, angles) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    summary["patient_id"],
+                    summary.get("patient_name"),
+                    summary["exercise_key"],
+                    summary["source"],
+                    summary.get("job_id"),
+                    summary.get("created_at") or time.time(),
+                    float(summary.get("duration", 0.0)),
+                    int(summary.get("reps", 0)),
+                    summary.get("assigned_reps"),
+                    summary.get("sets"),
+                    float(summary.get("avg_time", 0.0)),
+                    float(summary.get("form_score", 0.0)),
+                    rom_min,
+                    rom_max,
+                    count,
+                    blob,
+                ),
+            )
+        return session_id
+
+    def find_session(self, patient_id: str, exercise_key: str, session_id: str | None = None):
+        # the given session, or the patient's latest for the exercise
+        sql = (
+            "SELECT id, created_at, angle_count, angles FROM sessions "
+            "WHERE patient_id = ? AND exercise_key = ?"
+        )
+        args = [patient_id, exercise_key]
+        if session_id:
+            sql += " AND id = ?"
+            args.append(session_id)
+        with self._lock:
+            row = self._conn.execute(
+                sql + " ORDER BY created_at DESC LIMIT 1", args
+            ).fetchone()
+        return None if row is None else dict(row)
+
+    def patient_sessions(self, patient_id: str, exercise_key: str):
+        # (created_at, reps, form_score, rom) of every session, oldest
+        # first, as float arrays; rom is NaN without an angle series
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT created_at, reps, form_score, rom_max - rom_min FROM sessions "
+                "WHERE patient_id = ? AND exercise_key = ? ORDER BY created_at",
+                (patient_id, exercise_key),
+            ).fetchall()
+        columns = np.array([tuple(row) for row in rows], dtype=np.float64).reshape(-1, 4)
+        return columns.T
+
+    def history_mark(self, patient_id: str, exercise_key: str) -> str:
+        # changes whenever a session is added, so anything drawn from the
+        # history can be keyed on it
+        with self._lock:
+            count, last = self._conn.execute(
+                "SELECT COUNT(*), MAX(created_at) FROM sessions "
+                "WHERE patient_id = ? AND exercise_key = ?",
+                (patient_id, exercise_key),
+            ).fetchone()
+        return f"{count}:{last or 0:.3f}"
+
+    def progress(
+        self,
+        patient_id: str,
+        exercise_key: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        period: str = "week",
+    ):
+        where = ["patient_id = ?"]
+        args = [patient_id]
+        if exercise_key:
+            where.append("exercise_key = ?")
+            args.append(exercise_key)
+        if since is not None:
+            where.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            args.append(until)
+        where = " AND ".join(where)
+
+        with self._lock:
+            first = self._conn.execute(
+                f"SELECT MIN(created_at) FROM sessions WHERE {where}", args
+            ).fetchone()[0]
+            if first is None:
+                return []
+            summaries = self._conn.execute(
+                SUMMARY_SQL.format(where=where), [first, first] + args
+            ).fetchall()
+            buckets = self._conn.execute(
+                BUCKETS_SQL.format(where=where), [PERIODS[period]] + args
+            ).fetchall()
+
+        exercises = {row["exercise_key"]: dict(row, periods=[]) for row in summaries}
+        for row in buckets:
+            bucket = dict(row)
+            exercises[bucket.pop("exercise_key")]["periods"].append(bucket)
+        return list(exercises.values())
@@ -0,0 +1,365 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from pose_pool import InvalidInput, PoolBusy, PoolUnavailable, TaskFailed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    content_hash TEXT,
+    exercise_key TEXT,
+    payload TEXT NOT NULL,
+    params TEXT NOT NULL,
+    frames_processed INTEGER NOT NULL DEFAULT 0,
+    frames_total INTEGER NOT NULL DEFAULT 0,
+    fps REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    error_code INTEGER,
+    cached INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_cache ON jobs (content_hash, exercise_key, status);
+CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (status, updated_at);
+"""
+
+FINISHED = ("done", "failed")
+
+
+class JobStore:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, args=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, args)
+
+    def _row(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cached"] = bool(job["cached"])
+        return job
+
+    def create(self, kind, payload, params, content_hash=None, exercise_key=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, content_hash, exercise_key, "
+            "payload, params, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (
+                job_id,
+                kind,
+                content_hash,
+                exercise_key,
+                json.dumps(payload),
+                json.dumps(params),
+                now,
+                now,
+            ),
+        )
+        return self.get(job_id)
+
+    def create_cached(self, source: dict, params: dict):
+        # the job it copies is touched as well, so it does not expire while
+        # its result is still being reused
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET updated_at = ? WHERE id = ?", (now, source["id"])
+        )
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, content_hash, exercise_key, "
+            "payload, params, frames_processed, frames_total, fps, result, "
+            "cached, created_at, updated_at) "
+            "VALUES (?, ?, 'done', ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)",
+            (
+                job_id,
+                source["kind"],
+                source["content_hash"],
+                source["exercise_key"],
+                json.dumps(source["payload"]),
+                json.dumps(params),
+                source["frames_processed"],
+                source["frames_total"],
+                source["fps"],
+                json.dumps(source["result"]),
+                now,
+                now,
+            ),
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def find_cached(
+        self,
+        content_hash: str,
+        exercise_key: str,
+        analysis_fps=None,
+        pose_tier=None,
+        pipeline=None,
+    ):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE content_hash = ? AND exercise_key = ? "
+                "AND json_extract(payload, '$.analysis_fps') IS ? "
+                "AND json_extract(payload, '$.pose_tier') IS ? "
+                "AND json_extract(payload, '$.pipeline') IS ? "
+                "AND status = 'done' AND cached = 0 ORDER BY created_at",
+                (content_hash, exercise_key, analysis_fps, pose_tier, pipeline),
+            ).fetchall()
+        # a result is only reusable while its track is there to render from;
+        # tracks can be evicted
+        for row in rows:
+            job = self._row(row)
+            track_path = job["payload"].get("track_path")
+            if track_path is None or os.path.isfile(track_path):
+                return job
+        return None
+
+    def find_cached_for(self, job: dict):
+        # a finished job with the same input and settings as this one
+        payload = job["payload"]
+        return self.find_cached(
+            job["content_hash"],
+            job["exercise_key"],
+            payload.get("analysis_fps"),
+            payload.get("pose_tier"),
+            payload.get("pipeline"),
+        )
+
+    def queued_count(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+            ).fetchone()
+        return row[0]
+
+    def claim_next(self):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' "
+                "ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+        return self._row(row)
+
+    def requeue(self, job_id: str):
+        self._execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ?",
+            (time.time(), job_id),
+        )
+
+    def requeue_running(self):
+        # jobs interrupted by a restart go back on the queue
+        self._execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? "
+            "WHERE status = 'running'",
+            (time.time(),),
+        )
+
+    def update_progress(self, job_id: str, progress: dict):
+        self._execute(
+            "UPDATE jobs SET frames_processed = ?, frames_total = ?, fps = ?, "
+            "updated_at = ? WHERE id = ?",
+            (
+                int(progress.get("frames_processed", 0)),
+                int(progress.get("frames_total", 0)),
+                float(progress.get("fps", 0.0)),
+                time.time(),
+                job_id,
+            ),
+        )
+
+    def finish(self, job_id: str, result: dict):
+        frames = int(result.get("frames", 0))
+        self._execute(
+            "UPDATE jobs SET status = 'done', result = ?, frames_processed = ?, "
+            "frames_total = MAX(frames_total, ?), updated_at = ? WHERE id = ?",
+            (json.dumps(result), frames, frames, time.time(), job_id),
+        )
+
+    def finish_cached(self, job_id: str, source: dict):
+        self._execute(
+            "UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), source["id"])
+        )
+        self._execute(
+            "UPDATE jobs SET status = 'done', result = ?, frames_processed = ?, "
+            "frames_total = ?, fps = ?, cached = 1, updated_at = ? WHERE id = ?",
+            (
+                json.dumps(source["result"]),
+                source["frames_processed"],
+                source["frames_total"],
+                source["fps"],
+                time.time(),
+                job_id,
+            ),
+        )
+
+    def expire(self, before: float) -> list:
+        # deletes the finished jobs nobody has looked at since `before` and
+        # returns them, so what they held can be let go
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (before,),
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows]
+            )
+        return [self._row(row) for row in rows]
+
+    def fail(self, job_id: str, error: str, error_code: int):
+        self._execute(
+            "UPDATE jobs SET status = 'failed', error = ?, error_code = ?, "
+            "updated_at = ? WHERE id = ?",
+            (error, error_code, time.time(), job_id),
+        )
+
+
+class JobRunner:
+    def __init__(
+        self, store: JobStore, pool, concurrency: int, on_result=None, on_release=None
+    ):
+        self.store = store
+        self.pool = pool
+        self.concurrency = max(1, concurrency)
+        # on_result(job, result) -> result runs before a result is stored,
+        # e.g. to move bulky parts of it elsewhere; on_release(job) once a
+        # job has failed or turned out to repeat a finished one, so it can
+        # give up what it was holding for its own analysis
+        self.on_result = on_result
+        self.on_release = on_release
+        self._tasks = []
+        self._waiters = {}
+        self._wakeup = None
+
+    def start(self):
+        self.store.requeue_running()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, kind, payload, params, content_hash=None, exercise_key=None):
+        job = self.store.create(kind, payload, params, content_hash, exercise_key)
+        self._wakeup.set()
+        return job
+
+    async def wait(self, job_id: str):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            self._notify(job_id)
+        return await future
+
+    def _notify(self, job_id: str):
+        waiters = self._waiters.pop(job_id, [])
+        if not waiters:
+            return
+        job = self.store.get(job_id)
+        for future in waiters:
+            if not future.done():
+                future.set_result(job)
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            job = self.store.claim_next()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict):
+        job_id = job["id"]
+        if job["content_hash"] is not None:
+            # an identical upload queued behind this clip's first analysis
+            # picks up that result instead of repeating the work
+            cached = self.store.find_cached_for(job)
+            if cached is not None:
+                self.store.finish_cached(job_id, cached)
+                self._release(job)
+                self._notify(job_id)
+                return
+        try:
+            result = await self.pool.submit(
+                job["kind"],
+                job["payload"],
+                on_progress=lambda progress: self.store.update_progress(
+                    job_id, progress
+                ),
+            )
+        except (PoolBusy, PoolUnavailable) as e:
+            self.store.requeue(job_id)
+            await asyncio.sleep(getattr(e, "retry_after", 5))
+            return
+        except InvalidInput as e:
+            self.store.fail(job_id, str(e), 400)
+            self._release(job)
+        except TaskFailed as e:
+            self.store.fail(job_id, str(e), 500)
+            self._release(job)
+        except asyncio.CancelledError:
+            self.store.requeue(job_id)
+            raise
+        else:
+            if self.on_result is not None:
+                result = self.on_result(job, result)
+            self.store.finish(job_id, result)
+        self._notify(job_id)
+
+    def _release(self, job: dict):
+        if self.on_release is None:
+            return
+        try:
+            self.on_release(job)
+        except Exception as e:
+            print("job release hook failed:", e)
@@ -0,0 +1,150 @@
+import threading
+from bisect import bisect_left
+
+PREFIX = "therapease_"
+
+# seconds: sub-millisecond angle math up to multi-minute video jobs
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+
+HELP = {
+    "stage_seconds": "Time spent in one stage of a task",
+    "task_seconds": "Time from submitting a task to a pool to its result",
+    "queue_wait_seconds": "Time a task waited before a worker ran it",
+    "warmup_seconds": "Time from starting a worker to the end of its warm-up task",
+    "request_seconds": "Server-side latency of a live frame request",
+    "pool_rejected_total": "Tasks turned away because a pool queue was full",
+    "pool_batches_total": "Micro-batches of several tasks sent to a worker in one message",
+    "pool_batched_tasks_total": "Tasks sent to a worker as part of a micro-batch",
+    "frames_dropped_total": "Stale live frames replaced by a newer one before analysis",
+    "pool_queue_depth": "Tasks submitted to a pool and not finished yet",
+    "pool_workers": "Worker processes in a pool",
+    "live_sessions": "Live sessions held by frame workers",
+    "jobs_queued": "Video jobs waiting for a worker",
+    "video_store_bytes": "Bytes held in the video store by kind of file",
+}
+
+
+class Histogram:
+    # fixed buckets, so observe() is a binary search and an increment, and
+    # histograms from worker processes can simply be added together
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+
+class StageTimes:
+    # per-task stage timings collected inside a worker and shipped back with
+    # the task result: one histogram per stage, so a video job carries one
+    # sample per frame without growing its result message
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> int
+        self._gauges = []  # (name, fn returning [(labels, value)])
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def merge_stages(self, name: str, stages: dict, **labels):
+        with self._lock:
+            for stage, other in stages.items():
+                key = (name, tuple(sorted(dict(labels, stage=stage).items())))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.merge(other)
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, fn):
+        # fn is called at scrape time: a number, or a list of (labels, value)
+        self._gauges.append((name, fn))
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        with self._lock:
+            histograms = sorted(
+                (key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()
+            )
+            counters = sorted(self._counters.items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), counts, total, count in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total!r}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+
+        for name, fn in self._gauges:
+            header(name, "gauge")
+            values = fn()
+            if not isinstance(values, list):
+                values = [({}, values)]
+            for labels, value in values:
+                lines.append(f"{PREFIX}{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+METRICS = Metrics()
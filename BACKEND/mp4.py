@@ -0,0 +1,95 @@
+import os
+import struct
+
+# boxes on the way from moov down to the chunk offset tables
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts"}
+
+
+def _boxes(f, end: int):
+    # (type, offset, header size, total size) of the boxes from f's position
+    # up to `end`
+    while f.tell() < end:
+        offset = f.tell()
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", f.read(8))
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise ValueError("corrupt mp4 box")
+        yield kind, offset, header_size, size
+        f.seek(offset + size)
+
+
+def _shift_offsets(moov: bytearray, start: int, end: int, delta: int):
+    # add delta to every stco/co64 entry inside moov[start:end], in place
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", moov, pos)
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", moov, pos + 8)
+            header_size = 16
+        if size < header_size or pos + size > end:
+            raise ValueError("corrupt mp4 box")
+        body = pos + header_size
+        if kind in CONTAINERS:
+            _shift_offsets(moov, body, pos + size, delta)
+        elif kind in (b"stco", b"co64"):
+            (count,) = struct.unpack_from(">I", moov, body + 4)
+            fmt, width = (">I", 4) if kind == b"stco" else (">Q", 8)
+            for i in range(count):
+                at = body + 8 + i * width
+                (value,) = struct.unpack_from(fmt, moov, at)
+                if kind == b"stco" and value + delta >= 1 << 32:
+                    raise ValueError("chunk offsets overflow stco")
+                struct.pack_into(fmt, moov, at, value + delta)
+        pos += size
+
+
+def faststart(path: str) -> bool:
+    # Move the moov box in front of the media data, as qt-faststart does, so
+    # a player can start before it has the whole file. OpenCV's writer puts
+    # moov last. Returns False if the file already starts with it.
+    with open(path, "rb") as f:
+        boxes = list(_boxes(f, os.fstat(f.fileno()).st_size))
+        kinds = [box[0] for box in boxes]
+        if b"moov" not in kinds or b"mdat" not in kinds:
+            raise ValueError("not an mp4 file")
+        moov_index = kinds.index(b"moov")
+        first_mdat = kinds.index(b"mdat")
+        if moov_index < first_mdat:
+            return False
+        if b"mdat" in kinds[moov_index:]:
+            raise ValueError("media data after moov")
+
+        _, offset, header_size, size = boxes[moov_index]
+        f.seek(offset)
+        moov = bytearray(f.read(size))
+        _shift_offsets(moov, header_size, size, size)
+
+        tmp_path = f"{path}.{os.getpid()}.faststart"
+        with open(tmp_path, "wb") as out:
+            for index, (kind, offset, _, size) in enumerate(boxes):
+                if index == first_mdat:
+                    out.write(moov)
+                if kind == b"moov":
+                    continue
+                f.seek(offset)
+                _copy(f, out, size)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _copy(src, dst, size: int):
+    while size > 0:
+        chunk = src.read(min(size, 1024 * 1024))
+        if not chunk:
+            raise ValueError("truncated mp4 file")
+        dst.write(chunk)
+        size -= len(chunk)
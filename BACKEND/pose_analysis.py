@@ -0,0 +1,451 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+import config
+from exercises import IDLE, load_exercises
+from landmarks import LANDMARK_INDEX, POSE_CONNECTIONS
+from mp4 import faststart
+from pose_backends import create_backend
+from smoothing import LandmarkFilter, fill_gaps, smooth_track
+from tracks import load_track, save_track
+
+EXERCISE_SPECS, DEFAULT_EXERCISE = load_exercises(
+    config.EXERCISES_FILE, LANDMARK_INDEX, POSE_CONNECTIONS
+)
+
+EXERCISE_TRIPLETS = {
+    key: spec.triplets for key, spec in EXERCISE_SPECS.items() if len(spec.triplets)
+}
+EXERCISE_INDICES = {key: spec.indices for key, spec in EXERCISE_SPECS.items()}
+EXERCISE_CONNECTIONS = {key: spec.connections for key, spec in EXERCISE_SPECS.items()}
+
+
+def joint_angles(points, triplets):
+    # points is (..., 33, >=2) so one frame and a (T, 33, 2) track share the
+    # same kernel; returns (..., len(triplets)) angles in degrees
+    xy = np.asarray(points, dtype=np.float64)[..., :2]
+    a = xy[..., triplets[:, 0], :]
+    b = xy[..., triplets[:, 1], :]
+    c = xy[..., triplets[:, 2], :]
+    radians = np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0]) - np.arctan2(
+        a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]
+    )
+    angle = np.abs(np.degrees(radians))
+    return np.where(angle > 180, 360 - angle, angle)
+
+
+def exercise_angle(exercise_key: str, points):
+    triplets = EXERCISE_TRIPLETS.get(exercise_key)
+    if triplets is None:
+        return None
+    return joint_angles(points, triplets).mean(axis=-1)
+
+
+def assess_form(exercise: str, angle: float):
+    return EXERCISE_SPECS.get(exercise, DEFAULT_EXERCISE).assess(angle)
+
+
+def draw_skeleton(image, landmarks, exercise_key, color=(0, 255, 0)):
+    h, w = image.shape[:2]
+    points = (landmarks[:, :2] * (w, h)).astype(int).tolist()
+    visible = (landmarks[:, 3] > 0.5).tolist()
+
+    for a_idx, b_idx in EXERCISE_CONNECTIONS.get(exercise_key, []):
+        if visible[a_idx] and visible[b_idx]:
+            cv2.line(image, tuple(points[a_idx]), tuple(points[b_idx]), color, 3)
+
+    for idx in EXERCISE_INDICES.get(exercise_key, []):
+        if visible[idx]:
+            cv2.circle(image, tuple(points[idx]), 6, (255, 255, 0), -1)
+
+    return image
+
+
+class RepCounter:
+    def __init__(self, exercise_key: str):
+        self.exercise_key = exercise_key
+        spec = EXERCISE_SPECS.get(exercise_key)
+        self.transitions = None if spec is None else spec.transitions
+        self.stages = None if spec is None else spec.stages
+        self.state = IDLE
+        self.reps = 0
+        self.rep_times = []
+        self.last_rep_ts = None
+
+    @property
+    def stage(self):
+        return None if self.stages is None else self.stages[self.state]
+
+    def update(self, angle: float, now: float | None = None) -> bool:
+        if self.transitions is None:
+            return False
+        sign, threshold, next_state, counts = self.transitions[self.state]
+        if sign * angle <= sign * threshold:
+            return False
+        self.state = next_state
+        if not counts:
+            return False
+
+        if now is None:
+            now = time.time()
+        self.reps += 1
+        if self.last_rep_ts:
+            self.rep_times.append(now - self.last_rep_ts)
+        self.last_rep_ts = now
+        return True
+
+    def next_threshold(self):
+        if self.transitions is None:
+            return None
+        return self.transitions[self.state][1]
+
+
+class AdaptiveSampler:
+    # Picks the next frame to analyse: every `stride` frames normally, every
+    # frame while the angle is close to (or heading across) the threshold the
+    # rep counter is waiting on, so transitions are never stepped over.
+    def __init__(self, exercise_key: str, stride: int, margin: float):
+        self.counter = RepCounter(exercise_key)
+        self.stride = max(1, stride)
+        self.margin = margin
+        self.last = None
+
+    def next_step(self, idx: int, angle: float | None) -> int:
+        if self.stride == 1:
+            return 1
+        if angle is None:
+            return self.stride
+        self.counter.update(angle, 0.0)
+        threshold = self.counter.next_threshold()
+        if threshold is None:
+            return self.stride
+
+        dense = abs(angle - threshold) <= self.margin
+        if not dense and self.last is not None:
+            last_idx, last_angle = self.last
+            velocity = (angle - last_angle) / max(idx - last_idx, 1)
+            predicted = angle + velocity * self.stride
+            dense = min(angle, predicted) <= threshold <= max(angle, predicted)
+        self.last = (idx, angle)
+        return 1 if dense else self.stride
+
+
+def create_pose(static_image_mode=False, min_confidence=0.5, tier="full", num_poses=1):
+    return create_backend(
+        config.POSE_BACKEND,
+        tier,
+        static_image_mode=static_image_mode,
+        min_confidence=min_confidence,
+        model_dir=config.POSE_TASK_MODEL_DIR,
+        num_poses=num_poses,
+    )
+
+
+def create_filter():
+    if config.LANDMARK_FILTER == "off":
+        return None
+    return LandmarkFilter(max_gap=config.LANDMARK_MAX_GAP)
+
+
+def detect_landmarks(pose, image_bytes: bytes, preprocessor, timings=None):
+    # returns full-frame (33, 4) landmarks, or None when no pose was found
+    rgb = preprocessor.prepare(image_bytes, timings)
+    started = time.perf_counter()
+    landmarks = pose.process(rgb)
+    if timings is not None:
+        timings.add("inference", time.perf_counter() - started)
+    if landmarks is None:
+        preprocessor.lost()
+        return None
+    return preprocessor.to_frame(landmarks)
+
+
+def detect_people(pose, image_bytes: bytes, preprocessor, timings=None):
+    # every pose in the frame, as a list of full-frame (33, 4) landmarks;
+    # use with a non-tracking preprocessor, a crop would cut people out
+    rgb = preprocessor.prepare(image_bytes, timings)
+    started = time.perf_counter()
+    poses = pose.process_all(rgb)
+    if timings is not None:
+        timings.add("inference", time.perf_counter() - started)
+    return [preprocessor.to_frame(landmarks) for landmarks in poses]
+
+
+def interpolate_landmarks(start, end, t: float):
+    return start + (end - start) * t
+
+
+def analyze_video_file(
+    video_path: str,
+    track_path: str,
+    exercise_key: str,
+    progress=None,
+    progress_interval: float = 0.5,
+    analysis_fps: float | None = None,
+    dense_margin: float = 20.0,
+    timings=None,
+    pose_tier: str = "full",
+    pose=None,
+):
+    # Analysis only decodes and runs pose; the landmarks of every analysed
+    # frame go to a track file and the annotated video is rendered from it
+    # later (see render_annotated_video), so no frame is re-encoded here.
+    # A worker passes in the tracker it keeps between jobs; it is reset
+    # first, otherwise one is created for this video.
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Could not open video")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640)
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480)
+
+    stride = 1
+    if analysis_fps:
+        stride = max(1, int(round(fps / analysis_fps)))
+    sampler = AdaptiveSampler(exercise_key, stride, dense_margin)
+
+    start_time = time.time()
+    last_report = start_time
+    missing = np.full((33, 4), np.nan, dtype=np.float32)
+    sampled = []  # frame index of every analysed frame
+    track = []  # its landmarks, NaN when no pose was found
+    frame_idx = 0
+    next_sample = 1
+
+    if pose is None:
+        pose = create_pose(min_confidence=0.6, tier=pose_tier)
+        owned = True
+    else:
+        pose.reset()
+        owned = False
+    pose_tier = pose.tier
+    try:
+        while True:
+            sample = frame_idx + 1 >= next_sample
+            started = time.perf_counter()
+            # skipped frames are only grabbed, never converted to BGR
+            if sample:
+                ret, frame = cap.read()
+            else:
+                ret = cap.grab()
+            if not ret:
+                break
+            frame_idx += 1
+            if timings is not None:
+                timings.add("decode" if sample else "grab", time.perf_counter() - started)
+
+            if progress is not None and time.time() - last_report >= progress_interval:
+                last_report = time.time()
+                progress(
+                    {
+                        "frames_processed": frame_idx,
+                        "frames_total": total_frames,
+                        "fps": frame_idx / max(last_report - start_time, 1e-6),
+                    }
+                )
+
+            if not sample:
+                continue
+
+            started = time.perf_counter()
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            landmarks = pose.process(rgb)
+            if timings is not None:
+                timings.add("inference", time.perf_counter() - started)
+
+            angle = None
+            if landmarks is None:
+                landmarks = missing
+            else:
+                if stride > 1:
+                    angle = exercise_angle(exercise_key, landmarks)
+                    angle = None if angle is None else float(angle)
+            sampled.append(frame_idx)
+            track.append(landmarks)
+
+            next_sample = frame_idx + sampler.next_step(frame_idx, angle)
+    finally:
+        if owned:
+            pose.close()
+
+    cap.release()
+
+    started = time.perf_counter()
+    track = np.stack(track) if track else np.empty((0, 33, 4), dtype=np.float32)
+    save_track(
+        track_path,
+        {
+            "video": os.path.basename(video_path),
+            "exercise_key": exercise_key,
+            "fps": fps,
+            "width": width,
+            "height": height,
+            "frames": frame_idx,
+        },
+        sampled,
+        track,
+    )
+
+    summary = summarize_track(exercise_key, sampled, track, fps)
+    if timings is not None:
+        timings.add("analysis", time.perf_counter() - started)
+
+    summary.update(
+        {
+            "duration": time.time() - start_time,
+            "frames": frame_idx,
+            "frames_analysed": len(sampled),
+            "video_seconds": frame_idx / fps,
+            "height": height,
+            "pose_tier": pose_tier,
+        }
+    )
+    return summary
+
+
+def summarize_track(exercise_key: str, sampled, track, fps: float) -> dict:
+    # reps, form and the angle series from a (T, 33, 4) track of raw
+    # detections at frame indices `sampled`; angle math runs once over the
+    # whole track instead of per frame
+    spec = EXERCISE_SPECS.get(exercise_key, DEFAULT_EXERCISE)
+    counter = RepCounter(exercise_key)
+    avg_score = 0.0
+    feedback_summary = ""
+    series = None
+    # smoothing and gap filling only feed the angle math; the saved track
+    # keeps the raw detections
+    timestamps = np.asarray(sampled, dtype=np.float64) / fps
+    landmark_filter = create_filter()
+    if landmark_filter is not None:
+        track = smooth_track(track, timestamps, landmark_filter)
+        track = fill_gaps(track, timestamps, config.LANDMARK_MAX_GAP)
+    found = ~np.isnan(track[:, 0, 0])
+    angles = exercise_angle(exercise_key, track[found]) if found.any() else None
+    if angles is not None:
+        feedback, scores = spec.assess_many(angles)
+        avg_score = float(scores.mean())
+        feedback_summary = ", ".join(
+            sorted({spec.feedback_texts[i] for i in np.unique(feedback)})
+        )
+        timestamps = timestamps[found]
+        for angle, ts in zip(angles.tolist(), timestamps.tolist()):
+            counter.update(angle, ts)
+        series = (timestamps.astype(np.float32), angles.astype(np.float32))
+
+    return {
+        "reps": counter.reps,
+        "avg_time": float(np.mean(counter.rep_times)) if counter.rep_times else 0.0,
+        "form_score": avg_score,
+        "feedback_summary": feedback_summary,
+        "series": series,
+    }
+
+
+def scaled_size(size, height: int):
+    # (width, height) scaled down to `height`, even sides for the encoder
+    width = int(round(size[0] * height / size[1] / 2)) * 2
+    return max(2, width), max(2, height // 2 * 2)
+
+
+def render_annotated_video(
+    video_path: str,
+    track_path: str,
+    processed_path: str,
+    timings=None,
+    low_path: str | None = None,
+    thumbs_path: str | None = None,
+):
+    # One decode pass writes the annotated video and, if asked, a
+    # reduced-size rendition (none when the source is no taller than
+    # VIDEO_LOW_HEIGHT) and a strip of evenly spaced thumbnails. The
+    # videos are remuxed with the index first so playback starts before the
+    # download ends.
+    header, sampled, track = load_track(track_path)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Could not open video")
+
+    size = (header["width"], header["height"])
+    exercise_key = header["exercise_key"]
+    found = ~np.isnan(track[:, 0, 0])
+
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    outputs = [(processed_path, size)]
+    if low_path and size[1] > config.VIDEO_LOW_HEIGHT:
+        outputs.append((low_path, scaled_size(size, config.VIDEO_LOW_HEIGHT)))
+    writers = [
+        (cv2.VideoWriter(f"{path}.part.mp4", fourcc, header["fps"], out_size), out_size)
+        for path, out_size in outputs
+    ]
+    thumbs = []
+    thumb_frames = set()
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or int(header.get("frames") or 0)
+    if thumbs_path and total:
+        count = min(config.THUMBNAIL_COUNT, total)
+        thumb_frames = {int((i + 0.5) * total / count) + 1 for i in range(count)}
+    thumb_size = scaled_size(size, config.THUMBNAIL_HEIGHT)
+
+    frame_idx = 0
+    pos = 0  # first analysed frame at or after frame_idx
+    while True:
+        started = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_idx += 1
+        decoded = time.perf_counter()
+        while pos < len(sampled) and sampled[pos] < frame_idx:
+            pos += 1
+
+        # analysed frames use their own skeleton; frames skipped by the sampler
+        # are interpolated between the samples around them, or hold the last
+        # one when the next sample found no pose
+        landmarks = None
+        if pos < len(sampled) and sampled[pos] == frame_idx:
+            if found[pos]:
+                landmarks = track[pos]
+        elif pos > 0 and found[pos - 1]:
+            landmarks = track[pos - 1]
+            if pos < len(sampled) and found[pos]:
+                t = (frame_idx - sampled[pos - 1]) / (sampled[pos] - sampled[pos - 1])
+                landmarks = interpolate_landmarks(track[pos - 1], track[pos], t)
+
+        if frame.shape[1::-1] != size:
+            frame = cv2.resize(frame, size)
+        if landmarks is not None:
+            frame = draw_skeleton(frame, landmarks, exercise_key)
+        drawn = time.perf_counter()
+        for writer, out_size in writers:
+            if out_size == size:
+                writer.write(frame)
+            else:
+                writer.write(cv2.resize(frame, out_size, interpolation=cv2.INTER_AREA))
+        if frame_idx in thumb_frames:
+            thumbs.append(cv2.resize(frame, thumb_size, interpolation=cv2.INTER_AREA))
+        if timings is not None:
+            timings.add("decode", decoded - started)
+            timings.add("draw", drawn - decoded)
+            timings.add("encode", time.perf_counter() - drawn)
+
+    cap.release()
+    for writer, _ in writers:
+        writer.release()
+    for path, _ in outputs:
+        started = time.perf_counter()
+        faststart(f"{path}.part.mp4")
+        os.replace(f"{path}.part.mp4", path)
+        if timings is not None:
+            timings.add("faststart", time.perf_counter() - started)
+    if thumbs_path:
+        if not thumbs:
+            thumbs = [np.zeros((thumb_size[1], thumb_size[0], 3), dtype=np.uint8)]
+        ok, jpeg = cv2.imencode(".jpg", np.hstack(thumbs), [cv2.IMWRITE_JPEG_QUALITY, 75])
+        with open(f"{thumbs_path}.part", "wb") as f:
+            f.write(jpeg.tobytes())
+        os.replace(f"{thumbs_path}.part", thumbs_path)
+    return {"frames": frame_idx, "thumbnails": len(thumbs)}
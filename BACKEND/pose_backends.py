@@ -0,0 +1,228 @@
+import os
+import time
+
+import mediapipe as mp
+import numpy as np
+
+# model tiers, cheapest first; the value is the MediaPipe model complexity
+TIERS = ("lite", "full", "heavy")
+COMPLEXITY = {"lite": 0, "full": 1, "heavy": 2}
+# rough inference cost relative to "full", used until a tier has been timed
+RELATIVE_COST = {"lite": 0.6, "full": 1.0, "heavy": 2.8}
+# shipped inside the mediapipe wheel; the others are downloaded on first use
+BUNDLED_TIER = "full"
+
+# tiers that failed to load in this process, so a missing model is tried
+# once rather than on every new session
+_unavailable = set()
+_tasks_unavailable = set()
+
+
+def landmarks_to_array(lm):
+    return np.array(
+        [(p.x, p.y, p.z, p.visibility) for p in lm],
+        dtype=np.float32,
+    )
+
+
+class SolutionsPose:
+    # mediapipe.solutions.pose; process() returns (33, 4) landmarks or None.
+    # The Solutions graph tracks a single person, so process_all() finds at
+    # most one.
+    def __init__(self, tier: str, static_image_mode: bool, min_confidence: float):
+        self.tier = tier
+        self.num_poses = 1
+        self._pose = mp.solutions.pose.Pose(
+            static_image_mode=static_image_mode,
+            model_complexity=COMPLEXITY[tier],
+            enable_segmentation=False,
+            min_detection_confidence=min_confidence,
+            min_tracking_confidence=min_confidence,
+        )
+
+    def process(self, rgb):
+        results = self._pose.process(rgb)
+        if not results.pose_landmarks:
+            return None
+        return landmarks_to_array(results.pose_landmarks.landmark)
+
+    def process_all(self, rgb):
+        landmarks = self.process(rgb)
+        return [] if landmarks is None else [landmarks]
+
+    def reset(self):
+        # forget the tracked person before the graph is reused for another
+        # stream; far cheaper than building a new graph
+        self._pose.reset()
+
+    def close(self):
+        self._pose.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TasksPose:
+    # MediaPipe Tasks PoseLandmarker, from a pose_landmarker_<tier>.task
+    # bundle in POSE_TASK_MODEL_DIR; tracking mode needs increasing
+    # timestamps. Detects up to num_poses people per frame.
+    def __init__(
+        self,
+        tier: str,
+        static_image_mode: bool,
+        min_confidence: float,
+        model_dir: str,
+        num_poses: int = 1,
+    ):
+        from mediapipe.tasks.python import vision
+        from mediapipe.tasks.python.core.base_options import BaseOptions
+
+        path = os.path.join(model_dir, f"pose_landmarker_{tier}.task")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        self.tier = tier
+        self.num_poses = num_poses
+        self._video = not static_image_mode
+        self._timestamp_ms = 0
+        self._landmarker = vision.PoseLandmarker.create_from_options(
+            vision.PoseLandmarkerOptions(
+                base_options=BaseOptions(model_asset_path=path),
+                running_mode=(
+                    vision.RunningMode.VIDEO if self._video else vision.RunningMode.IMAGE
+                ),
+                min_pose_detection_confidence=min_confidence,
+                min_pose_presence_confidence=min_confidence,
+                min_tracking_confidence=min_confidence,
+                num_poses=num_poses,
+            )
+        )
+
+    def process_all(self, rgb):
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(rgb))
+        if self._video:
+            self._timestamp_ms = max(self._timestamp_ms + 1, int(time.monotonic() * 1000))
+            result = self._landmarker.detect_for_video(image, self._timestamp_ms)
+        else:
+            result = self._landmarker.detect(image)
+        return [landmarks_to_array(pose) for pose in result.pose_landmarks]
+
+    def process(self, rgb):
+        poses = self.process_all(rgb)
+        return poses[0] if poses else None
+
+    def reset(self):
+        # the landmarker has no reset; it re-detects when tracking is lost
+        pass
+
+    def close(self):
+        self._landmarker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def available(tier: str) -> bool:
+    return tier not in _unavailable
+
+
+def create_backend(
+    backend: str,
+    tier: str,
+    static_image_mode: bool = False,
+    min_confidence: float = 0.5,
+    model_dir: str = "",
+    num_poses: int = 1,
+):
+    # falls back to the Solutions API, then to the bundled tier, so a model
+    # that cannot be loaded (no network to fetch it, no .task file) costs
+    # precision rather than the request; Solutions only ever finds one person
+    if tier not in COMPLEXITY:
+        raise ValueError(f"unknown pose tier {tier!r}")
+    if backend == "tasks" and model_dir and tier not in _tasks_unavailable:
+        try:
+            return TasksPose(tier, static_image_mode, min_confidence, model_dir, num_poses)
+        except Exception as e:
+            print(f"pose backend: tasks {tier} unavailable ({e}), using solutions")
+            _tasks_unavailable.add(tier)
+    if tier in _unavailable:
+        tier = BUNDLED_TIER
+    try:
+        return SolutionsPose(tier, static_image_mode, min_confidence)
+    except Exception as e:
+        if tier == BUNDLED_TIER:
+            raise
+        print(f"pose backend: {tier} model unavailable ({e}), using {BUNDLED_TIER}")
+        _unavailable.add(tier)
+        return SolutionsPose(BUNDLED_TIER, static_image_mode, min_confidence)
+
+
+class AutoTier:
+    # Picks a live session's model tier from the latency it is getting: each
+    # frame's queue wait plus processing, against the session's budget. Over
+    # budget steps down straight away; stepping up needs the predicted
+    # latency at the next tier to fit with room to spare for a while, since
+    # every switch costs a new tracker and a fresh detection.
+    def __init__(
+        self,
+        tier: str,
+        max_tier: str,
+        budget_s: float,
+        down_after: int = 3,
+        up_after: int = 30,
+        cooldown_s: float = 5.0,
+    ):
+        self.tier = tier
+        self.max_tier = max_tier
+        self.budget_s = budget_s
+        self.down_after = down_after
+        self.up_after = up_after
+        self.cooldown_s = cooldown_s
+        self.wait_s = 0.0
+        self.work_s = None
+        self._over = 0
+        self._under = 0
+        self._switched = 0.0
+
+    def observe(self, wait_s: float, work_s: float) -> str:
+        # returns the tier the next frame should use
+        self.wait_s = 0.7 * self.wait_s + 0.3 * wait_s
+        self.work_s = work_s if self.work_s is None else 0.7 * self.work_s + 0.3 * work_s
+        latency = self.wait_s + self.work_s
+        rank = TIERS.index(self.tier)
+
+        self._over = self._over + 1 if latency > self.budget_s else 0
+        if self._over >= self.down_after and rank > 0:
+            return self._switch(self._step(rank, -1))
+
+        upper = TIERS.index(self.max_tier)
+        if rank < upper and time.monotonic() - self._switched >= self.cooldown_s:
+            target = self._step(rank, 1)
+            scale = RELATIVE_COST[target] / RELATIVE_COST[self.tier]
+            fits = self.wait_s + self.work_s * scale <= 0.8 * self.budget_s
+            self._under = self._under + 1 if fits else 0
+            if self._under >= self.up_after:
+                return self._switch(target)
+        return self.tier
+
+    def _step(self, rank: int, direction: int) -> str:
+        # next loadable tier in that direction, or the current one
+        rank += direction
+        while 0 <= rank < len(TIERS):
+            if available(TIERS[rank]):
+                return TIERS[rank]
+            rank += direction
+        return self.tier
+
+    def _switch(self, tier: str) -> str:
+        if tier != self.tier:
+            self.work_s *= RELATIVE_COST[tier] / RELATIVE_COST[self.tier]
+            self.tier = tier
+            self._switched = time.monotonic()
+        self._over = self._under = 0
+        return tier
@@ -0,0 +1,582 @@
+import asyncio
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+import zlib
+
+from metrics import METRICS, StageTimes
+
+
+class PoolBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"pool busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PoolUnavailable(Exception):
+    pass
+
+
+class TaskFailed(Exception):
+    pass
+
+
+class InvalidInput(TaskFailed):
+    pass
+
+
+def _registry(state):
+    if "sessions" not in state:
+        import config
+        from sessions import SessionRegistry
+
+        state["sessions"] = SessionRegistry(
+            config.SESSION_MAX_PER_WORKER, config.SESSION_IDLE_TTL
+        )
+    return state["sessions"]
+
+
+def _handle_frame(state, payload, report, timings):
+    import pose_analysis
+
+    budget_ms = payload.get("latency_budget_ms")
+    budget_s = budget_ms / 1000.0 if budget_ms else None
+    session_id = payload.get("session_id")
+    if session_id:
+        session = _registry(state).get(
+            session_id,
+            payload.get("exercise_key"),
+            payload.get("patient_id"),
+            payload.get("num_poses", 1),
+        )
+        return session.process(payload["image"], timings, state["queued_s"], budget_s)
+
+    detector = _anonymous_detector(state)
+    started = time.perf_counter()
+    landmarks = pose_analysis.detect_landmarks(
+        detector, payload["image"], state["preprocessor"], timings
+    )
+    auto_tier = state["auto_tier"]
+    if auto_tier is not None:
+        if budget_s:
+            auto_tier.budget_s = budget_s
+        auto_tier.tier = detector.tier
+        state["anonymous_tier"] = auto_tier.observe(
+            state["queued_s"], time.perf_counter() - started
+        )
+    return {"landmarks": landmarks, "session": None}
+
+
+def _anonymous_detector(state):
+    import pose_analysis
+
+    if "detectors" not in state:
+        from preprocess import FramePreprocessor
+        from sessions import live_tier_policy
+
+        # no cross-request tracking: every anonymous frame gets a fresh
+        # detection so one client's ROI never seeds another client's frame.
+        # Anonymous frames share one tier policy per worker.
+        state["detectors"] = {}
+        state["anonymous_tier"], state["auto_tier"] = live_tier_policy()
+        state["preprocessor"] = FramePreprocessor(track=False)
+    tier = state["anonymous_tier"]
+    detector = state["detectors"].get(tier)
+    if detector is None:
+        detector = pose_analysis.create_pose(static_image_mode=True, tier=tier)
+        state["detectors"][tier] = detector
+    return detector
+
+
+def _video_pose(state, tier: str):
+    # one tracker per tier, kept for the worker's lifetime and reset
+    # between videos
+    import pose_analysis
+
+    poses = state.setdefault("video_poses", {})
+    if tier not in poses:
+        poses[tier] = pose_analysis.create_pose(min_confidence=0.6, tier=tier)
+    return poses[tier]
+
+
+def _handle_warmup(state, payload, report, timings):
+    # First task of every worker: import what its pool runs and push one
+    # blank frame through each model it will use, so the first real request
+    # does not pay for graph construction and model loading.
+    import numpy as np
+
+    role = payload["pool"]
+    if role == "report":
+        import reports
+
+        reports.warm_up()
+        return role
+
+    import config
+    import pose_analysis
+
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+    if role == "video":
+        _video_pose(state, config.VIDEO_POSE_TIER).process(blank)
+        return role
+
+    from sessions import live_tier_policy
+
+    _anonymous_detector(state).process(blank)
+    trackers = _registry(state).trackers
+    tracker = trackers.get(live_tier_policy()[0])
+    tracker.process(blank)
+    trackers.put(tracker)
+    pose_analysis.create_filter()
+    return role
+
+
+def _handle_end_session(state, payload, report, timings):
+    return _registry(state).end(payload["session_id"])
+
+
+def _handle_video(state, payload, report, timings):
+    import config
+    import pose_analysis
+
+    pose_tier = payload.get("pose_tier") or config.VIDEO_POSE_TIER
+    return pose_analysis.analyze_video_file(
+        payload["video_path"],
+        payload["track_path"],
+        payload["exercise_key"],
+        progress=report,
+        analysis_fps=payload.get("analysis_fps"),
+        dense_margin=config.ANALYSIS_DENSE_MARGIN,
+        timings=timings,
+        pose_tier=pose_tier,
+        pose=_video_pose(state, pose_tier),
+    )
+
+
+def _handle_render(state, payload, report, timings):
+    import pose_analysis
+
+    return pose_analysis.render_annotated_video(
+        payload["video_path"],
+        payload["track_path"],
+        payload["processed_path"],
+        timings,
+        low_path=payload.get("low_path"),
+        thumbs_path=payload.get("thumbs_path"),
+    )
+
+
+def _history(state):
+    # report workers read the session history for charts and trends
+    if "history" not in state:
+        import config
+        from history import SessionStore
+
+        state["history"] = SessionStore(config.HISTORY_DB)
+    return state["history"]
+
+
+def _handle_report(state, payload, report, timings):
+    import reports
+
+    return reports.render_report(
+        payload["data"], payload["date_str"], payload["path"], _history(state)
+    )
+
+
+def _handle_report_context(state, payload, report, timings):
+    import reports
+
+    return reports.full_context(payload["data"], payload["date_str"], _history(state))
+
+
+def _handle_report_batch(state, payload, report, timings):
+    import reports
+
+    return reports.render_merged_report(payload["contexts"], payload["path"])
+
+
+def _handle_session_chart(state, payload, report, timings):
+    # drawn as soon as a session is recorded, so its reports find it cached
+    import charts
+
+    session = _history(state).find_session(
+        payload["patient_id"], payload["exercise_key"], payload["session_id"]
+    )
+    if session is None:
+        return None
+    path, _ = charts.session_chart(session, payload["exercise_key"])
+    return path
+
+
+HANDLERS = {
+    "frame": _handle_frame,
+    "end_session": _handle_end_session,
+    "video": _handle_video,
+    "render": _handle_render,
+    "report": _handle_report,
+    "report_batch": _handle_report_batch,
+    "report_context": _handle_report_context,
+    "session_chart": _handle_session_chart,
+    "warmup": _handle_warmup,
+}
+
+
+def _run_task(state, task, results):
+    task_id, kind, payload, submitted = task
+    state["queued_s"] = max(0.0, time.time() - submitted)
+
+    def report(data, task_id=task_id):
+        results.put(("progress", task_id, data, None))
+
+    # stage timings and the worker's own run time travel back with the
+    # result, so the parent can tell queueing from work
+    timings = StageTimes()
+    started = time.perf_counter()
+    try:
+        value = HANDLERS[kind](state, payload, report, timings)
+    except ValueError as e:
+        status, value = "invalid", str(e)
+    except Exception:
+        traceback.print_exc()
+        status, value = "error", f"{kind} task failed"
+    else:
+        status = "done"
+    stats = {
+        "run_s": time.perf_counter() - started,
+        "stages": timings.stages,
+        "sessions": len(state["sessions"]) if "sessions" in state else None,
+        "ended": state["sessions"].take_ended() if "sessions" in state else [],
+    }
+    return status, task_id, value, stats
+
+
+def _worker_main(tasks, results):
+    state = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        if isinstance(task, list):
+            # a micro-batch: run in arrival order, answer with one message
+            results.put(("batch", None, [_run_task(state, t, results) for t in task], None))
+        else:
+            results.put(_run_task(state, task, results))
+
+
+class PosePool:
+    # With batch_max > 1, tasks for a worker that is already busy are held
+    # for up to batch_window_ms and sent as one message, so under load a
+    # worker picks up the frames of all its sessions in one queue read and
+    # answers them in one result message instead of one round trip each.
+    # An idle worker still gets its task straight away.
+    #
+    # With warmup, every worker (including one restarted after a crash) is
+    # first sent a "warmup" task for its pool; ready() turns true once all
+    # of them have finished it.
+    #
+    # on_session_end(summaries) is called on the event loop with the
+    # summaries of live sessions a worker evicted (idle, over its limit or
+    # restarted), which never get an explicit end.
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        queue_size: int,
+        batch_max: int = 1,
+        batch_window_ms: float = 0,
+        warmup: bool = False,
+        on_session_end=None,
+    ):
+        self.name = name
+        self.size = max(1, size)
+        self.queue_size = max(1, queue_size)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = None
+        self._workers = []
+        self._pending = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._reader = None
+        self._running = False
+        self._avg_task_s = 0.5
+        self.batch_max = max(1, batch_max)
+        self.batch_window_s = batch_window_ms / 1000.0
+        self.warmup = warmup
+        self._warming = {}  # warm-up task id -> (worker index, sent at)
+        self.on_session_end = on_session_end
+
+    def start(self):
+        self._results = self._ctx.Queue()
+        self._workers = [self._spawn(index) for index in range(self.size)]
+        self._running = True
+        self._reader = threading.Thread(
+            target=self._read_results, name=f"{self.name}-results", daemon=True
+        )
+        self._reader.start()
+
+    def stop(self):
+        self._running = False
+        for worker in self._workers:
+            try:
+                worker["tasks"].put_nowait(None)
+            except queue.Full:
+                pass
+        for worker in self._workers:
+            worker["process"].join(timeout=5)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+        if self._reader is not None:
+            self._reader.join(timeout=5)
+        self._fail_pending(lambda w: True, PoolUnavailable(f"{self.name} pool stopped"))
+        self._workers = []
+
+    def _spawn(self, index: int):
+        tasks = self._ctx.Queue(maxsize=self.queue_size)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(tasks, self._results),
+            name=f"{self.name}-worker",
+            daemon=True,
+        )
+        process.start()
+        worker = {
+            "process": process,
+            "tasks": tasks,
+            "inflight": 0,
+            "sessions": 0,
+            "batch": [],
+            "warm": not self.warmup,
+        }
+        if self.warmup:
+            task_id = next(self._ids)
+            self._warming[task_id] = (index, time.perf_counter())
+            tasks.put_nowait((task_id, "warmup", {"pool": self.name}, time.time()))
+        return worker
+
+    def ready(self) -> bool:
+        with self._lock:
+            return self._running and all(w["warm"] for w in self._workers)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running,
+                "workers": len(self._workers),
+                "alive": sum(w["process"].is_alive() for w in self._workers),
+                "warm": sum(w["warm"] for w in self._workers),
+            }
+
+    def depth(self) -> int:
+        with self._lock:
+            return sum(w["inflight"] for w in self._workers)
+
+    def sessions(self) -> int:
+        # live sessions as last reported by each worker
+        with self._lock:
+            return sum(w["sessions"] for w in self._workers)
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self) -> int:
+        # caller holds the lock
+        waiting = sum(w["inflight"] for w in self._workers) / self.size
+        return max(1, int(round(waiting * self._avg_task_s)))
+
+    def _pick_worker(self, key):
+        if key is not None:
+            return zlib.crc32(key.encode("utf-8")) % self.size
+        return min(range(self.size), key=lambda i: self._workers[i]["inflight"])
+
+    async def submit(
+        self,
+        kind: str,
+        payload: dict,
+        key: str | None = None,
+        on_progress=None,
+    ):
+        if not self._running:
+            raise PoolUnavailable(f"{self.name} pool is not running")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        task_id = next(self._ids)
+
+        with self._lock:
+            index = self._pick_worker(key)
+            worker = self._workers[index]
+            if worker["inflight"] >= self.queue_size:
+                METRICS.inc("pool_rejected_total", pool=self.name)
+                raise PoolBusy(self._retry_after())
+            task = (task_id, kind, payload, time.time())
+            batching = self.batch_max > 1 and worker["inflight"] > len(worker["batch"])
+            if not batching:
+                try:
+                    worker["tasks"].put_nowait(task)
+                except queue.Full:
+                    METRICS.inc("pool_rejected_total", pool=self.name)
+                    raise PoolBusy(self._retry_after())
+            worker["inflight"] += 1
+            self._pending[task_id] = (
+                future,
+                loop,
+                index,
+                time.perf_counter(),
+                on_progress,
+                kind,
+            )
+            if batching:
+                # the worker is busy: hold the task until the batch is full,
+                # the window closes or the worker hands back a result
+                worker["batch"].append(task)
+                if len(worker["batch"]) >= self.batch_max:
+                    self._flush(index)
+                elif len(worker["batch"]) == 1:
+                    loop.call_later(self.batch_window_s, self._flush_later, index)
+
+        return await future
+
+    def _flush_later(self, index):
+        with self._lock:
+            if index < len(self._workers):
+                self._flush(index)
+
+    def _flush(self, index):
+        # caller holds the lock
+        worker = self._workers[index]
+        batch, worker["batch"] = worker["batch"], []
+        if not batch:
+            return
+        try:
+            worker["tasks"].put_nowait(batch[0] if len(batch) == 1 else batch)
+        except queue.Full:
+            METRICS.inc("pool_rejected_total", amount=len(batch), pool=self.name)
+            busy = PoolBusy(self._retry_after())
+            for task in batch:
+                entry = self._pending.pop(task[0], None)
+                if entry is not None:
+                    worker["inflight"] -= 1
+                    entry[1].call_soon_threadsafe(_resolve, entry[0], None, busy)
+            return
+        if len(batch) > 1:
+            METRICS.inc("pool_batches_total", pool=self.name)
+            METRICS.inc("pool_batched_tasks_total", amount=len(batch), pool=self.name)
+
+    def _read_results(self):
+        last_reap = time.monotonic()
+        while self._running:
+            if time.monotonic() - last_reap > 1.0:
+                self._reap_dead_workers()
+                last_reap = time.monotonic()
+            try:
+                status, task_id, value, stats = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if status == "progress":
+                with self._lock:
+                    entry = self._pending.get(task_id)
+                if entry is not None and entry[4] is not None:
+                    entry[1].call_soon_threadsafe(entry[4], value)
+                continue
+
+            for result in value if status == "batch" else [(status, task_id, value, stats)]:
+                self._complete(*result)
+
+    def _complete(self, status, task_id, value, stats):
+        with self._lock:
+            warming = self._warming.pop(task_id, None)
+            if warming is not None:
+                # a failed warm-up is logged by the worker; the worker still
+                # serves, it just pays the set-up cost on its first task
+                index, sent = warming
+                self._workers[index]["warm"] = True
+                if stats["sessions"] is not None:
+                    self._workers[index]["sessions"] = stats["sessions"]
+        if warming is not None:
+            elapsed = time.perf_counter() - sent
+            METRICS.observe("warmup_seconds", elapsed, pool=self.name)
+            print(f"{self.name} worker {index} warm in {elapsed:.2f}s ({status})")
+            return
+
+        with self._lock:
+            entry = self._pending.pop(task_id, None)
+            if entry is None:
+                return
+            future, loop, index, started, _, kind = entry
+            worker = self._workers[index]
+            worker["inflight"] -= 1
+            if stats["sessions"] is not None:
+                worker["sessions"] = stats["sessions"]
+            elapsed = time.perf_counter() - started
+            self._avg_task_s = 0.9 * self._avg_task_s + 0.1 * elapsed
+            # the worker has caught up with what it was sent
+            if worker["batch"] and worker["inflight"] <= len(worker["batch"]):
+                self._flush(index)
+
+        METRICS.observe("task_seconds", elapsed, pool=self.name, task=kind)
+        METRICS.observe(
+            "queue_wait_seconds",
+            max(0.0, elapsed - stats["run_s"]),
+            pool=self.name,
+            task=kind,
+        )
+        METRICS.merge_stages("stage_seconds", stats["stages"], pool=self.name, task=kind)
+        if stats["ended"] and self.on_session_end is not None:
+            loop.call_soon_threadsafe(self.on_session_end, stats["ended"])
+
+        if status == "done":
+            loop.call_soon_threadsafe(_resolve, future, value, None)
+        elif status == "invalid":
+            loop.call_soon_threadsafe(_resolve, future, None, InvalidInput(value))
+        else:
+            loop.call_soon_threadsafe(_resolve, future, None, TaskFailed(value))
+
+    def _reap_dead_workers(self):
+        for index, worker in enumerate(self._workers):
+            if worker["process"].is_alive() or not self._running:
+                continue
+            print(f"{self.name} worker {index} died, restarting")
+            self._fail_pending(
+                lambda i: i == index,
+                PoolUnavailable(f"{self.name} worker crashed"),
+            )
+            with self._lock:
+                self._workers[index] = self._spawn(index)
+
+    def _fail_pending(self, match, exc):
+        with self._lock:
+            failed = [
+                (task_id, entry)
+                for task_id, entry in self._pending.items()
+                if match(entry[2])
+            ]
+            for index, worker in enumerate(self._workers):
+                if match(index):
+                    worker["batch"] = []
+            for task_id, (index, _) in list(self._warming.items()):
+                if match(index):
+                    del self._warming[task_id]
+            for task_id, (_, _, index, _, _, _) in failed:
+                del self._pending[task_id]
+                if index < len(self._workers):
+                    self._workers[index]["inflight"] -= 1
+        for _, (future, loop, _, _, _, _) in failed:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, future, None, exc)
+
+
+def _resolve(future, value, exc):
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(value)
@@ -0,0 +1,178 @@
+import math
+import struct
+import time
+
+import cv2
+import numpy as np
+
+# JPEG start-of-frame markers (baseline, extended, progressive, lossless...)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# libjpeg can scale by 1/2 and 1/4 while decoding, which skips most of the
+# IDCT work instead of decoding full size and resizing afterwards
+_REDUCTIONS = ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def jpeg_size(data: bytes):
+    # width/height from the SOF segment header, without decoding anything
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    n = len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack_from(">HH", data, i + 5)
+            return width, height
+        (length,) = struct.unpack_from(">H", data, i + 2)
+        i += 2 + length
+    return None
+
+
+def decode_reduced(data: bytes, needed_side: int, span: float = 1.0):
+    # decode at the smallest scale that still leaves `needed_side` pixels
+    # across the part of the frame (`span` of its long side) we will use
+    flag = cv2.IMREAD_COLOR
+    size = jpeg_size(data)
+    if size is not None:
+        used = max(size) * span
+        for factor, reduced in _REDUCTIONS:
+            if used / factor >= needed_side:
+                flag = reduced
+                break
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if frame is None:
+        raise ValueError("Invalid image data")
+    return frame
+
+
+class FramePreprocessor:
+    # Turns JPEG bytes into the RGB array pose inference runs on. With
+    # track=True it crops to where the body was last seen (plus a margin) and
+    # keeps that window until the body nears its edge, so the tracker sees a
+    # stable image most of the time; when the window does move, the tracker
+    # may miss a frame and re-detects on its own, which is far cheaper than
+    # resetting its graph. to_frame() maps landmarks back to the full frame.
+    # Crops are scaled to crop_side: the landmark model looks at a 256px
+    # body region, so more pixels around a cropped body buy nothing.
+    def __init__(
+        self,
+        max_side: int = 480,
+        crop_side: int = 320,
+        margin: float = 0.25,
+        track: bool = True,
+    ):
+        self.max_side = max_side
+        self.crop_side = crop_side
+        self.margin = margin
+        self.track = track
+        self.window = None  # normalised (x0, y0, x1, y1), None = full frame
+        self.region = (0.0, 0.0, 1.0, 1.0)  # crop used for the last frame
+        self._resized = None
+        self._rgb = None
+
+    def prepare(self, data: bytes, timings=None):
+        started = time.perf_counter()
+        window = self.window
+        side = self.max_side
+        span = 1.0
+        if window is not None:
+            side = self.crop_side
+            span = max(window[2] - window[0], window[3] - window[1])
+        frame = decode_reduced(data, side, span)
+        decoded = time.perf_counter()
+
+        h, w = frame.shape[:2]
+        if window is not None:
+            x0 = int(window[0] * w)
+            y0 = int(window[1] * h)
+            x1 = max(x0 + 1, math.ceil(window[2] * w))
+            y1 = max(y0 + 1, math.ceil(window[3] * h))
+            frame = frame[y0:y1, x0:x1]
+            self.region = (x0 / w, y0 / h, (x1 - x0) / w, (y1 - y0) / h)
+        else:
+            self.region = (0.0, 0.0, 1.0, 1.0)
+
+        # resize first so the colour conversion runs on the small image; both
+        # write into buffers that are reused while the crop size is stable
+        ch, cw = frame.shape[:2]
+        scale = side / max(ch, cw)
+        if scale < 1.0:
+            size = (max(1, round(cw * scale)), max(1, round(ch * scale)))
+            if self._resized is None or self._resized.shape[1::-1] != size:
+                self._resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            # INTER_AREA only pays off from 2x down; for the fractional
+            # ratios left after a reduced decode it is ~5x slower than linear
+            interpolation = cv2.INTER_AREA if scale <= 0.5 else cv2.INTER_LINEAR
+            cv2.resize(frame, size, dst=self._resized, interpolation=interpolation)
+            frame = self._resized
+        if self._rgb is None or self._rgb.shape != frame.shape:
+            self._rgb = np.empty(frame.shape, dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        if timings is not None:
+            timings.add("decode", decoded - started)
+            timings.add("resize", time.perf_counter() - decoded)
+        return self._rgb
+
+    def to_frame(self, landmarks):
+        rx, ry, rw, rh = self.region
+        if self.region != (0.0, 0.0, 1.0, 1.0):
+            landmarks = landmarks.copy()
+            landmarks[:, 0] = rx + landmarks[:, 0] * rw
+            landmarks[:, 1] = ry + landmarks[:, 1] * rh
+            landmarks[:, 2] = landmarks[:, 2] * rw
+        if self.track:
+            self._follow(landmarks)
+        return landmarks
+
+    def lost(self):
+        self.window = None
+
+    def _follow(self, landmarks):
+        visible = landmarks[:, 3] > 0.5
+        if visible.sum() < 4:
+            self.window = None
+            return
+        points = landmarks[visible, :2]
+        (bx0, by0), (bx1, by1) = points.min(axis=0), points.max(axis=0)
+        mx = (bx1 - bx0) * self.margin + 0.02
+        my = (by1 - by0) * self.margin + 0.02
+        needed = (bx0 - mx, by0 - my, bx1 + mx, by1 + my)
+        # a fresh window gets twice the margin as room to move
+        fresh = (
+            max(0.0, bx0 - 2 * mx),
+            max(0.0, by0 - 2 * my),
+            min(1.0, bx1 + 2 * mx),
+            min(1.0, by1 + 2 * my),
+        )
+
+        # keep the current window while it still holds the body with its
+        # margin and is not much bigger than a fresh one would be
+        window = self.window
+        if window is not None:
+            inside = (
+                window[0] <= max(needed[0], 0.0)
+                and window[1] <= max(needed[1], 0.0)
+                and window[2] >= min(needed[2], 1.0)
+                and window[3] >= min(needed[3], 1.0)
+            )
+            if inside and _area(window) <= 1.5 * _area(fresh):
+                return
+
+        self.window = None if _area(fresh) > 0.7 else fresh
+
+
+def _area(box):
+    return max(0.0, min(box[2], 1.0) - max(box[0], 0.0)) * max(
+        0.0, min(box[3], 1.0) - max(box[1], 0.0)
+    )
@@ -0,0 +1,454 @@
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import config
+from tracks import load_track, pipeline_version, read_track_header
+
+# Offline re-analysis: recompute reps and form scores for videos already on
+# disk, e.g. after the exercise definitions or the pipeline change. Inputs
+# are sharded across a process pool with one pose tracker per worker; the
+# output database doubles as the checkpoint, so an interrupted run picks up
+# where it stopped. Nothing is rendered: a stored landmark track is re-scored
+# without inference, anything else is decoded and analysed only.
+#
+#   cd BACKEND && python -m reanalyze videos --out reanalysis.db
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    video TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    exercise_key TEXT NOT NULL,
+    source TEXT,
+    track TEXT,
+    pipeline TEXT NOT NULL,
+    pose_tier TEXT,
+    analysis_fps REAL,
+    reps INTEGER,
+    avg_time REAL,
+    form_score REAL,
+    feedback_summary TEXT,
+    frames INTEGER,
+    frames_analysed INTEGER,
+    video_seconds REAL,
+    sample_count INTEGER,
+    angles BLOB,
+    error TEXT,
+    seconds REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_video ON results (video, exercise_key);
+"""
+
+COLUMNS = (
+    "key", "video", "size", "mtime_ns", "exercise_key", "source", "track",
+    "pipeline", "pose_tier", "analysis_fps", "reps", "avg_time", "form_score",
+    "feedback_summary", "frames", "frames_analysed", "video_seconds",
+    "sample_count", "angles", "error", "seconds", "finished_at",
+)
+
+# rows are written in bulk, every FLUSH_ROWS results or FLUSH_SECONDS
+FLUSH_ROWS = 100
+FLUSH_SECONDS = 5.0
+
+
+def is_video(path: str) -> bool:
+    name = os.path.basename(path)
+    if name.startswith((".", "proc_", "track_")):
+        return False
+    return os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+
+
+def read_manifest(path: str):
+    # one video per line, optionally "path,exercise_key"; relative paths are
+    # taken from the manifest's directory
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            video, _, exercise_key = line.partition(",")
+            yield os.path.join(base, video.strip()), exercise_key.strip() or None
+
+
+def collect_inputs(paths):
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full) and is_video(full):
+                    inputs.append((os.path.abspath(full), None))
+        elif is_video(path):
+            inputs.append((os.path.abspath(path), None))
+        elif os.path.isfile(path):
+            inputs.extend(read_manifest(path))
+        else:
+            raise SystemExit(f"no such file or directory: {path}")
+    return inputs
+
+
+def job_exercises(jobs_db: str):
+    # video file name -> exercises it was uploaded for, from the job store
+    found = {}
+    if not jobs_db or not os.path.isfile(jobs_db):
+        return found
+    conn = sqlite3.connect(f"file:{jobs_db}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT DISTINCT json_extract(payload, '$.video_path'), exercise_key "
+            "FROM jobs WHERE kind = 'video' AND exercise_key IS NOT NULL"
+        ).fetchall()
+    finally:
+        conn.close()
+    for video_path, exercise_key in rows:
+        if video_path:
+            found.setdefault(os.path.basename(video_path), set()).add(exercise_key)
+    return found
+
+
+def find_tracks(directories):
+    # (video file name, exercise) -> newest landmark track made from it
+    found = {}
+    for directory in directories:
+        for path in glob.glob(os.path.join(directory, "track_*.track")):
+            try:
+                header = read_track_header(path)
+            except (OSError, ValueError):
+                continue
+            key = (header.get("video"), header.get("exercise_key"))
+            if key not in found or os.path.getmtime(path) > os.path.getmtime(found[key]):
+                found[key] = path
+    return found
+
+
+def plan(inputs, exercise_keys, default_exercise, tracks):
+    items = []
+    skipped = 0
+    for video, exercise_key in inputs:
+        name = os.path.basename(video)
+        if exercise_key:
+            keys = [exercise_key]
+        elif name in exercise_keys:
+            keys = sorted(exercise_keys[name])
+        elif default_exercise:
+            keys = [default_exercise]
+        else:
+            skipped += 1
+            continue
+        try:
+            stat = os.stat(video)
+        except FileNotFoundError:
+            skipped += 1
+            continue
+        for key in keys:
+            items.append(
+                {
+                    "video": video,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "exercise_key": key,
+                    "track": tracks.get((name, key)),
+                }
+            )
+    return items, skipped
+
+
+def item_key(item: dict, options: dict) -> str:
+    # a result stands for as long as the file, the exercise and every
+    # setting that changes the outcome stay the same
+    parts = (
+        item["video"], item["size"], item["mtime_ns"], item["exercise_key"],
+        options["pipeline"], options["source"], options["pose_tier"], options["analysis_fps"],
+    )
+    return hashlib.sha256("|".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+
+# worker state: the options and one pose tracker, reset between videos
+_options = {}
+_poses = {}
+
+
+def _init_worker(options: dict):
+    import cv2
+
+    # one process per core; OpenCV's own threads would only fight them
+    cv2.setNumThreads(1)
+    _options.update(options)
+
+
+def _pose(tier: str):
+    import pose_analysis
+
+    if tier not in _poses:
+        _poses[tier] = pose_analysis.create_pose(min_confidence=0.6, tier=tier)
+    return _poses[tier]
+
+
+def _from_track(item: dict) -> dict:
+    import pose_analysis
+
+    header, sampled, track = load_track(item["track"])
+    summary = pose_analysis.summarize_track(item["exercise_key"], sampled, track, header["fps"])
+    summary.update(
+        {
+            "frames": header["frames"],
+            "frames_analysed": len(sampled),
+            "video_seconds": header["frames"] / header["fps"],
+            "pose_tier": None,
+        }
+    )
+    return summary
+
+
+def _from_video(item: dict) -> dict:
+    import pose_analysis
+
+    keep = _options["keep_tracks"]
+    if keep:
+        digest = hashlib.sha256(item["video"].encode("utf-8")).hexdigest()[:16]
+        track_path = os.path.join(keep, f"track_{digest}_{item['exercise_key']}.track")
+    else:
+        fd, track_path = tempfile.mkstemp(suffix=".track")
+        os.close(fd)
+    try:
+        summary = pose_analysis.analyze_video_file(
+            item["video"],
+            track_path,
+            item["exercise_key"],
+            analysis_fps=_options["analysis_fps"] or None,
+            dense_margin=config.ANALYSIS_DENSE_MARGIN,
+            pose_tier=_options["pose_tier"],
+            pose=_pose(_options["pose_tier"]),
+        )
+    finally:
+        if not keep and os.path.exists(track_path):
+            os.remove(track_path)
+    if keep:
+        summary["track"] = track_path
+    return summary
+
+
+def _analyze(item: dict) -> dict:
+    from history import encode_series
+
+    started = time.perf_counter()
+    row = dict.fromkeys(COLUMNS)
+    row.update({k: item[k] for k in ("key", "video", "size", "mtime_ns", "exercise_key")})
+    row.update(
+        {
+            "pipeline": _options["pipeline"],
+            "pose_tier": _options["pose_tier"],
+            "analysis_fps": _options["analysis_fps"],
+        }
+    )
+    try:
+        use_track = item["track"] is not None and _options["source"] != "video"
+        if use_track:
+            summary = _from_track(item)
+            row.update({"source": "track", "track": item["track"], "pose_tier": None})
+        else:
+            summary = _from_video(item)
+            row.update({"source": "video", "track": summary.get("track")})
+        series = summary.get("series")
+        row.update(
+            {
+                k: summary[k]
+                for k in (
+                    "reps", "avg_time", "form_score", "feedback_summary",
+                    "frames", "frames_analysed", "video_seconds",
+                )
+            }
+        )
+        if series is not None:
+            row["sample_count"] = len(series[0])
+            if _options["series"]:
+                row["angles"] = encode_series(*series)
+    except Exception as exc:
+        row["error"] = f"{type(exc).__name__}: {exc}"
+    row["seconds"] = time.perf_counter() - started
+    row["finished_at"] = time.time()
+    return row
+
+
+def open_results(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def write_rows(conn, rows):
+    marks = ",".join("?" * len(COLUMNS))
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO results ({','.join(COLUMNS)}) VALUES ({marks})",
+            [tuple(row[c] for c in COLUMNS) for row in rows],
+        )
+
+
+def export_parquet(conn, path: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cursor = conn.execute(f"SELECT {','.join(COLUMNS)} FROM results ORDER BY video, exercise_key")
+    columns = list(zip(*cursor.fetchall())) or [()] * len(COLUMNS)
+    table = pa.table({name: list(values) for name, values in zip(COLUMNS, columns)})
+    pq.write_table(table, path, compression="zstd")
+    return table.num_rows
+
+
+def run(args) -> dict:
+    if args.parquet:
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise SystemExit("--parquet needs pyarrow (pip install pyarrow)")
+    if args.keep_tracks:
+        os.makedirs(args.keep_tracks, exist_ok=True)
+
+    options = {
+        "pipeline": pipeline_version(config.EXERCISES_FILE),
+        "source": args.source,
+        "pose_tier": args.pose_tier,
+        "analysis_fps": args.analysis_fps,
+        "keep_tracks": args.keep_tracks and os.path.abspath(args.keep_tracks),
+        "series": args.series,
+    }
+
+    inputs = collect_inputs(args.paths)
+    tracks = {}
+    if args.source != "video":
+        directories = {os.path.dirname(video) for video, _ in inputs}
+        directories.update(args.track_dir or [])
+        tracks = find_tracks(sorted(directories))
+    items, skipped = plan(inputs, job_exercises(args.jobs_db), args.exercise, tracks)
+    if args.source == "tracks":
+        skipped += sum(1 for item in items if item["track"] is None)
+        items = [item for item in items if item["track"] is not None]
+
+    conn = open_results(args.out)
+    done_keys = {
+        row[0]
+        for row in conn.execute(
+            "SELECT key FROM results WHERE error IS NULL"
+            + ("" if args.retry_failed else " OR error IS NOT NULL")
+        )
+    }
+    for item in items:
+        item["key"] = item_key(item, options)
+    todo = [item for item in items if item["key"] not in done_keys]
+    resumed = len(items) - len(todo)
+    # longest first, so no worker is left with a big file at the end
+    todo.sort(
+        key=lambda item: (item["track"] is None or args.source == "video", item["size"]),
+        reverse=True,
+    )
+
+    print(
+        f"reanalyze: {len(items)} items, {resumed} already done, {len(todo)} to run, "
+        f"{skipped} skipped, pipeline {options['pipeline']}"
+    )
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(todo) or 1))
+    started = time.time()
+    pending = []
+    last_flush = last_print = started
+    completed = failed = 0
+
+    if todo:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(options,)) as pool:
+            try:
+                for row in pool.imap_unordered(_analyze, todo):
+                    pending.append(row)
+                    completed += 1
+                    if row["error"] is not None:
+                        failed += 1
+                        print(f"reanalyze: {row['video']} ({row['exercise_key']}): {row['error']}")
+                    now = time.time()
+                    if len(pending) >= FLUSH_ROWS or now - last_flush >= FLUSH_SECONDS:
+                        write_rows(conn, pending)
+                        pending = []
+                        last_flush = now
+                    if now - last_print >= args.progress_interval:
+                        last_print = now
+                        rate = completed / max(now - started, 1e-6)
+                        eta = (len(todo) - completed) / rate
+                        print(
+                            f"reanalyze: {completed}/{len(todo)} done, {failed} failed, "
+                            f"{rate:.2f} items/s, eta {eta:.0f}s"
+                        )
+            finally:
+                # whatever finished is kept, so a rerun resumes after it
+                if pending:
+                    write_rows(conn, pending)
+
+    elapsed = time.time() - started
+    summary = {
+        "items": len(items),
+        "resumed": resumed,
+        "completed": completed,
+        "failed": failed,
+        "skipped": skipped,
+        "workers": workers,
+        "seconds": elapsed,
+    }
+    print(
+        f"reanalyze: {completed} done ({failed} failed) in {elapsed:.1f}s "
+        f"with {workers} workers -> {args.out}"
+    )
+    if args.parquet:
+        rows = export_parquet(conn, args.parquet)
+        print(f"reanalyze: wrote {rows} rows to {args.parquet}")
+    conn.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m reanalyze")
+    parser.add_argument(
+        "paths", nargs="+", help="video directories, video files or manifests (path[,exercise] per line)"
+    )
+    parser.add_argument("--out", default="reanalysis.db", help="results and checkpoint database")
+    parser.add_argument("--parquet", help="also export every result to this Parquet file")
+    parser.add_argument("--workers", type=int, default=0, help="processes (default: one per core)")
+    parser.add_argument(
+        "--source",
+        choices=["auto", "tracks", "video"],
+        default="auto",
+        help="auto re-scores a stored landmark track when there is one and analyses the video otherwise",
+    )
+    parser.add_argument("--exercise", help="exercise for videos neither the manifest nor the job store name")
+    parser.add_argument("--jobs-db", default=config.JOBS_DB, help="job store to look up exercises in")
+    parser.add_argument("--track-dir", action="append", help="more directories with landmark tracks")
+    parser.add_argument("--keep-tracks", help="keep the tracks of analysed videos in this directory")
+    parser.add_argument("--pose-tier", default=config.VIDEO_POSE_TIER)
+    parser.add_argument("--analysis-fps", type=float, default=config.ANALYSIS_FPS)
+    parser.add_argument("--series", action="store_true", help="store the angle series of every result")
+    parser.add_argument("--retry-failed", action="store_true", help="run failed items again")
+    parser.add_argument("--progress-interval", type=float, default=10.0)
+    parser.add_argument("--json", help="also write the run summary to this file")
+    args = parser.parse_args()
+
+    summary = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+import hashlib
+import json
+import os
+import re
+import string
+from bisect import bisect_right
+
+DEFAULT_MEDICAL_HISTORY = (
+    "History of hip replacement surgery. Currently undergoing physiotherapy "
+    "for post-surgical strength, mobility, and functional recovery of the "
+    "lower limb and hip region."
+)
+DEFAULT_GOAL = (
+    "Improve hip and knee strength, balance, and range of motion after hip "
+    "replacement surgery."
+)
+REMARKS = (
+    "Patient tolerated the session well based on the metrics above. "
+    "Encourage continued focus on controlled, pain-free movement and "
+    "proper alignment. Adjust volume or intensity as needed based on "
+    "ongoing recovery and physiotherapist guidance."
+)
+
+DURATION_TARGET = 300.0
+
+# value -> label ladders: bisect_right over the bounds picks the label
+REPS_LEVELS = ([5, 15], ["Low volume session", "Moderate volume session", "High volume session"])
+DURATION_LEVELS = ([20, 60], ["Short session", "Typical session duration", "Extended session"])
+SPEED_LEVELS = ([3, 7], ["Slow and controlled", "Moderate tempo", "Fast-paced reps"])
+FORM_LEVELS = ([70, 85], ["Technique needs improvement", "Good technique", "Excellent technique"])
+
+# The report layout as drawing ops. Text containing "{field}" is filled from
+# the report context; everything else is static and used as-is.
+LAYOUT = [
+    ("page",),
+    ("font", "Helvetica", "B", 16),
+    ("cell", 0, 10, "Physiotherapy Exercise Session Report - TherapEase", {"ln": 1, "align": "C"}),
+    ("ln", 4),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Patient Details", {"ln": 1}),
+    ("font", "Helvetica", "", 11),
+    ("cell", 0, 6, "Name: {patient_name}", {"ln": 1}),
+    ("cell", 0, 6, "Patient ID: {patient_id}", {"ln": 1}),
+    ("cell", 0, 6, "Date of Report: {date_str}", {"ln": 1}),
+    ("ln", 4),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Medical History", {"ln": 1}),
+    ("font", "Helvetica", "", 11),
+    ("multi", 0, 5, "{medical_history}"),
+    ("ln", 4),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Current Prescription", {"ln": 1}),
+    ("font", "Helvetica", "", 11),
+    ("multi", 0, 5, "Primary Goal:"),
+    ("multi", 0, 5, "{primary_goal}"),
+    ("ln", 2),
+    ("multi", 0, 5, "Prescribed Exercises:"),
+    (
+        "multi",
+        0,
+        5,
+        "1. {exercise}\n"
+        "   a. Sets: {sets}\n"
+        "   b. Reps: target {reps} per session (or as prescribed)\n"
+        "   c. Frequency: As advised by the physiotherapist\n"
+        "   d. Notes: Maintain controlled motion and alignment throughout.",
+    ),
+    ("page",),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Session Summary", {"ln": 1}),
+    ("font", "Helvetica", "B", 11),
+    ("cell", 60, 7, "Metric", {"border": 1}),
+    ("cell", 60, 7, "Result", {"border": 1}),
+    ("cell", 70, 7, "Interpretation", {"border": 1, "ln": 1}),
+    ("font", "Helvetica", "", 10),
+    ("cell", 60, 7, "Exercise", {"border": 1}),
+    ("cell", 60, 7, "{exercise}", {"border": 1}),
+    ("cell", 70, 7, "Primary movement", {"border": 1, "ln": 1}),
+    ("cell", 60, 7, "Repetitions", {"border": 1}),
+    ("cell", 60, 7, "{reps} / {assigned_reps}", {"border": 1}),
+    ("cell", 70, 7, "{reps_interp}", {"border": 1, "ln": 1}),
+    ("cell", 60, 7, "Session Duration", {"border": 1}),
+    ("cell", 60, 7, "{duration:.1f} sec", {"border": 1}),
+    ("cell", 70, 7, "{duration_interp}", {"border": 1, "ln": 1}),
+    ("cell", 60, 7, "Average Speed", {"border": 1}),
+    ("cell", 60, 7, "{avg_time:.2f}", {"border": 1}),
+    ("cell", 70, 7, "{speed_interp}", {"border": 1, "ln": 1}),
+    ("cell", 60, 7, "Form Score", {"border": 1}),
+    ("cell", 60, 7, "{form_score:.1f} / 100", {"border": 1}),
+    ("cell", 70, 7, "{form_interp}", {"border": 1, "ln": 1}),
+    ("ln", 6),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Exercise Performance Overview ({exercise})", {"ln": 1}),
+    ("font", "Helvetica", "", 11),
+    ("cell", 0, 6, "Repetitions ({reps})", {"ln": 1}),
+    ("bar", "reps_ratio", 60, 5),
+    ("cell", 0, 5, "  {reps} / {assigned_reps} reps", {"ln": 1}),
+    ("cell", 0, 6, "Session Duration ({duration:.1f} sec)", {"ln": 1}),
+    ("bar", "dur_ratio", 60, 5),
+    ("cell", 0, 5, "  {duration:.1f} / {duration_target:.0f} sec (Recommended)", {"ln": 1}),
+    ("cell", 0, 6, "Time per rep ({avg_time:.2f})", {"ln": 1}),
+    ("bar", "speed_ratio", 60, 5),
+    ("cell", 0, 5, "  {avg_time:.2f} / {duration:.1f} sec", {"ln": 1}),
+    ("cell", 0, 6, "Form Score ({form_score:.1f} / 100)", {"ln": 1}),
+    ("bar", "form_ratio", 60, 5),
+    ("cell", 0, 5, "  technique quality", {"ln": 1}),
+]
+
+# drawn when the session has a stored angle series (see charts.py)
+SESSION_LAYOUT = [
+    ("need", 90),
+    ("ln", 6),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Movement Analysis", {"ln": 1}),
+    ("image", "session_chart", 190),
+    ("font", "Helvetica", "", 10),
+    ("multi", 0, 5, "Range of motion: {rom_text}"),
+    ("multi", 0, 5, "Rep tempo: {tempo_text}"),
+    ("multi", 0, 5, "Time in form band: {band_text}"),
+    ("multi", 0, 5, "Feedback: {feedback_text}"),
+]
+
+# drawn once the patient's sessions span two weeks or more
+TREND_LAYOUT = [
+    ("need", 85),
+    ("ln", 6),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Progress Over Time", {"ln": 1}),
+    ("font", "Helvetica", "", 10),
+    ("multi", 0, 5, "{trend_span}"),
+    ("image", "trend_chart", 190),
+    ("multi", 0, 5, "Latest week vs the one before: {week_text}"),
+]
+
+CLOSING_LAYOUT = [
+    ("ln", 6),
+    ("font", "Helvetica", "B", 12),
+    ("cell", 0, 8, "Therapist Remarks", {"ln": 1}),
+    ("font", "Helvetica", "", 11),
+    ("multi", 0, 5, REMARKS),
+]
+
+
+def _compile(layout):
+    # split every op's text once into a static string or a bound format
+    # method, so rendering only formats the fields that actually vary
+    compiled = []
+    for op in layout:
+        if op[0] in ("cell", "multi"):
+            kind, w, h, text, *rest = op
+            has_fields = any(field for _, field, _, _ in string.Formatter().parse(text))
+            compiled.append((kind, w, h, text.format if has_fields else text, *rest))
+        else:
+            compiled.append(op)
+    return compiled
+
+
+# (context key the section needs, ops); sections whose key is missing from
+# the context are left out
+TEMPLATE = [
+    (None, _compile(LAYOUT)),
+    ("session_chart", _compile(SESSION_LAYOUT)),
+    ("trend_chart", _compile(TREND_LAYOUT)),
+    (None, _compile(CLOSING_LAYOUT)),
+]
+
+BAR_TRACK = (225, 225, 225)
+BAR_FILL = (42, 111, 176)
+
+
+def bar_ratio(value: float, target: float) -> float:
+    if target <= 0:
+        return 0.0
+    return max(0.0, min(1.0, value / target))
+
+
+def draw_bar(pdf, ratio: float, w: float, h: float):
+    # a filled progress bar on the current line, drawn as two rectangles
+    x, y = pdf.get_x(), pdf.get_y()
+    pdf.set_fill_color(*BAR_TRACK)
+    pdf.rect(x, y + 1, w, h - 2, "F")
+    if ratio > 0:
+        pdf.set_fill_color(*BAR_FILL)
+        pdf.rect(x, y + 1, w * ratio, h - 2, "F")
+    pdf.set_x(x + w)
+
+
+def _level(levels, value):
+    bounds, labels = levels
+    return labels[bisect_right(bounds, value)]
+
+
+def report_context(data: dict, date_str: str) -> dict:
+    try:
+        reps = int(data.get("reps", 0) or 0)
+        sets = int(data.get("sets", 1) or 1)
+        duration = float(data.get("duration", 0.0) or 0.0)
+        avg_time = float(data.get("avg_time", 0.0) or 0.0)
+        assigned_reps = int(data.get("assigned_reps", 0))
+        form_score = float(data.get("form_score", 0.0) or 0.0)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid report metrics")
+    if form_score <= 1.0:
+        form_score = form_score * 100.0
+
+    return {
+        "patient_name": data.get("patient_name", "Unknown Patient"),
+        "patient_id": data.get("patient_id", "N/A"),
+        "exercise": data.get("exercise", "Exercise"),
+        "medical_history": data.get("medical_history", DEFAULT_MEDICAL_HISTORY),
+        "primary_goal": data.get("goal", DEFAULT_GOAL),
+        "date_str": date_str,
+        "reps": reps,
+        "sets": sets,
+        "duration": duration,
+        "avg_time": avg_time,
+        "assigned_reps": assigned_reps,
+        "form_score": form_score,
+        "duration_target": DURATION_TARGET,
+        "reps_ratio": bar_ratio(reps, assigned_reps),
+        "dur_ratio": bar_ratio(duration, DURATION_TARGET),
+        "speed_ratio": bar_ratio(avg_time, duration),
+        "form_ratio": bar_ratio(form_score, 100.0),
+        "reps_interp": _level(REPS_LEVELS, reps),
+        "duration_interp": _level(DURATION_LEVELS, duration),
+        "speed_interp": _level(SPEED_LEVELS, avg_time),
+        "form_interp": _level(FORM_LEVELS, form_score),
+    }
+
+
+def new_pdf():
+    # fpdf is imported here so the API process, which only names and zips
+    # reports, does not load it
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    return pdf
+
+
+def full_context(data: dict, date_str: str, history=None) -> dict:
+    # the request's metrics plus, given the session store, the analysis and
+    # charts of the patient's stored session and history
+    context = report_context(data, date_str)
+    if history is not None:
+        try:
+            # imported here: only the report workers load matplotlib
+            from charts import report_analysis
+
+            context.update(report_analysis(history, data))
+        except Exception as e:
+            print("report charts failed:", e)
+    return context
+
+
+def draw_report(pdf, context: dict):
+    for needs, ops in TEMPLATE:
+        if needs is not None and not context.get(needs):
+            continue
+        for op in ops:
+            kind = op[0]
+            if kind == "page":
+                pdf.add_page()
+            elif kind == "font":
+                pdf.set_font(*op[1:])
+            elif kind == "ln":
+                pdf.ln(op[1])
+            elif kind == "need":
+                # keep a heading with the chart below it
+                if pdf.get_y() + op[1] > pdf.page_break_trigger:
+                    pdf.add_page()
+            elif kind == "bar":
+                draw_bar(pdf, context[op[1]], op[2], op[3])
+            elif kind == "image":
+                # FPDF embeds an image once per document however often it
+                # is placed, so merged reports share their charts
+                pdf.image(context[op[1]], w=op[2])
+            else:
+                text = op[3] if isinstance(op[3], str) else op[3](**context)
+                if kind == "cell":
+                    pdf.cell(op[1], op[2], text, **op[4])
+                else:
+                    pdf.multi_cell(op[1], op[2], text)
+
+
+def render_report(data: dict, date_str: str, filepath: str, history=None):
+    pdf = new_pdf()
+    draw_report(pdf, full_context(data, date_str, history))
+
+    tmp_path = f"{filepath}.part"
+    pdf.output(tmp_path)
+    os.replace(tmp_path, filepath)
+    return os.path.basename(filepath)
+
+
+def warm_up():
+    # lay out one report in memory, loading fpdf and its core fonts, and
+    # draw one chart to load matplotlib
+    import charts
+
+    charts.warm_up()
+    pdf = new_pdf()
+    draw_report(pdf, report_context({"patient_id": "WARMUP"}, "1 January 2000"))
+    return len(pdf.output(dest="S"))
+
+
+def report_filename(data: dict, date_str: str, history: str = "") -> str:
+    # reports are named by what they show, so a repeated request (same
+    # payload, same day, same session history) maps to the file that was
+    # already rendered
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(f"{date_str}\n{history}\n{raw}".encode("utf-8")).hexdigest()[:20]
+    patient_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(data.get("patient_id", "N/A")))[:40]
+    return f"report_{patient_id}_{digest}.pdf"
+
+
+def render_merged_report(contexts: list, filepath: str):
+    # FPDF cannot import existing PDFs, so a merged report is drawn as one
+    # document, one report after another; the contexts (full_context, which
+    # draws the charts) are built per report beforehand, so only the layout
+    # runs here
+    pdf = new_pdf()
+    for context in contexts:
+        draw_report(pdf, context)
+
+    tmp_path = f"{filepath}.part"
+    pdf.output(tmp_path)
+    os.replace(tmp_path, filepath)
+    return os.path.basename(filepath)
+
+
+def merged_report_filename(items: list, date_str: str, history=()) -> str:
+    raw = json.dumps([items, list(history)], sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(f"{date_str}\n{raw}".encode("utf-8")).hexdigest()[:20]
+    return f"reports_{len(items)}_{digest}.pdf"
+
+
+class ZipSink:
+    # write-only file object for zipfile: without tell/seek it writes local
+    # headers with data descriptors, so the archive can be streamed out as
+    # it is built and only the pending bytes are held in memory
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
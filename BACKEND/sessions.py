@@ -0,0 +1,338 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+import pose_analysis
+from pose_backends import BUNDLED_TIER, TIERS, AutoTier, available
+from preprocess import FramePreprocessor
+
+
+def live_tier_policy():
+    # fixed tier from config, or an AutoTier starting at "full" (or the cap)
+    tier = config.LIVE_POSE_TIER
+    if tier != "auto":
+        return tier, None
+    start = min("full", config.LIVE_MAX_TIER, key=TIERS.index)
+    return start, AutoTier(start, config.LIVE_MAX_TIER, config.LIVE_LATENCY_BUDGET_MS / 1000.0)
+
+
+class TrackerPool:
+    # Trackers of closed sessions are reset and kept for the next session
+    # instead of being torn down, since building a graph and loading its
+    # models costs far more than a frame. At most `spare` are kept per
+    # (tier, num_poses), keyed on the count sessions ask for, since a
+    # backend may report its own.
+    def __init__(self, spare: int = 2):
+        self.spare = spare
+        self._free = {}
+
+    def get(self, tier: str, num_poses: int = 1):
+        if not available(tier):
+            tier = BUNDLED_TIER
+        free = self._free.get((tier, num_poses))
+        if free:
+            tracker = free.pop()
+            tracker.reset()
+            return tracker
+        return pose_analysis.create_pose(
+            static_image_mode=False, tier=tier, num_poses=num_poses
+        )
+
+    def put(self, tracker, num_poses: int = 1):
+        free = self._free.setdefault((tracker.tier, num_poses), [])
+        if len(free) < self.spare:
+            free.append(tracker)
+        else:
+            tracker.close()
+
+
+# how far (in normalised image coordinates) a body may move between frames
+# and still be taken for the same person
+MATCH_DISTANCE = 0.25
+
+
+class Person:
+    # one tracked body: its own smoothing filter, rep counter and angle series
+    def __init__(self, person_id: int, exercise_key: str | None):
+        self.person_id = person_id
+        self.landmark_filter = pose_analysis.create_filter()
+        self.counter = pose_analysis.RepCounter(exercise_key)
+        self.form_scores = []
+        self.angle_ts = []
+        self.angles = []
+        self.center = None
+        self.last_frame = 0
+
+    def update(self, exercise_key, landmarks, elapsed: float, frame: int):
+        # returns the smoothed landmarks and the joint angle/feedback
+        if self.landmark_filter is not None:
+            landmarks = self.landmark_filter.update(landmarks, time.monotonic())
+        visible = landmarks[:, 3] > 0.5
+        if visible.any():
+            self.center = landmarks[visible, :2].mean(axis=0)
+        self.last_frame = frame
+
+        angle = pose_analysis.exercise_angle(exercise_key, landmarks)
+        feedback = None
+        if angle is not None:
+            angle = float(angle)
+            feedback, score = pose_analysis.assess_form(exercise_key, angle)
+            self.form_scores.append(score)
+            self.angle_ts.append(elapsed)
+            self.angles.append(angle)
+            self.counter.update(angle)
+        return landmarks, angle, feedback
+
+    def state(self) -> dict:
+        return {"reps": self.counter.reps, "stage": self.counter.stage}
+
+    def summary(self) -> dict:
+        rep_times = self.counter.rep_times
+        return {
+            "reps": self.counter.reps,
+            "avg_time": float(np.mean(rep_times)) if rep_times else 0.0,
+            "form_score": float(np.mean(self.form_scores)) if self.form_scores else 0.0,
+            "series": (
+                np.array(self.angle_ts, dtype=np.float32),
+                np.array(self.angles, dtype=np.float32),
+            ),
+        }
+
+
+class LiveSession:
+    # One camera stream. With num_poses > 1 (clinic group sessions) every
+    # detected body is matched to a Person by distance to where each was
+    # last seen; person 0 is the session's own patient.
+    def __init__(
+        self,
+        session_id: str,
+        exercise_key: str | None,
+        num_poses: int = 1,
+        trackers: TrackerPool | None = None,
+    ):
+        self.session_id = session_id
+        self.trackers = trackers or TrackerPool(spare=0)
+        self.patient_id = None
+        self.num_poses = num_poses
+        tier, self.auto_tier = live_tier_policy()
+        self.tracker = self.create_tracker(tier)
+        self.preprocessor = FramePreprocessor(track=num_poses == 1)
+        self.started = time.time()
+        self.last_seen = time.monotonic()
+        self.reset(exercise_key)
+
+    def create_tracker(self, tier: str):
+        return self.trackers.get(tier, self.num_poses)
+
+    def reset(self, exercise_key: str | None):
+        self.exercise_key = exercise_key
+        self.people = [Person(0, exercise_key)]
+        self.frames = 0
+
+    def process(
+        self,
+        image_bytes: bytes,
+        timings=None,
+        wait_s: float = 0.0,
+        budget_s: float | None = None,
+    ) -> dict:
+        received = time.perf_counter()
+        if self.num_poses == 1:
+            landmarks = pose_analysis.detect_landmarks(
+                self.tracker, image_bytes, self.preprocessor, timings
+            )
+            detections = [] if landmarks is None else [landmarks]
+        else:
+            detections = pose_analysis.detect_people(
+                self.tracker, image_bytes, self.preprocessor, timings
+            )
+        self.frames += 1
+
+        started = time.perf_counter()
+        elapsed = time.time() - self.started
+        state = self.state()
+        seen = []
+        for person, landmarks in self.match(detections):
+            landmarks, angle, feedback = person.update(
+                self.exercise_key, landmarks, elapsed, self.frames
+            )
+            seen.append((person, landmarks, angle, feedback))
+        if timings is not None:
+            timings.add("analysis", time.perf_counter() - started)
+        self.adapt_tier(wait_s, time.perf_counter() - received, budget_s)
+
+        if self.num_poses == 1:
+            if not seen:
+                return {"landmarks": None, "session": state}
+            _, landmarks, angle, feedback = seen[0]
+            state.update(self.people[0].state(), angle=angle, feedback=feedback)
+            return {"landmarks": landmarks, "session": state}
+
+        # group sessions return every body's rows stacked, in the order of
+        # state["people"]; the top-level fields stay person 0's
+        seen.sort(key=lambda item: item[0].person_id)
+        state.update(self.people[0].state(), angle=None, feedback=None)
+        state["people"] = []
+        for person, _, angle, feedback in seen:
+            state["people"].append(
+                dict(person.state(), person=person.person_id, angle=angle, feedback=feedback)
+            )
+            if person.person_id == 0:
+                state.update(angle=angle, feedback=feedback)
+        landmarks = np.concatenate([item[1] for item in seen]) if seen else None
+        return {"landmarks": landmarks, "session": state}
+
+    def match(self, detections):
+        # closest pairs first between detected bodies and where each person
+        # was last seen; a body with nobody close by takes a new slot while
+        # there are fewer than num_poses people, else the longest-unseen one
+        if self.num_poses == 1:
+            return [(self.people[0], landmarks) for landmarks in detections]
+        centers = []
+        for landmarks in detections:
+            visible = landmarks[:, 3] > 0.5
+            centers.append(landmarks[visible if visible.any() else slice(None), :2].mean(axis=0))
+        candidates = sorted(
+            (0.0 if person.center is None else float(np.hypot(*(person.center - center))), i, j)
+            for i, center in enumerate(centers)
+            for j, person in enumerate(self.people)
+        )
+        assigned = {}
+        taken = set()
+        for distance, i, j in candidates:
+            if distance > MATCH_DISTANCE:
+                break
+            if i not in assigned and j not in taken:
+                assigned[i] = self.people[j]
+                taken.add(j)
+
+        for i in range(len(detections)):
+            if i in assigned:
+                continue
+            free = [p for j, p in enumerate(self.people) if j not in taken]
+            if len(self.people) < self.num_poses:
+                person = Person(len(self.people), self.exercise_key)
+                self.people.append(person)
+            elif free:
+                person = min(free, key=lambda p: p.last_frame)
+                if person.landmark_filter is not None:
+                    person.landmark_filter.reset()
+            else:
+                continue
+            assigned[i] = person
+            taken.add(person.person_id)
+        return [(assigned[i], detections[i]) for i in sorted(assigned)]
+
+    def adapt_tier(self, wait_s: float, work_s: float, budget_s: float | None):
+        # under load a session drops to a lighter model rather than time out
+        if self.auto_tier is None:
+            return
+        if budget_s:
+            self.auto_tier.budget_s = budget_s
+        tier = self.auto_tier.observe(wait_s, work_s)
+        if tier != self.tracker.tier:
+            self.trackers.put(self.tracker, self.num_poses)
+            self.tracker = self.create_tracker(tier)
+            # the requested model may not have loaded
+            self.auto_tier.tier = self.tracker.tier
+
+    def state(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "exercise_key": self.exercise_key,
+            "reps": self.people[0].counter.reps,
+            "stage": self.people[0].counter.stage,
+            "model": self.tracker.tier,
+        }
+
+    def summary(self) -> dict:
+        summary = self.state()
+        summary.update(self.people[0].summary())
+        summary.update(
+            {
+                "patient_id": self.patient_id,
+                "frames": self.frames,
+                "duration": time.time() - self.started,
+            }
+        )
+        if self.num_poses > 1:
+            summary["people"] = []
+            for person in self.people:
+                person_summary = person.summary()
+                person_summary.pop("series")
+                summary["people"].append(dict(person_summary, person=person.person_id))
+        return summary
+
+    def close(self):
+        self.trackers.put(self.tracker, self.num_poses)
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions: int, idle_ttl: float):
+        self.max_sessions = max(1, max_sessions)
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self.trackers = TrackerPool()
+        # summaries of sessions dropped without an explicit end, until the
+        # worker hands them back to be recorded
+        self.ended = []
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(
+        self,
+        session_id: str,
+        exercise_key: str | None,
+        patient_id: str | None = None,
+        num_poses: int = 1,
+    ) -> LiveSession:
+        self.evict_idle()
+        session = self._sessions.get(session_id)
+        if session is not None and session.num_poses != num_poses:
+            # a different number of people needs another tracker; start over
+            self._sessions.pop(session_id)
+            self._drop(session)
+            session = None
+        if session is None:
+            while len(self._sessions) >= self.max_sessions:
+                _, oldest = self._sessions.popitem(last=False)
+                self._drop(oldest)
+            session = LiveSession(session_id, exercise_key, num_poses, self.trackers)
+            self._sessions[session_id] = session
+        else:
+            self._sessions.move_to_end(session_id)
+            if exercise_key and exercise_key != session.exercise_key:
+                session.reset(exercise_key)
+        if patient_id:
+            session.patient_id = patient_id
+        session.last_seen = time.monotonic()
+        return session
+
+    def end(self, session_id: str) -> dict | None:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        summary = session.summary()
+        session.close()
+        return summary
+
+    def evict_idle(self):
+        # entries are kept in access order, so idle ones sit at the front
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_seen >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            self._drop(session)
+
+    def _drop(self, session: LiveSession):
+        self.ended.append(session.summary())
+        session.close()
+
+    def take_ended(self) -> list:
+        ended, self.ended = self.ended, []
+        return ended
@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+
+def _alpha(cutoff, dt: float):
+    # smoothing factor of a first-order low-pass at `cutoff` Hz
+    tau = 1.0 / (2.0 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class LandmarkFilter:
+    # One-Euro filter over all 33 landmarks at once (x, y, z; visibility is
+    # passed through). The cutoff rises with speed, so slow phases of a rep
+    # are smoothed hard while fast ones keep up without lag.
+    #
+    # Before filtering, a landmark that jumps further from its predicted
+    # position than the gate allows is treated as an outlier and pulled back
+    # towards the prediction in proportion to its visibility: an occluded,
+    # low-visibility point mostly holds, a confident one mostly moves. A
+    # point that keeps "jumping" for max_rejects frames is accepted as real.
+    # After a gap longer than max_gap the filter starts over.
+    #
+    # Defaults were tuned on noisy synthetic squat tracks (jitter, 3% spikes
+    # on low-visibility points, 3% dropped frames): rep counts from filtered
+    # landmarks at 15 fps beat raw ones at 30 fps.
+    def __init__(
+        self,
+        min_cutoff: float = 2.0,
+        beta: float = 25.0,
+        d_cutoff: float = 1.0,
+        gate: float = 0.06,
+        max_rejects: int = 3,
+        max_gap: float = 0.5,
+    ):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.gate = gate
+        self.max_rejects = max_rejects
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.dx = None
+        self.t = None
+        self.rejected = None
+
+    def update(self, landmarks, t: float):
+        # (33, 4) landmarks seen at time t (seconds) -> filtered copy
+        xyz = np.asarray(landmarks[:, :3], dtype=np.float64)
+        if self.x is None or not self.t < t <= self.t + self.max_gap:
+            self.x = xyz.copy()
+            self.dx = np.zeros_like(xyz)
+            self.t = t
+            self.rejected = np.zeros(len(xyz), dtype=np.int32)
+            return landmarks.copy()
+
+        dt = t - self.t
+        predicted = self.x + self.dx * dt
+        residual = np.hypot(*(xyz[:, :2] - predicted[:, :2]).T)
+        speed = np.hypot(*self.dx[:, :2].T)
+        # the gate is set for a 30 fps frame and grows with longer intervals
+        # and with the point's own speed
+        gate = self.gate * max(1.0, dt * 30.0) + 2.0 * speed * dt
+        outlier = (residual > gate) & (self.rejected < self.max_rejects)
+        weight = np.where(outlier, landmarks[:, 3], 1.0)[:, None]
+        measured = predicted + weight * (xyz - predicted)
+        self.rejected = np.where(outlier, self.rejected + 1, 0)
+
+        self.dx += _alpha(self.d_cutoff, dt) * ((measured - self.x) / dt - self.dx)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.dx)
+        self.x += _alpha(cutoff, dt) * (measured - self.x)
+        self.t = t
+
+        out = landmarks.copy()
+        out[:, :3] = self.x
+        return out
+
+
+def fill_gaps(track, timestamps, max_gap: float):
+    # linearly interpolate runs of missing frames (NaN rows) that are at most
+    # max_gap seconds long and have a detection on both sides
+    track = track.copy()
+    found = np.flatnonzero(~np.isnan(track[:, 0, 0]))
+    for a, b in zip(found[:-1], found[1:]):
+        if b - a > 1 and timestamps[b] - timestamps[a] <= max_gap:
+            t = ((timestamps[a + 1:b] - timestamps[a]) / (timestamps[b] - timestamps[a]))
+            track[a + 1:b] = track[a] + (track[b] - track[a]) * t[:, None, None]
+    return track
+
+
+def smooth_track(track, timestamps, landmark_filter: LandmarkFilter):
+    # filter a whole (T, 33, 4) track in time order; NaN rows stay NaN
+    out = track.copy()
+    for i in np.flatnonzero(~np.isnan(track[:, 0, 0])):
+        out[i] = landmark_filter.update(track[i], float(timestamps[i]))
+    return out
@@ -0,0 +1,158 @@
+import os
+
+import pytest
+
+import blobs
+from blobs import BlobStore, variant
+
+SHA = "c" * 64
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(blobs.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path):
+    root = tmp_path / "videos"
+    root.mkdir()
+    store = BlobStore(str(tmp_path / "jobs.db"), str(root))
+    yield store
+    store.close()
+
+
+def upload(store, data=b"video bytes"):
+    path = os.path.join(store.root, f".upload-{os.urandom(4).hex()}.part")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def derived(store, name, size, kind="processed", refs=0):
+    with open(os.path.join(store.root, name), "wb") as f:
+        f.write(b"x" * size)
+    store.add(name, kind, SHA, refs)
+
+
+def exists(store, name):
+    return os.path.isfile(os.path.join(store.root, name))
+
+
+def test_identical_uploads_are_stored_once(store):
+    first = upload(store)
+    name = store.add_source(first, SHA, ".MP4")
+    assert name == f"{SHA}.mp4"
+    assert not os.path.exists(first)
+
+    second = upload(store)
+    assert store.add_source(second, SHA, ".mov") == name
+    assert not os.path.exists(second)
+    assert sorted(os.listdir(store.root)) == [name]
+    assert store.usage() == {"source": len(b"video bytes")}
+
+
+def test_source_lives_until_its_last_reference_goes(store):
+    name = store.add_source(upload(store), SHA, ".mp4")
+    store.add_source(upload(store), SHA, ".mp4")
+    store.release(name)
+    assert exists(store, name)
+    store.release(name)
+    assert not exists(store, name)
+    assert store.usage() == {}
+
+
+def test_source_whose_file_is_gone_is_stored_again(store):
+    name = store.add_source(upload(store), SHA, ".mp4")
+    os.remove(os.path.join(store.root, name))
+    assert store.add_source(upload(store), SHA, ".mp4") == name
+    assert exists(store, name)
+
+
+def test_derived_references_add_up(store):
+    derived(store, "track_a.track", 10, "track", refs=1)
+    store.add("track_a.track", "track", SHA, refs=1)
+    store.release("track_a.track")
+    assert exists(store, "track_a.track")
+    store.release("track_a.track")
+    assert not exists(store, "track_a.track")
+
+
+def test_adding_a_missing_file_does_nothing(store):
+    store.add("proc_missing.mp4", "processed")
+    assert store.usage() == {}
+
+
+def test_evicts_least_recently_served_down_to_the_budget(store, clock):
+    for name in ("proc_a.mp4", "proc_b.mp4", "proc_c.mp4"):
+        derived(store, name, 100)
+        clock.now += 1
+    clock.now += 1
+    store.touch("proc_a.mp4")
+
+    assert store.evict(max_bytes=150, max_age=0) == ["proc_b.mp4", "proc_c.mp4"]
+    assert exists(store, "proc_a.mp4")
+    assert not exists(store, "proc_b.mp4") and not exists(store, "proc_c.mp4")
+    assert store.usage() == {"processed": 100}
+
+
+def test_evicts_idle_files(store, clock):
+    derived(store, "proc_old.mp4", 10)
+    clock.now += 100
+    derived(store, "proc_new.mp4", 10)
+    clock.now += 50
+    assert store.evict(max_bytes=0, max_age=120) == ["proc_old.mp4"]
+    assert store.evict(max_bytes=0, max_age=0) == []
+
+
+def test_only_rebuildable_files_are_evicted(store, clock):
+    store.add_source(upload(store, b"s" * 500), SHA, ".mp4")
+    derived(store, "track_a.track", 100, "track")
+    derived(store, "proc_a.mp4", 100)
+    clock.now += 1000
+
+    assert sorted(store.evict(max_bytes=1, max_age=10)) == ["proc_a.mp4", "track_a.track"]
+    assert store.usage() == {"source": 500}
+
+
+def test_tracks_a_job_refers_to_are_not_evicted(store, clock):
+    # the job holds its track, so its video can still be rendered and served
+    # however small the budget
+    derived(store, "track_a.track", 100, "track", refs=1)
+    derived(store, "proc_a.mp4", 100)
+    clock.now += 1000
+    assert store.evict(max_bytes=1, max_age=10) == ["proc_a.mp4"]
+    assert exists(store, "track_a.track")
+
+    derived(store, "proc_a.mp4", 100)
+    assert store.evict(max_bytes=1, max_age=10, keep=["proc_a.mp4", "track_a.track"]) == []
+    assert exists(store, "proc_a.mp4")
+
+    # once the job expires its track goes with it
+    store.release("track_a.track")
+    assert not exists(store, "track_a.track")
+    assert store.usage() == {"processed": 100}
+
+
+def test_kept_names_survive_eviction(store, clock):
+    derived(store, "proc_a.mp4", 100)
+    clock.now += 1
+    derived(store, "proc_b.mp4", 100)
+    assert store.evict(max_bytes=50, max_age=0, keep=["proc_a.mp4"]) == ["proc_b.mp4"]
+    assert exists(store, "proc_a.mp4")
+
+
+def test_variant_is_stable_and_settings_sensitive():
+    assert variant("squat", 10, "full") == variant("squat", 10, "full")
+    assert variant("squat", 10, "full") != variant("squat", None, "full")
+    assert len(variant("squat")) == 12
@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+
+import config
+from exercises import load_exercises
+from landmarks import LANDMARK_INDEX, POSE_CONNECTIONS
+from pose_analysis import RepCounter
+
+SPECS, DEFAULT = load_exercises(config.EXERCISES_FILE, LANDMARK_INDEX, POSE_CONNECTIONS)
+
+# the rules exercises.json replaced, as they were written in code
+BASELINE_RANGES = {
+    "bicep_curl": (30, 160),
+    "squat": (70, 160),
+    "shoulder_abduction": (70, 160),
+    "knee_extension": (0, 160),
+    "leg_raise": (40, 150),
+    "side_bend": (10, 35),
+}
+
+BASELINE_REPS = {
+    "bicep_curl": ("down", 150, "up", 50),
+    "shoulder_abduction": ("down", 150, "up", 50),
+    "squat": ("up", 160, "down", 100),
+    "knee_extension": ("up", 160, "down", 100),
+    "leg_raise": ("up", 160, "down", 100),
+    "side_bend": ("up", 40, "down", 25),
+}
+
+
+def baseline_assess(exercise, angle):
+    ideal_min, ideal_max = BASELINE_RANGES.get(exercise, (60, 150))
+    if angle < ideal_min:
+        diff = ideal_min - angle
+    elif angle > ideal_max:
+        diff = angle - ideal_max
+    else:
+        diff = 0
+    score = max(0.0, 1.0 - (diff / 60))
+
+    feedback = "Keep form consistent."
+    if exercise == "bicep_curl":
+        if angle < 60:
+            feedback = "Great contraction!"
+        elif angle > 160:
+            feedback = "Full extension!"
+        else:
+            feedback = "Complete your motion fully."
+    elif exercise == "squat":
+        if angle < 95:
+            feedback = "Nice deep squat!"
+        elif angle > 160:
+            feedback = "Standing tall."
+        else:
+            feedback = "Try going a bit lower."
+    elif exercise == "shoulder_abduction":
+        feedback = "Good arm raise!" if angle > 120 else "Lift higher for full range."
+    elif exercise == "knee_extension":
+        feedback = "Full knee extension achieved!" if angle > 160 else "Straighten knee more."
+    elif exercise == "leg_raise":
+        feedback = "Leg raised high enough!" if angle > 140 else "Lift leg higher."
+    elif exercise == "side_bend":
+        feedback = "Nice side bend!" if 15 < angle < 35 else "Bend slightly more to side."
+    return feedback, score
+
+
+def baseline_reps(exercise, angles):
+    armed_stage, arm_above, counted_stage, count_below = BASELINE_REPS[exercise]
+    stage, reps, stages = None, 0, []
+    for angle in angles:
+        if angle > arm_above:
+            stage = armed_stage
+        if angle < count_below and stage == armed_stage:
+            stage = counted_stage
+            reps += 1
+        stages.append(stage)
+    return reps, stages
+
+
+# half-degree steps land exactly on every threshold as well as either side
+ANGLES = np.arange(-20.0, 200.5, 0.5)
+
+
+def test_every_baseline_exercise_is_defined():
+    assert set(SPECS) == set(BASELINE_RANGES)
+
+
+@pytest.mark.parametrize("key", sorted(BASELINE_RANGES))
+def test_assess_matches_baseline(key):
+    spec = SPECS[key]
+    for angle in ANGLES:
+        text, score = spec.assess(float(angle))
+        expected_text, expected_score = baseline_assess(key, float(angle))
+        assert text == expected_text, angle
+        assert score == pytest.approx(expected_score), angle
+
+
+@pytest.mark.parametrize("key", sorted(BASELINE_RANGES))
+def test_assess_many_matches_assess(key):
+    spec = SPECS[key]
+    feedback, scores = spec.assess_many(ANGLES)
+    assert feedback.shape == scores.shape == ANGLES.shape
+    for angle, index, score in zip(ANGLES.tolist(), feedback.tolist(), scores.tolist()):
+        text, expected_score = spec.assess(angle)
+        assert spec.feedback_texts[index] == text, angle
+        assert score == pytest.approx(expected_score), angle
+
+
+def test_unknown_exercise_uses_default():
+    for angle in ANGLES.tolist():
+        text, score = DEFAULT.assess(angle)
+        assert (text, pytest.approx(score)) == baseline_assess("unknown", angle)
+
+
+@pytest.mark.parametrize("key", sorted(BASELINE_REPS))
+def test_rep_counter_matches_baseline(key):
+    # a random walk over the whole range, on a half-degree grid so it sits
+    # on the thresholds now and then
+    rng = np.random.default_rng(sum(map(ord, key)))
+    walk = np.abs(np.cumsum(rng.normal(0, 12, 3000)) % 360 - 180)
+    angles = np.round(walk * 2) / 2
+    expected_reps, expected_stages = baseline_reps(key, angles.tolist())
+
+    counter = RepCounter(key)
+    stages = []
+    for i, angle in enumerate(angles.tolist()):
+        counter.update(angle, float(i))
+        stages.append(counter.stage)
+    assert expected_reps > 10
+    assert counter.reps == expected_reps
+    assert stages == expected_stages
+    assert len(counter.rep_times) == counter.reps - 1
+
+
+def test_rep_counter_without_reps_never_counts():
+    counter = RepCounter("unknown")
+    for angle in (0, 180, 0, 180):
+        assert not counter.update(angle, 0.0)
+    assert counter.reps == 0
+    assert counter.stage is None
+    assert counter.next_threshold() is None
@@ -0,0 +1,73 @@
+import struct
+
+import numpy as np
+import pytest
+
+from frame_codec import (
+    OCTET_STREAM,
+    landmarks_bytes,
+    negotiate_format,
+    pack_message,
+    unpack_message,
+)
+
+
+def test_round_trip():
+    header = {"seq": 7, "session_id": "abc", "ts": 1.5}
+    payload = b"\xff\xd8 jpeg bytes \xff\xd9"
+    assert unpack_message(pack_message(header, payload)) == (header, payload)
+
+
+def test_header_length_prefix_is_big_endian():
+    message = pack_message({"a": 1})
+    (size,) = struct.unpack(">H", message[:2])
+    assert message[2:2 + size] == b'{"a":1}'
+    assert len(message) == 2 + size
+
+
+def test_empty_header_and_payload():
+    assert unpack_message(b"\x00\x00") == ({}, b"")
+    assert unpack_message(b"\x00\x00jpeg") == ({}, b"jpeg")
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        (b"", "Truncated message"),
+        (b"\x00", "Truncated message"),
+        (b"\x00\x10{}", "Truncated header"),
+        (b"\x00\x02[]", "Header must be a JSON object"),
+        (b"\x00\x02\"x", None),
+        (b"\x00\x03{x}", None),
+    ],
+)
+def test_malformed_messages_raise_value_error(data, error):
+    with pytest.raises(ValueError, match=error):
+        unpack_message(data)
+
+
+def test_landmarks_bytes():
+    landmarks = np.arange(33 * 4, dtype=np.float64).reshape(33, 4)
+    raw = landmarks_bytes(landmarks)
+    assert len(raw) == 33 * 4 * 4
+    np.testing.assert_array_equal(np.frombuffer(raw, dtype="<f4").reshape(33, 4), landmarks)
+    assert landmarks_bytes(None) == b""
+
+
+@pytest.mark.parametrize(
+    "requested, accept, expected",
+    [
+        (None, "", "json"),
+        (None, "application/json", "json"),
+        (None, f"{OCTET_STREAM}, application/json", "f32"),
+        ("b64", OCTET_STREAM, "b64"),
+        ("json", OCTET_STREAM, "json"),
+    ],
+)
+def test_negotiate_format(requested, accept, expected):
+    assert negotiate_format(requested, accept) == expected
+
+
+def test_negotiate_unknown_format():
+    with pytest.raises(ValueError):
+        negotiate_format("xml", "")
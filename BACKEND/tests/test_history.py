@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from history import SessionStore, decode_series, encode_series
+
+DAY = 86400.0
+WEEK = 7 * DAY
+# a Monday, so week buckets line up with the sessions below
+START = 1767571200.0
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / "history.db"))
+    yield store
+    store.close()
+
+
+def record(store, created_at, form_score, reps=10, avg_time=2.0, rom=None, exercise_key="squat", patient_id="p1"):
+    series = None
+    if rom is not None:
+        series = (np.arange(3, dtype=np.float32), np.array([90.0, 90.0 + rom, 100.0], dtype=np.float32))
+    return store.record(
+        {
+            "patient_id": patient_id,
+            "exercise_key": exercise_key,
+            "source": "video",
+            "created_at": created_at,
+            "reps": reps,
+            "avg_time": avg_time,
+            "form_score": form_score,
+        },
+        series,
+    )
+
+
+def test_summary_and_weekly_trends(store):
+    # form improves by 0.1 and range of motion by 10 degrees a week
+    for week in range(4):
+        record(store, START + week * WEEK, 0.5 + 0.1 * week, reps=10 + week, rom=40 + 10 * week)
+    record(store, START + 3 * WEEK + DAY, 0.8, reps=0, avg_time=0.0, rom=70)
+
+    (squat,) = store.progress("p1")
+    assert squat["exercise_key"] == "squat"
+    assert squat["sessions"] == 5
+    assert squat["total_reps"] == 10 + 11 + 12 + 13
+    assert squat["avg_form_score"] == pytest.approx((0.5 + 0.6 + 0.7 + 0.8 + 0.8) / 5)
+    assert squat["best_form_score"] == pytest.approx(0.8)
+    # rep time averages only sessions that measured one
+    assert squat["avg_rep_time"] == pytest.approx(2.0)
+    assert squat["avg_rom"] == pytest.approx((40 + 50 + 60 + 70 + 70) / 5)
+    assert squat["best_rom"] == pytest.approx(70)
+    assert squat["first_session"] == START
+    assert squat["last_session"] == START + 3 * WEEK + DAY
+    assert squat["form_trend"] == pytest.approx(0.1, abs=0.02)
+    assert squat["rom_trend"] == pytest.approx(10, abs=1.5)
+
+    weeks = squat["periods"]
+    assert [period["sessions"] for period in weeks] == [1, 1, 1, 2]
+    assert [period["reps"] for period in weeks] == [10, 11, 12, 13]
+    assert weeks[3]["avg_form_score"] == pytest.approx(0.8)
+    assert weeks[3]["avg_rom"] == pytest.approx(70)
+
+
+def test_exact_trend_with_regular_sessions(store):
+    for week in range(5):
+        record(store, START + week * WEEK, 0.4 + 0.05 * week, rom=30 + 2 * week)
+    (squat,) = store.progress("p1")
+    assert squat["form_trend"] == pytest.approx(0.05)
+    assert squat["rom_trend"] == pytest.approx(2)
+
+
+def test_no_trend_within_a_day(store):
+    record(store, START, 0.5, rom=40)
+    record(store, START + 3600, 0.9, rom=60)
+    (squat,) = store.progress("p1")
+    assert squat["form_trend"] is None
+    assert squat["rom_trend"] is None
+
+
+def test_sessions_without_series_have_no_rom(store):
+    record(store, START, 0.5)
+    record(store, START + 2 * WEEK, 0.7)
+    (squat,) = store.progress("p1")
+    assert squat["avg_rom"] is None
+    assert squat["rom_trend"] is None
+    assert squat["form_trend"] == pytest.approx(0.1)
+
+
+def test_filters_and_periods(store):
+    record(store, START, 0.5)
+    record(store, START + DAY, 0.6)
+    record(store, START + 40 * DAY, 0.7)
+    record(store, START, 0.9, exercise_key="bicep_curl")
+    record(store, START, 0.1, patient_id="p2")
+
+    assert [row["exercise_key"] for row in store.progress("p1")] == ["bicep_curl", "squat"]
+    (squat,) = store.progress("p1", "squat")
+    assert squat["sessions"] == 3
+
+    (squat,) = store.progress("p1", "squat", since=START + DAY)
+    assert squat["sessions"] == 2
+    (squat,) = store.progress("p1", "squat", until=START + DAY)
+    assert squat["sessions"] == 1
+
+    (squat,) = store.progress("p1", "squat", period="day")
+    assert [period["period"] for period in squat["periods"]] == ["2026-01-05", "2026-01-06", "2026-02-14"]
+    (squat,) = store.progress("p1", "squat", period="month")
+    assert [period["period"] for period in squat["periods"]] == ["2026-01", "2026-02"]
+    assert [period["sessions"] for period in squat["periods"]] == [2, 1]
+
+    assert store.progress("nobody") == []
+    assert store.progress("p1", since=START + 100 * DAY) == []
+
+
+def test_series_round_trip():
+    timestamps = np.arange(0, 30, 1 / 15)
+    angles = 120 + 40 * np.sin(timestamps)
+    decoded_ts, decoded_angles = decode_series(encode_series(timestamps, angles), len(angles))
+    np.testing.assert_allclose(decoded_ts, timestamps, atol=5e-4)
+    np.testing.assert_allclose(decoded_angles, angles, atol=0.1)
@@ -0,0 +1,77 @@
+import pytest
+
+from jobs import JobStore
+
+HASH = "a" * 64
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def track(tmp_path):
+    path = tmp_path / "track_a.track"
+    path.write_bytes(b"track")
+    return str(path)
+
+
+def finished(store, track_path, content_hash=HASH, exercise_key="squat", **settings):
+    payload = {"analysis_fps": 10, "pose_tier": "full", "pipeline": "1-abc", "track_path": track_path}
+    payload.update(settings)
+    job = store.create("video", payload, {"patient_id": "p"}, content_hash, exercise_key)
+    store.finish(job["id"], {"reps": 3, "frames": 30})
+    return job
+
+
+def test_hit_needs_the_same_clip_exercise_and_settings(store, track):
+    job = finished(store, track)
+    assert store.find_cached(HASH, "squat", 10, "full", "1-abc")["id"] == job["id"]
+
+    assert store.find_cached("b" * 64, "squat", 10, "full", "1-abc") is None
+    assert store.find_cached(HASH, "bicep_curl", 10, "full", "1-abc") is None
+    assert store.find_cached(HASH, "squat", 15, "full", "1-abc") is None
+    assert store.find_cached(HASH, "squat", None, "full", "1-abc") is None
+    assert store.find_cached(HASH, "squat", 10, "lite", "1-abc") is None
+    assert store.find_cached(HASH, "squat", 10, "full", "2-abc") is None
+
+
+def test_unset_settings_only_match_unset(store, track):
+    job = finished(store, track, analysis_fps=None)
+    assert store.find_cached(HASH, "squat", None, "full", "1-abc")["id"] == job["id"]
+    assert store.find_cached(HASH, "squat", 0, "full", "1-abc") is None
+
+
+def test_only_finished_analyses_are_reused(store, track):
+    payload = {"analysis_fps": 10, "pose_tier": "full", "pipeline": "1-abc", "track_path": track}
+    queued = store.create("video", payload, {}, HASH, "squat")
+    assert store.find_cached(HASH, "squat", 10, "full", "1-abc") is None
+    store.fail(queued["id"], "broken", 500)
+    assert store.find_cached(HASH, "squat", 10, "full", "1-abc") is None
+
+
+def test_cached_copies_are_not_sources(store, track):
+    job = finished(store, track)
+    copy = store.create_cached(job, {"patient_id": "q"})
+    assert copy["cached"] and copy["status"] == "done"
+    assert store.find_cached(HASH, "squat", 10, "full", "1-abc")["id"] == job["id"]
+
+
+def test_result_without_its_track_is_skipped(store, track, tmp_path):
+    gone = finished(store, str(tmp_path / "evicted.track"))
+    assert store.find_cached(HASH, "squat", 10, "full", "1-abc") is None
+    kept = finished(store, track)
+    assert gone["created_at"] <= kept["created_at"]
+    assert store.find_cached(HASH, "squat", 10, "full", "1-abc")["id"] == kept["id"]
+
+
+def test_find_cached_for_uses_the_jobs_own_key(store, track):
+    job = finished(store, track)
+    payload = {"analysis_fps": 10, "pose_tier": "full", "pipeline": "1-abc", "track_path": track}
+    again = store.create("video", payload, {}, HASH, "squat")
+    assert store.find_cached_for(again)["id"] == job["id"]
+    other = store.create("video", dict(payload, pose_tier="heavy"), {}, HASH, "squat")
+    assert store.find_cached_for(other) is None
@@ -0,0 +1,136 @@
+import struct
+
+import numpy as np
+import pytest
+
+from mp4 import CONTAINERS, faststart
+
+CHUNKS = [b"first chunk", b"second", b"and the third chunk"]
+
+
+def box(kind: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def stco(offsets):
+    return box(b"stco", struct.pack(">II", 0, len(offsets)) + b"".join(struct.pack(">I", o) for o in offsets))
+
+
+def co64(offsets):
+    return box(b"co64", struct.pack(">II", 0, len(offsets)) + b"".join(struct.pack(">Q", o) for o in offsets))
+
+
+def movie(table=stco, tracks=2):
+    # ftyp, free, mdat, then moov last as OpenCV writes it; every track's
+    # chunk offset table points into mdat
+    head = box(b"ftyp", b"isom\x00\x00\x02\x00") + box(b"free", b"\x00" * 4)
+    mdat = box(b"mdat", b"".join(CHUNKS))
+    offsets, pos = [], len(head) + 8
+    for chunk in CHUNKS:
+        offsets.append(pos)
+        pos += len(chunk)
+    trak = box(b"trak", box(b"tkhd", b"\x00" * 12) + box(b"mdia", box(b"minf", box(b"stbl", table(offsets)))))
+    moov = box(b"moov", box(b"mvhd", b"\x00" * 16) + trak * tracks + box(b"udta", b"\x00" * 8))
+    return head + mdat + moov
+
+
+def top_level(data: bytes):
+    boxes, pos = [], 0
+    while pos < len(data):
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        boxes.append((kind, pos, size))
+        pos += size
+    return boxes
+
+
+def chunk_offsets(data: bytes, start: int = 0, end: int | None = None):
+    # every stco/co64 entry, walking the same containers as faststart
+    end = len(data) if end is None else end
+    offsets = []
+    while start < end:
+        size, kind = struct.unpack_from(">I4s", data, start)
+        if kind in CONTAINERS:
+            offsets += chunk_offsets(data, start + 8, start + size)
+        elif kind in (b"stco", b"co64"):
+            (count,) = struct.unpack_from(">I", data, start + 12)
+            fmt = ">I" if kind == b"stco" else ">Q"
+            width = struct.calcsize(fmt)
+            offsets += [struct.unpack_from(fmt, data, start + 16 + i * width)[0] for i in range(count)]
+        start += size
+    return offsets
+
+
+@pytest.mark.parametrize("table", [stco, co64])
+def test_moves_moov_before_mdat_and_shifts_offsets(tmp_path, table):
+    path = tmp_path / "video.mp4"
+    original = movie(table)
+    path.write_bytes(original)
+
+    assert faststart(str(path)) is True
+
+    data = path.read_bytes()
+    assert len(data) == len(original)
+    assert [kind for kind, _, _ in top_level(data)] == [b"ftyp", b"free", b"moov", b"mdat"]
+    offsets = chunk_offsets(data)
+    assert len(offsets) == 2 * len(CHUNKS)
+    for offset, chunk in zip(offsets, CHUNKS * 2):
+        assert data[offset:offset + len(chunk)] == chunk
+
+
+def test_already_fast_is_left_alone(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(movie())
+    faststart(str(path))
+    data = path.read_bytes()
+    assert faststart(str(path)) is False
+    assert path.read_bytes() == data
+
+
+def test_rejects_files_it_cannot_fix(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(box(b"ftyp", b"isom") + box(b"free"))
+    with pytest.raises(ValueError, match="not an mp4"):
+        faststart(str(path))
+
+    path.write_bytes(movie() + box(b"mdat", b"late"))
+    with pytest.raises(ValueError, match="media data after moov"):
+        faststart(str(path))
+
+
+def test_stco_overflow(tmp_path):
+    path = tmp_path / "video.mp4"
+    head = box(b"ftyp", b"isom")
+    stbl = box(b"stbl", stco([2**32 - 4]))
+    path.write_bytes(head + box(b"mdat", b"x") + box(b"moov", box(b"trak", box(b"mdia", box(b"minf", stbl)))))
+    with pytest.raises(ValueError, match="overflow"):
+        faststart(str(path))
+
+
+def decode(cv2, path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def test_opencv_output_decodes_the_same(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    path = str(tmp_path / "video.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(10):
+        writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    writer.release()
+    before = decode(cv2, path)
+
+    assert faststart(path) is True
+    kinds = [kind for kind, _, _ in top_level(open(path, "rb").read())]
+    assert kinds.index(b"moov") < kinds.index(b"mdat")
+    after = decode(cv2, path)
+    assert len(after) == len(before) == 10
+    for frame, expected in zip(after, before):
+        np.testing.assert_array_equal(frame, expected)
@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+import pytest
+
+from pose_analysis import EXERCISE_TRIPLETS, exercise_angle, joint_angles
+
+
+def angle_at(a, b, c):
+    # the per-point angle the vectorised kernel replaced
+    radians = math.atan2(c[1] - b[1], c[0] - b[0]) - math.atan2(a[1] - b[1], a[0] - b[0])
+    angle = abs(math.degrees(radians))
+    return 360 - angle if angle > 180 else angle
+
+
+def frame_with(points):
+    # a (33, 4) frame with the given (x, y) at the first landmarks
+    frame = np.zeros((33, 4), dtype=np.float32)
+    frame[: len(points), :2] = points
+    return frame
+
+
+@pytest.mark.parametrize(
+    "points, expected",
+    [
+        ([(1, 0), (0, 0), (0, 1)], 90.0),
+        ([(-1, 0), (0, 0), (1, 0)], 180.0),
+        ([(1, 0), (0, 0), (2, 0)], 0.0),
+        ([(1, 0), (0, 0), (1, 1)], 45.0),
+        ([(1, 0), (0, 0), (-1, -1)], 135.0),
+    ],
+)
+def test_known_angles(points, expected):
+    triplets = np.array([[0, 1, 2]], dtype=np.intp)
+    assert joint_angles(frame_with(points), triplets) == pytest.approx([expected])
+
+
+def test_matches_per_point_angles_over_a_track():
+    rng = np.random.default_rng(7)
+    track = rng.random((50, 33, 4))
+    triplets = np.array([[11, 13, 15], [12, 14, 16], [23, 25, 27]], dtype=np.intp)
+    angles = joint_angles(track, triplets)
+    assert angles.shape == (50, 3)
+    for t in range(50):
+        for j, (a, b, c) in enumerate(triplets):
+            expected = angle_at(track[t, a, :2], track[t, b, :2], track[t, c, :2])
+            assert angles[t, j] == pytest.approx(expected, abs=1e-6)
+
+
+def test_frame_and_track_share_the_kernel():
+    rng = np.random.default_rng(3)
+    track = rng.random((4, 33, 4))
+    triplets = EXERCISE_TRIPLETS["squat"]
+    together = joint_angles(track, triplets)
+    assert together.shape == (4, len(triplets))
+    for t in range(4):
+        np.testing.assert_allclose(joint_angles(track[t], triplets), together[t])
+    # only x and y count
+    np.testing.assert_allclose(joint_angles(track[..., :2], triplets), together)
+
+
+def test_angles_stay_within_half_a_turn():
+    rng = np.random.default_rng(11)
+    angles = joint_angles(rng.normal(size=(200, 33, 2)), EXERCISE_TRIPLETS["side_bend"])
+    assert (angles >= 0).all() and (angles <= 180).all()
+
+
+def test_exercise_angle_averages_the_joints():
+    rng = np.random.default_rng(5)
+    track = rng.random((10, 33, 4))
+    triplets = EXERCISE_TRIPLETS["bicep_curl"]
+    np.testing.assert_allclose(
+        exercise_angle("bicep_curl", track), joint_angles(track, triplets).mean(axis=-1)
+    )
+    assert exercise_angle("unknown", track) is None
@@ -0,0 +1,246 @@
+import asyncio
+import queue
+import threading
+
+import pytest
+
+from pose_pool import PoolBusy, PoolUnavailable, PosePool
+
+
+class FakeProcess:
+    def __init__(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        self.alive = False
+
+    def terminate(self):
+        self.alive = False
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    # pools whose workers never read their task queues, which hold `room`
+    # messages each, so tasks stay in flight for as long as a test needs
+    pools = []
+
+    def make(size=1, queue_size=2, room=None, **options):
+        pool = PosePool("test", size, queue_size, **options)
+        monkeypatch.setattr(
+            pool,
+            "_spawn",
+            lambda index: {
+                "process": FakeProcess(),
+                "tasks": queue.Queue(maxsize=room or queue_size),
+                "inflight": 0,
+                "sessions": 0,
+                "batch": [],
+                "warm": True,
+            },
+        )
+        pool.start()
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        # a deadlocked pool keeps its lock; stopping it would hang too
+        if pool._lock.acquire(timeout=1):
+            pool._lock.release()
+            pool.stop()
+
+
+def answer(pool, index=0, value="ok"):
+    # stand in for the worker: take what it was sent and hand back results
+    sent = pool._workers[index]["tasks"].get_nowait()
+    stats = {"run_s": 0.0, "stages": {}, "sessions": None, "ended": []}
+    tasks = sent if isinstance(sent, list) else [sent]
+    results = [("done", task[0], value, stats) for task in tasks]
+    if isinstance(sent, list):
+        pool._results.put(("batch", None, results, None))
+    else:
+        pool._results.put(results[0])
+    return len(tasks)
+
+
+def run(main, timeout=10):
+    # a pool that deadlocks blocks the event loop itself, so the loop runs
+    # on a thread that can be given up on
+    outcome = {}
+
+    def target():
+        try:
+            outcome["value"] = asyncio.run(main())
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "event loop is stuck"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("value")
+
+
+def test_full_worker_is_busy(fake_pool):
+    pool = fake_pool(queue_size=2)
+    pool._avg_task_s = 3.0
+
+    async def main():
+        pending = [asyncio.ensure_future(pool.submit("frame", {})) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(PoolBusy) as e:
+            await pool.submit("frame", {})
+        for task in pending:
+            task.cancel()
+        return e.value.retry_after
+
+    # two tasks queued on the one worker at 3s each
+    assert run(main) == 6
+    assert pool.depth() == 2
+    assert pool.retry_after() == 6
+
+
+def test_full_task_queue_is_busy(fake_pool):
+    pool = fake_pool(queue_size=4, room=1)
+
+    async def main():
+        first = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        with pytest.raises(PoolBusy) as e:
+            await pool.submit("frame", {})
+        first.cancel()
+        return e.value.retry_after
+
+    assert run(main) >= 1
+    assert pool.depth() == 1
+
+
+def test_retry_after_spreads_the_backlog_over_workers(fake_pool):
+    pool = fake_pool(size=2, queue_size=4)
+    pool._avg_task_s = 2.0
+
+    async def main():
+        pending = [asyncio.ensure_future(pool.submit("frame", {})) for _ in range(6)]
+        await asyncio.sleep(0)
+        for task in pending:
+            task.cancel()
+
+    run(main)
+    # six tasks over two workers, three each at 2s
+    assert pool.retry_after() == 6
+
+
+def test_batch_that_overflows_the_queue_is_busy(fake_pool):
+    # the first task fills the worker's queue; the next two are batched
+    # behind it and the full batch is flushed straight away
+    pool = fake_pool(queue_size=4, room=1, batch_max=2, batch_window_ms=1000)
+
+    async def main():
+        first = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        batched = [asyncio.ensure_future(pool.submit("frame", {})) for _ in range(2)]
+        results = await asyncio.gather(*batched, return_exceptions=True)
+        first.cancel()
+        return results
+
+    results = run(main)
+    assert all(isinstance(result, PoolBusy) for result in results)
+    assert pool.depth() == 1
+
+
+def test_batch_flushed_by_its_window_is_busy(fake_pool):
+    pool = fake_pool(queue_size=4, room=1, batch_max=4, batch_window_ms=10)
+
+    async def main():
+        first = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        with pytest.raises(PoolBusy):
+            await pool.submit("frame", {})
+        first.cancel()
+
+    run(main)
+    assert pool.depth() == 1
+
+
+def test_finished_task_makes_room(fake_pool):
+    pool = fake_pool(queue_size=1)
+
+    async def main():
+        first = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        with pytest.raises(PoolBusy):
+            await pool.submit("frame", {})
+        answer(pool)
+        assert await first == "ok"
+
+        second = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        answer(pool, value="again")
+        return await second
+
+    assert run(main) == "again"
+    assert pool.depth() == 0
+    assert pool.retry_after() == 1
+
+
+def test_held_batch_goes_out_when_the_worker_answers(fake_pool):
+    pool = fake_pool(queue_size=4, batch_max=4, batch_window_ms=1000)
+
+    async def main():
+        first = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        batched = [asyncio.ensure_future(pool.submit("frame", {})) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert pool._workers[0]["tasks"].qsize() == 1
+        answer(pool)
+        await first
+        # the two held tasks arrive as one message and are answered as one
+        while pool._workers[0]["tasks"].empty():
+            await asyncio.sleep(0.01)
+        assert answer(pool) == 2
+        return await asyncio.gather(*batched)
+
+    assert run(main) == ["ok", "ok"]
+    assert pool.depth() == 0
+
+
+def test_dead_worker_fails_its_tasks_and_is_replaced(fake_pool):
+    pool = fake_pool(queue_size=2)
+    dead = pool._workers[0]
+
+    async def main():
+        pending = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        dead["process"].alive = False
+        with pytest.raises(PoolUnavailable, match="crashed"):
+            await pending
+
+        assert pool._workers[0] is not dead
+        assert pool.depth() == 0
+        retried = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        answer(pool)
+        return await retried
+
+    assert run(main) == "ok"
+
+
+def test_stop_fails_pending_tasks(fake_pool):
+    pool = fake_pool(queue_size=2)
+
+    async def main():
+        pending = asyncio.ensure_future(pool.submit("frame", {}))
+        await asyncio.sleep(0)
+        pool.stop()
+        with pytest.raises(PoolUnavailable, match="stopped"):
+            await pending
+        with pytest.raises(PoolUnavailable, match="not running"):
+            await pool.submit("frame", {})
+
+    run(main)
+    assert pool.status()["workers"] == 0
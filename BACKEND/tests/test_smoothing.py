@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from smoothing import LandmarkFilter, fill_gaps, smooth_track
+
+FPS = 30.0
+
+
+def still_pose(visibility=0.9):
+    pose = np.full((33, 4), 0.5, dtype=np.float32)
+    pose[:, 3] = visibility
+    return pose
+
+
+def settled_filter(frames=30):
+    landmark_filter = LandmarkFilter()
+    for i in range(frames):
+        landmark_filter.update(still_pose(), i / FPS)
+    return landmark_filter
+
+
+def test_first_frame_passes_through():
+    pose = still_pose()
+    out = LandmarkFilter().update(pose, 0.0)
+    np.testing.assert_array_equal(out, pose)
+    assert out is not pose
+
+
+def test_jitter_is_smoothed():
+    rng = np.random.default_rng(1)
+    landmark_filter = LandmarkFilter()
+    seen, smoothed = [], []
+    for i in range(90):
+        pose = still_pose()
+        pose[:, :2] += rng.normal(0, 0.005, (33, 2))
+        seen.append(pose)
+        smoothed.append(landmark_filter.update(pose, i / FPS))
+    assert np.std(np.array(smoothed)[30:, :, :2]) < 0.7 * np.std(np.array(seen)[30:, :, :2])
+
+
+def test_steady_motion_is_followed_without_lag():
+    landmark_filter = LandmarkFilter()
+    for i in range(60):
+        pose = still_pose()
+        pose[:, 0] = 0.2 + 0.3 * i / FPS
+        out = landmark_filter.update(pose, i / FPS)
+    # well under one frame's movement behind
+    assert abs(out[0, 0] - pose[0, 0]) < 0.3 / FPS
+
+
+def test_visibility_is_passed_through():
+    landmark_filter = settled_filter()
+    pose = still_pose(0.25)
+    pose[:, :2] += 0.01
+    out = landmark_filter.update(pose, 1.0)
+    np.testing.assert_array_equal(out[:, 3], pose[:, 3])
+
+
+def test_spike_on_an_unsure_point_mostly_holds():
+    landmark_filter = settled_filter()
+    pose = still_pose()
+    pose[5, :2] += 0.3
+    pose[5, 3] = 0.1
+    out = landmark_filter.update(pose, 1.0)
+    assert abs(out[5, 0] - 0.5) < 0.05
+    np.testing.assert_allclose(out[6, :2], 0.5)
+
+
+def test_spike_on_a_confident_point_mostly_moves():
+    landmark_filter = settled_filter()
+    pose = still_pose()
+    pose[5, :2] += 0.3
+    pose[5, 3] = 1.0
+    out = landmark_filter.update(pose, 1.0)
+    assert out[5, 0] - 0.5 > 0.2
+
+
+def test_a_jump_that_stays_is_accepted():
+    landmark_filter = settled_filter()
+    pose = still_pose(0.1)
+    pose[5, :2] += 0.3
+    for i in range(30, 45):
+        out = landmark_filter.update(pose, i / FPS)
+    assert out[5, 0] == pytest.approx(0.8, abs=0.01)
+
+
+@pytest.mark.parametrize("t", [29 / FPS + 1.0, 0.5 / FPS])
+def test_gap_or_time_going_back_starts_over(t):
+    landmark_filter = settled_filter()
+    pose = still_pose()
+    pose[:, :2] = 0.1
+    np.testing.assert_array_equal(landmark_filter.update(pose, t), pose)
+
+
+def test_reset_starts_over():
+    landmark_filter = settled_filter()
+    landmark_filter.reset()
+    pose = still_pose()
+    pose[:, :2] = 0.1
+    np.testing.assert_array_equal(landmark_filter.update(pose, 2.0), pose)
+
+
+def test_fill_gaps_bridges_short_runs_only():
+    timestamps = np.arange(10) / 10.0
+    track = np.repeat(still_pose()[None], 10, axis=0)
+    track[0, :, 0] = 0.0
+    track[3, :, 0] = 0.3
+    track[1:3] = np.nan
+    track[4:9] = np.nan
+    track[9, :, 0] = 0.9
+    filled = fill_gaps(track, timestamps, max_gap=0.3)
+    np.testing.assert_allclose(filled[1:3, 0, 0], [0.1, 0.2], atol=1e-6)
+    assert np.isnan(filled[4:9]).all()
+    assert np.isnan(track[1:3]).all()
+
+
+def test_smooth_track_keeps_missing_frames_missing():
+    timestamps = np.arange(6) / FPS
+    track = np.repeat(still_pose()[None], 6, axis=0)
+    track[2] = np.nan
+    out = smooth_track(track, timestamps, LandmarkFilter())
+    assert np.isnan(out[2]).all()
+    assert not np.isnan(np.delete(out, 2, axis=0)).any()
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from starlette.requests import Request
+
+from uploads import MAX_FIELD_BYTES, UploadError, receive_upload
+
+BOUNDARY = "testboundary"
+
+
+def multipart(fields=(), files=()):
+    body = b""
+    for name, value in fields:
+        body += (
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n"
+        ).encode() + value + b"\r\n"
+    for name, filename, data in files:
+        body += (
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"; "
+            f"filename=\"{filename}\"\r\nContent-Type: video/mp4\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def request(body: bytes, content_type=f"multipart/form-data; boundary={BOUNDARY}", length=True, chunk=1000):
+    headers = [(b"content-type", content_type.encode())]
+    if length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    parts = [body[i:i + chunk] for i in range(0, len(body), chunk)] or [b""]
+    messages = [
+        {"type": "http.request", "body": part, "more_body": i < len(parts) - 1}
+        for i, part in enumerate(parts)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers}, receive)
+
+
+def receive(req, dest, max_bytes=10_000, chunk_size=256):
+    return asyncio.run(receive_upload(req, str(dest), max_bytes, chunk_size))
+
+
+def test_streams_file_to_disk_and_hashes_it(tmp_path):
+    data = os.urandom(5000)
+    body = multipart([("exercise_key", b"squat"), ("reps", b"10")], [("file", "clip.mp4", data)])
+    fields, upload = receive(request(body), tmp_path)
+
+    assert fields == {"exercise_key": "squat", "reps": "10"}
+    assert upload["filename"] == "clip.mp4"
+    assert upload["size"] == len(data)
+    assert upload["sha256"] == hashlib.sha256(data).hexdigest()
+    assert os.path.dirname(upload["path"]) == str(tmp_path)
+    with open(upload["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_file_of_exactly_the_limit_is_accepted(tmp_path):
+    data = os.urandom(10_000)
+    _, upload = receive(request(multipart(files=[("file", "clip.mp4", data)])), tmp_path)
+    assert upload["size"] == 10_000
+
+
+def test_declared_length_over_the_limit_is_refused_up_front(tmp_path):
+    body = multipart(files=[("file", "clip.mp4", b"x" * 100)])
+    req = request(body)
+    req.scope["headers"][1] = (b"content-length", str(10_000 + MAX_FIELD_BYTES + 1).encode())
+    with pytest.raises(UploadError) as e:
+        receive(req, tmp_path)
+    assert e.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("length", [True, False])
+def test_file_over_the_limit_is_cut_off_mid_stream(tmp_path, length):
+    body = multipart(files=[("file", "clip.mp4", os.urandom(10_001))])
+    with pytest.raises(UploadError) as e:
+        receive(request(body, length=length), tmp_path)
+    assert e.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_form_field(tmp_path):
+    body = multipart([("notes", b"x" * (MAX_FIELD_BYTES + 1))], [("file", "clip.mp4", b"data")])
+    with pytest.raises(UploadError) as e:
+        receive(request(body, length=False), tmp_path, max_bytes=10 * MAX_FIELD_BYTES)
+    assert e.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize(
+    "body, content_type, detail",
+    [
+        (b"{}", "application/json", "Expected multipart/form-data"),
+        (multipart([("exercise_key", b"squat")]), None, "Missing file field"),
+        (multipart(files=[("video", "clip.mp4", b"data")]), None, "Unexpected file field"),
+        (
+            multipart(files=[("file", "a.mp4", b"one"), ("file", "b.mp4", b"two")]),
+            None,
+            "Unexpected file field",
+        ),
+    ],
+)
+def test_bad_requests(tmp_path, body, content_type, detail):
+    req = request(body) if content_type is None else request(body, content_type)
+    with pytest.raises(UploadError, match=detail) as e:
+        receive(req, tmp_path)
+    assert e.value.status_code == 400
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+import numpy as np
+
+from frame_codec import HEADER_LEN, pack_message, unpack_message
+
+# A landmark track is the per-frame output of video analysis, stored next to
+# the video: the usual framed JSON header followed by int32 frame indices and
+# float16 (N, 33, 4) landmarks. Analysed frames without a pose are NaN rows.
+TRACK_VERSION = 1
+
+# bump whenever a change to the analysis alters its results, so stored
+# results and the tracks made by the old code are not reused
+PIPELINE_VERSION = 1
+
+
+def pipeline_version(exercises_file: str) -> str:
+    # results are reused only if the analysis code and the exercise
+    # definitions they were made with are unchanged
+    with open(exercises_file, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f"{PIPELINE_VERSION}-{digest}"
+
+
+def save_track(path: str, header: dict, frame_indices, landmarks):
+    frame_indices = np.asarray(frame_indices, dtype="<i4")
+    landmarks = np.asarray(landmarks, dtype="<f2").reshape(len(frame_indices), 33, 4)
+    header = dict(header, version=TRACK_VERSION, count=len(frame_indices))
+    payload = frame_indices.tobytes() + landmarks.tobytes()
+
+    # per process, in case two workers write the same track at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pack_message(header, payload))
+    os.replace(tmp_path, path)
+
+
+def load_track(path: str):
+    with open(path, "rb") as f:
+        header, payload = unpack_message(f.read())
+    count = header["count"]
+    split = count * 4
+    frame_indices = np.frombuffer(payload[:split], dtype="<i4")
+    landmarks = np.frombuffer(payload[split:], dtype="<f2").reshape(count, 33, 4)
+    return header, frame_indices, landmarks.astype(np.float32)
+
+
+def read_track_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        prefix = f.read(HEADER_LEN.size)
+        (size,) = HEADER_LEN.unpack(prefix)
+        header, _ = unpack_message(prefix + f.read(size))
+    return header
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import uuid
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class _Part:
+    def __init__(self):
+        self.name = None
+        self.filename = None
+        self.disposition = b""
+        self.header_field = b""
+        self.header_value = b""
+        self.data = bytearray()
+
+
+async def receive_upload(
+    request,
+    dest_dir: str,
+    max_bytes: int,
+    chunk_size: int,
+    file_field: str = "file",
+):
+    # Parse multipart/form-data straight off the request stream. The file part
+    # is hashed and written to dest_dir as it arrives, so memory per upload is
+    # bounded by chunk_size and oversized uploads are cut off mid-stream.
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError(400, "Expected multipart/form-data")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MAX_FIELD_BYTES:
+        raise UploadError(413, "Upload too large")
+
+    fields = {}
+    upload = {"path": None, "filename": None, "size": 0, "sha256": None}
+    state = {"part": None, "pending": bytearray(), "error": None}
+    digest = hashlib.sha256()
+
+    def on_part_begin():
+        state["part"] = _Part()
+
+    def on_header_field(data, start, end):
+        state["part"].header_field += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["part"].header_value += data[start:end]
+
+    def on_header_end():
+        part = state["part"]
+        if part.header_field.lower() == b"content-disposition":
+            part.disposition = part.header_value
+        part.header_field = b""
+        part.header_value = b""
+
+    def on_headers_finished():
+        part = state["part"]
+        _, options = parse_options_header(part.disposition)
+        part.name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in options:
+            if part.name != file_field or upload["path"] is not None:
+                state["error"] = UploadError(400, "Unexpected file field")
+                return
+            part.filename = options[b"filename"].decode("utf-8", "replace")
+            upload["filename"] = part.filename
+            upload["path"] = os.path.join(dest_dir, f".upload-{uuid.uuid4().hex}.part")
+
+    def on_part_data(data, start, end):
+        part = state["part"]
+        if part.filename is not None:
+            upload["size"] += end - start
+            if upload["size"] > max_bytes:
+                state["error"] = UploadError(413, "Upload too large")
+                return
+            state["pending"] += data[start:end]
+        else:
+            part.data += data[start:end]
+            if len(part.data) > MAX_FIELD_BYTES:
+                state["error"] = UploadError(413, "Form field too large")
+
+    def on_part_end():
+        part = state["part"]
+        if part.filename is None and part.name:
+            fields[part.name] = part.data.decode("utf-8", "replace")
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+        },
+    )
+
+    out = None
+
+    def flush():
+        data = bytes(state["pending"])
+        state["pending"].clear()
+        digest.update(data)
+        out.write(data)
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if state["error"] is not None:
+                raise state["error"]
+            if upload["path"] is not None and out is None:
+                out = open(upload["path"], "wb")
+            if len(state["pending"]) >= chunk_size:
+                await run_in_threadpool(flush)
+        parser.finalize()
+        if upload["path"] is None:
+            raise UploadError(400, f"Missing file field {file_field!r}")
+        if out is None:
+            out = open(upload["path"], "wb")
+        await run_in_threadpool(flush)
+    except Exception as e:
+        if out is not None:
+            out.close()
+        if upload["path"] is not None and os.path.exists(upload["path"]):
+            os.remove(upload["path"])
+        if isinstance(e, UploadError):
+            raise
+        raise UploadError(400, "Malformed multipart body") from e
+    out.close()
+    upload["sha256"] = digest.hexdigest()
+
+    return fields, upload